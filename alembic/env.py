@@ -4,9 +4,14 @@ from sqlalchemy import engine_from_config
 from sqlalchemy import pool
 from models.workflow import Base
 from alembic import context
+import database
 
 config = context.config
 
+# Containers migrate the database the service connects to (see the Dockerfile CMD)
+if database.DATABASE_URL:
+    config.set_main_option("sqlalchemy.url", database.DATABASE_URL.replace("%", "%%"))
+
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
@@ -0,0 +1,28 @@
+"""Workflow version
+
+Revision ID: 0b6e3d9a7c15
+Revises: f4a8c2d61b93
+Create Date: 2026-10-17 16:48:02.913570
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0b6e3d9a7c15'
+down_revision: Union[str, None] = 'f4a8c2d61b93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('workflows', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('workflows', 'version')
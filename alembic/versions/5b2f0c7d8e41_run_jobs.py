@@ -0,0 +1,46 @@
+"""Run jobs queue
+
+Revision ID: 5b2f0c7d8e41
+Revises: 39ec952972ab
+Create Date: 2026-10-17 09:12:03.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b2f0c7d8e41'
+down_revision: Union[str, None] = '39ec952972ab'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('run_jobs',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('workflow_id', sa.UUID(), nullable=False),
+    sa.Column('input_text', sa.String(), nullable=False),
+    sa.Column('agent_prompts', sa.JSON(), nullable=True),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('worker_id', sa.String(), nullable=True),
+    sa.Column('lease_expires_at', sa.DateTime(), nullable=True),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['workflow_id'], ['workflows.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # Workers claim the oldest queued job, so index the status/created_at pair
+    op.create_index('ix_run_jobs_status_created_at', 'run_jobs', ['status', 'created_at'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_run_jobs_status_created_at', table_name='run_jobs')
+    op.drop_table('run_jobs')
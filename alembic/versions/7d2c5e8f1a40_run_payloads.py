@@ -0,0 +1,159 @@
+"""Run payloads
+
+Revision ID: 7d2c5e8f1a40
+Revises: 0b6e3d9a7c15
+Create Date: 2026-10-17 17:31:12.470581
+
+"""
+import gzip
+import hashlib
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d2c5e8f1a40'
+down_revision: Union[str, None] = '0b6e3d9a7c15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 1000
+# Matches RUN_PAYLOAD_COMPRESS_MIN_BYTES; existing rows are moved with gzip, new ones use the configured codec
+COMPRESS_MIN_BYTES = 256
+
+run_steps = sa.table(
+    'run_steps',
+    sa.column('run_id', sa.UUID()),
+    sa.column('entity_id', sa.UUID()),
+    sa.column('input_text', sa.String()),
+    sa.column('output_text', sa.String()),
+    sa.column('input_hash', sa.String()),
+    sa.column('output_hash', sa.String()),
+)
+run_payloads = sa.table(
+    'run_payloads',
+    sa.column('hash', sa.String()),
+    sa.column('codec', sa.String()),
+    sa.column('size', sa.Integer()),
+    sa.column('data', sa.LargeBinary()),
+)
+
+
+def _payload(text: str) -> dict:
+    raw = text.encode('utf-8')
+    codec, data = ('none', raw) if len(raw) < COMPRESS_MIN_BYTES else ('gzip', gzip.compress(raw, mtime=0))
+    return {'hash': hashlib.sha256(raw).hexdigest(), 'codec': codec, 'size': len(raw), 'data': data}
+
+
+def _text(codec: str, data: bytes) -> str:
+    if codec == 'gzip':
+        data = gzip.decompress(data)
+    elif codec == 'zstd':
+        import zstandard
+        data = zstandard.ZstdDecompressor().decompress(data)
+    return bytes(data).decode('utf-8')
+
+
+def _step_batches(bind, *columns):
+    """run_steps in primary key order, BATCH_SIZE rows at a time"""
+    last = None
+    while True:
+        query = sa.select(run_steps.c.run_id, run_steps.c.entity_id, *columns)
+        if last is not None:
+            query = query.where(sa.tuple_(run_steps.c.run_id, run_steps.c.entity_id) > sa.tuple_(*last))
+        rows = bind.execute(query.order_by(run_steps.c.run_id, run_steps.c.entity_id).limit(BATCH_SIZE)).all()
+        if not rows:
+            return
+        yield rows
+        last = (rows[-1].run_id, rows[-1].entity_id)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('run_payloads',
+    sa.Column('hash', sa.String(length=64), nullable=False),
+    sa.Column('codec', sa.String(), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('hash')
+    )
+    op.add_column('run_steps', sa.Column('input_hash', sa.String(length=64), nullable=True))
+    op.add_column('run_steps', sa.Column('output_hash', sa.String(length=64), nullable=True))
+
+    bind = op.get_bind()
+    set_hashes = run_steps.update().where(
+        run_steps.c.run_id == sa.bindparam('b_run_id'),
+        run_steps.c.entity_id == sa.bindparam('b_entity_id'),
+    ).values(input_hash=sa.bindparam('b_input_hash'), output_hash=sa.bindparam('b_output_hash'))
+
+    for rows in _step_batches(bind, run_steps.c.input_text, run_steps.c.output_text):
+        payloads = {}
+        updates = []
+        for row in rows:
+            input_payload = _payload(row.input_text)
+            payloads[input_payload['hash']] = input_payload
+            output_hash = None
+            if row.output_text:
+                output_payload = _payload(row.output_text)
+                payloads[output_payload['hash']] = output_payload
+                output_hash = output_payload['hash']
+            updates.append({
+                'b_run_id': row.run_id,
+                'b_entity_id': row.entity_id,
+                'b_input_hash': input_payload['hash'],
+                'b_output_hash': output_hash,
+            })
+        bind.execute(
+            postgresql.insert(run_payloads).on_conflict_do_nothing(index_elements=['hash']),
+            list(payloads.values())
+        )
+        bind.execute(set_hashes, updates)
+
+    op.alter_column('run_steps', 'input_hash', nullable=False)
+    op.create_foreign_key('run_steps_input_hash_fkey', 'run_steps', 'run_payloads', ['input_hash'], ['hash'])
+    op.create_foreign_key('run_steps_output_hash_fkey', 'run_steps', 'run_payloads', ['output_hash'], ['hash'])
+    op.drop_column('run_steps', 'output_text')
+    op.drop_column('run_steps', 'input_text')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column('run_steps', sa.Column('input_text', sa.String(), nullable=True))
+    op.add_column('run_steps', sa.Column('output_text', sa.String(), nullable=True))
+
+    bind = op.get_bind()
+    set_texts = run_steps.update().where(
+        run_steps.c.run_id == sa.bindparam('b_run_id'),
+        run_steps.c.entity_id == sa.bindparam('b_entity_id'),
+    ).values(input_text=sa.bindparam('b_input_text'), output_text=sa.bindparam('b_output_text'))
+
+    for rows in _step_batches(bind, run_steps.c.input_hash, run_steps.c.output_hash):
+        hashes = {row.input_hash for row in rows} | {row.output_hash for row in rows if row.output_hash}
+        texts = {
+            payload.hash: _text(payload.codec, payload.data)
+            for payload in bind.execute(
+                sa.select(run_payloads.c.hash, run_payloads.c.codec, run_payloads.c.data)
+                .where(run_payloads.c.hash.in_(hashes))
+            )
+        }
+        bind.execute(set_texts, [
+            {
+                'b_run_id': row.run_id,
+                'b_entity_id': row.entity_id,
+                'b_input_text': texts[row.input_hash],
+                'b_output_text': texts.get(row.output_hash, ''),
+            }
+            for row in rows
+        ])
+
+    op.alter_column('run_steps', 'input_text', nullable=False)
+    op.alter_column('run_steps', 'output_text', nullable=False)
+    op.drop_constraint('run_steps_output_hash_fkey', 'run_steps', type_='foreignkey')
+    op.drop_constraint('run_steps_input_hash_fkey', 'run_steps', type_='foreignkey')
+    op.drop_column('run_steps', 'output_hash')
+    op.drop_column('run_steps', 'input_hash')
+    op.drop_table('run_payloads')
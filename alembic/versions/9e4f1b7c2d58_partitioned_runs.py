@@ -0,0 +1,150 @@
+"""Partitioned runs
+
+Revision ID: 9e4f1b7c2d58
+Revises: 7d2c5e8f1a40
+Create Date: 2026-10-17 18:12:53.904117
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e4f1b7c2d58'
+down_revision: Union[str, None] = '7d2c5e8f1a40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Matches RUN_PARTITIONS_AHEAD; functions/run_retention.py keeps creating partitions from here on
+PARTITIONS_AHEAD = 2
+
+WORKFLOW_RUNS_COLUMNS = """
+    id UUID NOT NULL,
+    workflow_id UUID NOT NULL REFERENCES workflows (id) ON DELETE CASCADE,
+    status VARCHAR NOT NULL,
+    total_steps INTEGER DEFAULT 0 NOT NULL,
+    completed_steps INTEGER DEFAULT 0 NOT NULL,
+    failed_steps INTEGER DEFAULT 0 NOT NULL,
+    cache_hits INTEGER DEFAULT 0 NOT NULL,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    started_at TIMESTAMP WITHOUT TIME ZONE,
+    finished_at TIMESTAMP WITHOUT TIME ZONE
+"""
+RUN_STEPS_COLUMNS = """
+    run_id UUID NOT NULL,
+    entity_id UUID NOT NULL REFERENCES workflow_entities (id) ON DELETE CASCADE,
+    input_hash VARCHAR(64) NOT NULL REFERENCES run_payloads (hash),
+    output_hash VARCHAR(64) REFERENCES run_payloads (hash),
+    status VARCHAR NOT NULL,
+    cache_hit BOOLEAN DEFAULT false NOT NULL,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    finished_at TIMESTAMP WITHOUT TIME ZONE
+"""
+RUN_COLUMNS = (
+    "id, workflow_id, status, total_steps, completed_steps, failed_steps, cache_hits, "
+    "created_at, started_at, finished_at"
+)
+STEP_COLUMNS = "run_id, entity_id, input_hash, output_hash, status, cache_hit, created_at, finished_at"
+
+
+def _add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def _rename_table(old: str, new: str, indexes: Sequence[str]) -> None:
+    """Rename a table with its primary key and indexes, which share the relation namespace"""
+    op.execute(f"ALTER TABLE {old} RENAME TO {new}")
+    op.execute(f"ALTER INDEX {old}_pkey RENAME TO {new}_pkey")
+    for index in indexes:
+        op.execute(f"ALTER INDEX {index} RENAME TO {index.replace(old, new, 1)}")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('run_archive_index',
+    sa.Column('run_id', sa.UUID(), nullable=False),
+    sa.Column('workflow_id', sa.UUID(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('archive_path', sa.String(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.Column('rehydrated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('run_id')
+    )
+    op.create_index(op.f('ix_run_archive_index_workflow_id'), 'run_archive_index', ['workflow_id'], unique=False)
+
+
+    _rename_table('workflow_runs', 'workflow_runs_legacy', ['ix_workflow_runs_workflow_id_created_at'])
+    _rename_table('run_steps', 'run_steps_legacy', [])
+
+    op.execute(f"""
+        CREATE TABLE workflow_runs ({WORKFLOW_RUNS_COLUMNS},
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.create_index('ix_workflow_runs_workflow_id_created_at', 'workflow_runs', ['workflow_id', 'created_at', 'id'], unique=False)
+    op.execute(f"""
+        CREATE TABLE run_steps ({RUN_STEPS_COLUMNS},
+            run_created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            PRIMARY KEY (run_id, entity_id, run_created_at),
+            FOREIGN KEY (run_id, run_created_at) REFERENCES workflow_runs (id, created_at) ON DELETE CASCADE
+        ) PARTITION BY RANGE (run_created_at)
+    """)
+    op.create_index('ix_run_steps_input_hash', 'run_steps', ['input_hash'], unique=False)
+    op.create_index('ix_run_steps_output_hash', 'run_steps', ['output_hash'], unique=False)
+
+    # Monthly partitions covering the existing history and the next months; anything
+    # outside them (e.g. re-hydrated archived runs) lands in the DEFAULT partitions
+    oldest = op.get_bind().execute(sa.text("SELECT MIN(created_at) FROM workflow_runs_legacy")).scalar()
+    current = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    month = (oldest or current).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    last = _add_months(current, PARTITIONS_AHEAD)
+    while month <= last:
+        bounds = f"FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+        suffix = f"y{month.year}m{month.month:02d}"
+        op.execute(f"CREATE TABLE workflow_runs_{suffix} PARTITION OF workflow_runs FOR VALUES {bounds}")
+        op.execute(f"CREATE TABLE run_steps_{suffix} PARTITION OF run_steps FOR VALUES {bounds}")
+        month = _add_months(month, 1)
+    op.execute("CREATE TABLE workflow_runs_default PARTITION OF workflow_runs DEFAULT")
+    op.execute("CREATE TABLE run_steps_default PARTITION OF run_steps DEFAULT")
+
+    op.execute(f"INSERT INTO workflow_runs ({RUN_COLUMNS}) SELECT {RUN_COLUMNS} FROM workflow_runs_legacy")
+    op.execute(f"""
+        INSERT INTO run_steps ({STEP_COLUMNS}, run_created_at)
+        SELECT {', '.join(f's.{column.strip()}' for column in STEP_COLUMNS.split(','))}, r.created_at
+        FROM run_steps_legacy s
+        JOIN workflow_runs_legacy r ON r.id = s.run_id
+    """)
+    op.drop_table('run_steps_legacy')
+    op.drop_table('workflow_runs_legacy')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(f"""
+        CREATE TABLE workflow_runs_plain ({WORKFLOW_RUNS_COLUMNS},
+            PRIMARY KEY (id)
+        )
+    """)
+    op.execute(f"""
+        CREATE TABLE run_steps_plain ({RUN_STEPS_COLUMNS},
+            PRIMARY KEY (run_id, entity_id),
+            FOREIGN KEY (run_id) REFERENCES workflow_runs_plain (id) ON DELETE CASCADE
+        )
+    """)
+    # Archived runs are gone from the database and stay in the archive files
+    op.execute(f"INSERT INTO workflow_runs_plain ({RUN_COLUMNS}) SELECT {RUN_COLUMNS} FROM workflow_runs")
+    op.execute(f"INSERT INTO run_steps_plain ({STEP_COLUMNS}) SELECT {STEP_COLUMNS} FROM run_steps")
+
+    # Dropping the partitioned parents drops their partitions
+    op.drop_table('run_steps')
+    op.drop_table('workflow_runs')
+    _rename_table('workflow_runs_plain', 'workflow_runs', [])
+    _rename_table('run_steps_plain', 'run_steps', [])
+    op.create_index('ix_workflow_runs_workflow_id_created_at', 'workflow_runs', ['workflow_id', 'created_at', 'id'], unique=False)
+
+    op.drop_index(op.f('ix_run_archive_index_workflow_id'), table_name='run_archive_index')
+    op.drop_table('run_archive_index')
@@ -0,0 +1,41 @@
+"""Response cache
+
+Revision ID: a3c91e5f2b60
+Revises: 5b2f0c7d8e41
+Create Date: 2026-10-17 11:40:27.530914
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c91e5f2b60'
+down_revision: Union[str, None] = '5b2f0c7d8e41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('response_cache',
+    sa.Column('key', sa.String(length=64), nullable=False),
+    sa.Column('model_id', sa.String(), nullable=False),
+    sa.Column('response_text', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index(op.f('ix_response_cache_expires_at'), 'response_cache', ['expires_at'], unique=False)
+    op.add_column('runs', sa.Column('cache_hit', sa.Boolean(), server_default=sa.false(), nullable=False))
+    op.add_column('run_jobs', sa.Column('bypass_cache', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('run_jobs', 'bypass_cache')
+    op.drop_column('runs', 'cache_hit')
+    op.drop_index(op.f('ix_response_cache_expires_at'), table_name='response_cache')
+    op.drop_table('response_cache')
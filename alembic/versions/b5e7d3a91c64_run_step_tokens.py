@@ -0,0 +1,33 @@
+"""Run step tokens
+
+Revision ID: b5e7d3a91c64
+Revises: 9e4f1b7c2d58
+Create Date: 2026-10-17 19:04:38.215907
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e7d3a91c64'
+down_revision: Union[str, None] = '9e4f1b7c2d58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Columns added to the partitioned parent reach every partition
+    op.add_column('run_steps', sa.Column('input_tokens', sa.Integer(), nullable=True))
+    op.add_column('run_steps', sa.Column('context_tokens', sa.Integer(), nullable=True))
+    op.add_column('run_steps', sa.Column('output_tokens', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('run_steps', 'output_tokens')
+    op.drop_column('run_steps', 'context_tokens')
+    op.drop_column('run_steps', 'input_tokens')
@@ -0,0 +1,35 @@
+"""SSE event spill
+
+Revision ID: c7d4a1b9e382
+Revises: a3c91e5f2b60
+Create Date: 2026-10-17 14:05:51.207733
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7d4a1b9e382'
+down_revision: Union[str, None] = 'a3c91e5f2b60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('sse_event_spill',
+    sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+    sa.Column('payload', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_sse_event_spill_created_at'), 'sse_event_spill', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_sse_event_spill_created_at'), table_name='sse_event_spill')
+    op.drop_table('sse_event_spill')
@@ -0,0 +1,52 @@
+"""Hot path indexes
+
+Revision ID: e19b6f3c4d27
+Revises: c7d4a1b9e382
+Create Date: 2026-10-17 15:22:10.664105
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e19b6f3c4d27'
+down_revision: Union[str, None] = 'c7d4a1b9e382'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (name, table, columns, covering columns) - kept in sync with models/workflow.py
+INDEXES = [
+    ('ix_runs_workflow_id_created_at', 'runs', ['workflow_id', 'created_at', 'id'], None),
+    ('ix_runs_id_workflow_entity_id', 'runs', ['id', 'workflow_entity_id'], ['status']),
+    ('ix_workflow_entities_workflow_id_order', 'workflow_entities', ['workflow_id', 'order'], None),
+    ('ix_workflow_entities_workflow_id_external_id', 'workflow_entities', ['workflow_id', 'external_id'], None),
+    ('ix_workflow_connections_workflow_id', 'workflow_connections', ['workflow_id'], ['source_id', 'target_id']),
+    ('ix_workflow_connections_source_id', 'workflow_connections', ['source_id'], None),
+    ('ix_workflow_connections_target_id', 'workflow_connections', ['target_id'], None),
+    ('ix_workflows_project_id_created_at', 'workflows', ['project_id', 'created_at', 'id'], None),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        for name, table, columns, include in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=False,
+                if_not_exists=True,
+                postgresql_concurrently=True,
+                postgresql_include=include or [],
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
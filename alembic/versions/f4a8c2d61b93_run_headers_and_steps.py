@@ -0,0 +1,124 @@
+"""Run headers and steps
+
+Revision ID: f4a8c2d61b93
+Revises: e19b6f3c4d27
+Create Date: 2026-10-17 16:05:41.208317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4a8c2d61b93'
+down_revision: Union[str, None] = 'e19b6f3c4d27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('workflow_runs',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('workflow_id', sa.UUID(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('total_steps', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('completed_steps', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('failed_steps', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('cache_hits', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['workflow_id'], ['workflows.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_workflow_runs_workflow_id_created_at', 'workflow_runs', ['workflow_id', 'created_at', 'id'], unique=False)
+    op.create_table('run_steps',
+    sa.Column('run_id', sa.UUID(), nullable=False),
+    sa.Column('entity_id', sa.UUID(), nullable=False),
+    sa.Column('input_text', sa.String(), nullable=False),
+    sa.Column('output_text', sa.String(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('cache_hit', sa.Boolean(), server_default=sa.false(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['entity_id'], ['workflow_entities.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['run_id'], ['workflow_runs.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('run_id', 'entity_id')
+    )
+
+    # One header per run, its totals aggregated from the former per-entity rows; created_at is
+    # NOT NULL now, so rows written before it had a default get the migration time
+    op.execute("""
+        INSERT INTO workflow_runs (
+            id, workflow_id, status, total_steps, completed_steps, failed_steps, cache_hits,
+            created_at, started_at, finished_at
+        )
+        SELECT
+            id,
+            workflow_id,
+            CASE
+                WHEN SUM(CASE WHEN status = 'failed' THEN 1 ELSE 0 END) > 0 THEN 'failed'
+                WHEN SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END) = COUNT(*) THEN 'completed'
+                ELSE 'processing'
+            END,
+            COUNT(*),
+            SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END),
+            SUM(CASE WHEN status = 'failed' THEN 1 ELSE 0 END),
+            SUM(CASE WHEN cache_hit THEN 1 ELSE 0 END),
+            COALESCE(MIN(created_at), now()),
+            MIN(created_at),
+            CASE WHEN SUM(CASE WHEN status IN ('completed', 'failed') THEN 1 ELSE 0 END) = COUNT(*)
+                THEN MAX(created_at) END
+        FROM runs
+        GROUP BY id, workflow_id
+    """)
+    op.execute("""
+        INSERT INTO run_steps (run_id, entity_id, input_text, output_text, status, cache_hit, created_at)
+        SELECT id, workflow_entity_id, input_text, output_text, status, cache_hit, COALESCE(created_at, now())
+        FROM runs
+    """)
+    # Queued jobs that never started get their header too
+    op.execute("""
+        INSERT INTO workflow_runs (id, workflow_id, status, created_at, started_at, finished_at)
+        SELECT id, workflow_id, status, COALESCE(created_at, started_at, now()), started_at, finished_at
+        FROM run_jobs
+        WHERE id NOT IN (SELECT id FROM workflow_runs)
+    """)
+
+    op.drop_table('runs')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_table('runs',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('workflow_id', sa.UUID(), nullable=False),
+    sa.Column('input_text', sa.String(), nullable=False),
+    sa.Column('output_text', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('workflow_entity_id', sa.UUID(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('cache_hit', sa.Boolean(), server_default=sa.false(), nullable=False),
+    sa.ForeignKeyConstraint(['workflow_entity_id'], ['workflow_entities.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['workflow_id'], ['workflows.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_runs_workflow_id_created_at', 'runs', ['workflow_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_runs_id_workflow_entity_id', 'runs', ['id', 'workflow_entity_id'], unique=False, postgresql_include=['status'])
+
+    # The former table keys rows by run id alone, so only the latest step of each run fits
+    op.execute("""
+        INSERT INTO runs (id, workflow_id, input_text, output_text, created_at, workflow_entity_id, status, cache_hit)
+        SELECT DISTINCT ON (s.run_id)
+            s.run_id, r.workflow_id, s.input_text, s.output_text, s.created_at, s.entity_id, s.status, s.cache_hit
+        FROM run_steps s
+        JOIN workflow_runs r ON r.id = s.run_id
+        ORDER BY s.run_id, s.created_at DESC
+    """)
+
+    op.drop_table('run_steps')
+    op.drop_index('ix_workflow_runs_workflow_id_created_at', table_name='workflow_runs')
+    op.drop_table('workflow_runs')
@@ -0,0 +1,82 @@
+"""
+Write latency of the agent session backends under N concurrent runs.
+
+    python -m benchmarks.agent_storage_bench --runs 1 8 32 --backends sqlite postgres memory
+
+Each simulated run owns one session per node (the run-scoped ids used by the
+executor) and upserts it after every node, like agno does after agent.run.
+"""
+import argparse
+import statistics
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from agno.storage.agent.sqlite import SqliteAgentStorage
+from agno.storage.session.agent import AgentSession
+
+from functions.agent_storage import create_agent_storage, run_session_id
+
+
+def build_storage(backend: str):
+    if backend == "sqlite":
+        # The former layout: every worker writing into one shared file
+        return SqliteAgentStorage(table_name="bench_agent", db_file=f"{tempfile.mkdtemp()}/agent_storage.db")
+    return create_agent_storage(backend)
+
+
+def simulate_run(storage, nodes: int, history_chars: int):
+    run_id = uuid.uuid4()
+    latencies = []
+    for node in range(nodes):
+        session = AgentSession(
+            session_id=run_session_id(run_id, node),
+            agent_id=f"node-{node}",
+            memory={"runs": [{"response": {"content": "x" * history_chars}}]},
+        )
+        start = time.perf_counter()
+        storage.upsert(session)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def bench(backend: str, concurrency: int, nodes: int, history_chars: int):
+    storage = build_storage(backend)
+    storage.create()
+    latencies = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for result in pool.map(lambda _: simulate_run(storage, nodes, history_chars), range(concurrency)):
+            latencies.extend(result)
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"{backend:<9} runs={concurrency:<4} writes={len(latencies):<6} "
+        f"p50={statistics.median(latencies) * 1000:8.2f}ms "
+        f"p95={percentile(latencies, 0.95) * 1000:8.2f}ms "
+        f"p99={percentile(latencies, 0.99) * 1000:8.2f}ms "
+        f"throughput={len(latencies) / elapsed:8.1f}/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["sqlite", "postgres", "memory"])
+    parser.add_argument("--runs", nargs="+", type=int, default=[1, 8, 32, 64])
+    parser.add_argument("--nodes", type=int, default=10)
+    parser.add_argument("--history-chars", type=int, default=4000)
+    args = parser.parse_args()
+
+    for backend in args.backends:
+        for concurrency in args.runs:
+            bench(backend, concurrency, args.nodes, args.history_chars)
+
+
+if __name__ == "__main__":
+    main()
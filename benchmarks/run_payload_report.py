@@ -0,0 +1,106 @@
+"""
+Storage savings of content-addressed, compressed run payloads.
+
+    python -m benchmarks.run_payload_report --runs 500 --nodes 6
+    python -m benchmarks.run_payload_report --database
+
+The default mode builds a sample dataset of chained runs with markdown-style
+output, where each node receives its parent's output, and compares the former
+layout (every step storing its input and output text) against unique payloads
+under each available codec. --database reports the same figures for the
+run_steps/run_payloads rows of DATABASE_URL.
+"""
+import argparse
+import random
+
+from sqlalchemy import func, select
+
+from functions.run_payloads import compress_payload, payload_hash, zstandard
+
+WORDS = (
+    "the hero village ancient forest shadow council storm river oath kingdom "
+    "betrayal memory lantern north tower whisper blade harbor exile ember "
+    "prophecy silver mountain tide ruin archive signal promise"
+).split()
+
+
+def markdown_output(rng: random.Random, paragraphs: int) -> str:
+    sections = []
+    for index in range(paragraphs):
+        sentences = [" ".join(rng.choices(WORDS, k=rng.randint(8, 20))).capitalize() + "." for _ in range(4)]
+        bullets = [f"- **{rng.choice(WORDS).title()}**: {' '.join(rng.choices(WORDS, k=6))}" for _ in range(3)]
+        sections.append(f"## Section {index + 1}\n\n" + " ".join(sentences) + "\n\n" + "\n".join(bullets))
+    return "\n\n".join(sections)
+
+
+def sample_steps(runs: int, nodes: int, paragraphs: int, seed: int):
+    """(input, output) of every step of `runs` linear runs"""
+    rng = random.Random(seed)
+    steps = []
+    for run in range(runs):
+        text = f"Write the next chapter of story {run % 50}."
+        for _ in range(nodes):
+            output = markdown_output(rng, paragraphs)
+            steps.append((text, output))
+            text = output
+    return steps
+
+
+def sample_report(args):
+    steps = sample_steps(args.runs, args.nodes, args.paragraphs, args.seed)
+    legacy = sum(len(text.encode("utf-8")) for step in steps for text in step)
+    unique = {payload_hash(text): text for step in steps for text in step}
+
+    codecs = ["none", "gzip"] + (["zstd"] if zstandard else [])
+    print(f"sample: {args.runs} runs x {args.nodes} nodes, {len(steps)} steps, {len(unique)} unique payloads")
+    print(f"{'layout':<28} {'bytes':>14} {'vs legacy':>10}")
+    print(f"{'legacy (text per step)':<28} {legacy:>14,} {'100.0%':>10}")
+    for codec in codecs:
+        stored = sum(len(compress_payload(text, codec)[1]) for text in unique.values())
+        print(f"{'content-addressed ' + codec:<28} {stored:>14,} {stored / legacy:>9.1%}")
+
+
+def database_report():
+    import database
+    from models.workflow import RunPayload, RunStep
+
+    with database.SessionLocal() as db:
+        referenced = 0
+        for hash_column in (RunStep.input_hash, RunStep.output_hash):
+            referenced += db.execute(
+                select(func.coalesce(func.sum(RunPayload.size), 0))
+                .select_from(RunStep)
+                .join(RunPayload, RunPayload.hash == hash_column)
+            ).scalar()
+        payloads, raw, stored = db.execute(
+            select(
+                func.count(),
+                func.coalesce(func.sum(RunPayload.size), 0),
+                func.coalesce(func.sum(func.length(RunPayload.data)), 0),
+            )
+        ).one()
+        codecs = db.execute(select(RunPayload.codec, func.count()).group_by(RunPayload.codec)).all()
+
+    print(f"{payloads} payloads ({', '.join(f'{codec}: {count}' for codec, count in codecs)})")
+    print(f"text referenced by run steps: {referenced:>14,} bytes")
+    print(f"unique payload text:          {raw:>14,} bytes")
+    print(f"stored payload bytes:         {stored:>14,} bytes ({stored / referenced if referenced else 0:.1%} of referenced)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", action="store_true", help="report on the payloads stored in DATABASE_URL")
+    parser.add_argument("--runs", type=int, default=500)
+    parser.add_argument("--nodes", type=int, default=6)
+    parser.add_argument("--paragraphs", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    if args.database:
+        database_report()
+    else:
+        sample_report(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Cold start of the service: module import time and time to the first served request.
+
+    python -m benchmarks.startup_bench --repeat 5
+    python -m benchmarks.startup_bench --modules database functions.wf_agents main --path /project/
+
+Every measurement runs in a fresh interpreter so nothing is cached between
+repeats. "ready" is the time from spawning uvicorn until /health answers,
+"first"/"second" are the latencies of the first two requests to --path.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+IMPORT_SNIPPET = (
+    "import sys, time\n"
+    "start = time.perf_counter()\n"
+    "import {module}\n"
+    "sys.stdout.write(str(time.perf_counter() - start))\n"
+)
+
+
+def import_seconds(module: str) -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET.format(module=module)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def serve_once(path: str, timeout: float):
+    """(ready, first request, second request) seconds of one uvicorn process"""
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        env={**os.environ, "SERVICE_PORT": str(port)},
+    )
+    try:
+        with httpx.Client(base_url=base_url, timeout=timeout) as client:
+            while True:
+                if server.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with {server.returncode}")
+                if time.perf_counter() - start > timeout:
+                    raise TimeoutError(f"service not ready after {timeout}s")
+                try:
+                    if client.get("/health").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.01)
+            ready = time.perf_counter() - start
+
+            latencies = []
+            for _ in range(2):
+                request_start = time.perf_counter()
+                client.get(path)
+                latencies.append(time.perf_counter() - request_start)
+        return ready, latencies[0], latencies[1]
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def summary(values) -> str:
+    return f"median {statistics.median(values) * 1000:8.1f} ms   max {max(values) * 1000:8.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="+", default=["database", "functions.agent_team", "functions.wf_agents", "main"])
+    parser.add_argument("--path", default="/health", help="endpoint timed for the first requests")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--skip-serve", action="store_true", help="only measure imports")
+    args = parser.parse_args()
+
+    for module in args.modules:
+        print(f"import {module:<24} {summary([import_seconds(module) for _ in range(args.repeat)])}")
+
+    if args.skip_serve:
+        return
+    runs = [serve_once(args.path, args.timeout) for _ in range(args.repeat)]
+    print(f"{'ready':<31} {summary([run[0] for run in runs])}")
+    print(f"{'first  ' + args.path:<31} {summary([run[1] for run in runs])}")
+    print(f"{'second ' + args.path:<31} {summary([run[2] for run in runs])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,60 +1,40 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
+import logging
 import os
 from dotenv import load_dotenv
-import socket
+
+from functions.db_pool import pool_options, instrument_pool
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 Base = declarative_base()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
-print(f"Original DATABASE_URL: {DATABASE_URL}")
 
 in_docker = os.getenv("CONTAINER_ENV") == "1" or os.path.exists("/.dockerenv")
-print(f"Detected Docker environment: {in_docker}")
 
 # Use SQLite for testing if no DATABASE_URL or TESTING=1
 if os.getenv("TESTING") == "1" or not DATABASE_URL:
     test_db_url = os.getenv("TEST_DATABASE_URL", "sqlite:///./test.db")
     engine = create_engine(test_db_url, connect_args={"check_same_thread": False})
-    print(f"Using test database: {test_db_url}")
 else:
     if "localhost" in DATABASE_URL and in_docker:
         db_host = os.getenv("DB_HOST", "wf_db")
         DATABASE_URL = DATABASE_URL.replace("localhost", db_host)
         if ":5436" in DATABASE_URL:
             DATABASE_URL = DATABASE_URL.replace(":5436", ":5432")
-            
-        print(f"Modified for container: {DATABASE_URL}")
-    
-    try:
-        if DATABASE_URL and "postgresql" in DATABASE_URL:
-            parts = DATABASE_URL.replace("postgresql://", "").split("@")
-            if len(parts) > 1:
-                auth = parts[0]
-                connection = parts[1]
-                print(f"Auth: {auth}, Connection: {connection}")
-                
-                if ":" in connection:
-                    host = connection.split(":")[0].split("/")[0]
-                    port_str = connection.split(":")[1].split("/")[0]
-                    port = int(port_str)
-                    print(f"Testing connection to {host}:{port}")
-                    try:
-                        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                        s.settimeout(2)
-                        s.connect((host, port))
-                        s.close()
-                        print(f"Socket connection successful to {host}:{port}")
-                    except Exception as e:
-                        print(f"Socket connection failed: {str(e)}")
-    except Exception as e:
-        print(f"Error parsing URL for debug: {str(e)}")
-    
-    print(f"Connecting with: {DATABASE_URL}")
-    engine = create_engine(DATABASE_URL)
+
+    # Engines connect lazily; the first checkout surfaces connection problems
+    engine = create_engine(DATABASE_URL, **pool_options(DATABASE_URL))
+
+logger.info(f"Database: {engine.url.render_as_string(hide_password=True)}")
+
+instrument_pool(engine.pool, "sync")
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -63,4 +43,37 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def _async_database_url(url: str) -> str:
+    """Map the sync driver URL onto its asyncio driver (asyncpg / aiosqlite)"""
+    if url.startswith("postgresql://") or url.startswith("postgresql+psycopg2://"):
+        return "postgresql+asyncpg://" + url.split("://", 1)[1]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url.split("://", 1)[1]
+    return url
+
+ASYNC_DATABASE_URL = _async_database_url(engine.url.render_as_string(hide_password=False))
+
+# The async engine is created on first use so the sync path never needs the async drivers
+_async_engine = None
+_async_session_factory = None
+
+def get_async_engine():
+    global _async_engine, _async_session_factory
+    if _async_engine is None:
+        _async_engine = create_async_engine(ASYNC_DATABASE_URL, **pool_options(ASYNC_DATABASE_URL, asyncio=True))
+        instrument_pool(_async_engine.pool, "async")
+        # expire_on_commit=False: lazy refreshes are not possible on an AsyncSession
+        _async_session_factory = async_sessionmaker(
+            _async_engine, autoflush=False, expire_on_commit=False
+        )
+    return _async_engine
+
+def async_session() -> AsyncSession:
+    get_async_engine()
+    return _async_session_factory()
+
+async def get_async_db():
+    async with async_session() as db:
+        yield db
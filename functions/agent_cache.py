@@ -0,0 +1,153 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+from agno.agent import Agent
+from agno.memory.agent import AgentMemory
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+AGENT_CACHE_MAX_SIZE = int(os.getenv("AGENT_CACHE_MAX_SIZE", "256"))
+AGENT_CACHE_TTL_SECONDS = float(os.getenv("AGENT_CACHE_TTL_SECONDS", "900"))
+
+AGENT_CACHE_HITS = Counter("workflow_agent_cache_hits_total", "Prepared agents reused from the cache")
+AGENT_CACHE_MISSES = Counter("workflow_agent_cache_misses_total", "Agents constructed because no idle instance was cached")
+AGENT_CACHE_EVICTIONS = Counter(
+    "workflow_agent_cache_evictions_total", "Cached agents dropped", ["reason"]
+)
+AGENT_CACHE_SIZE = Gauge("workflow_agent_cache_size", "Idle agents currently held by the cache")
+
+AgentCacheKey = Tuple[uuid.UUID, Optional[datetime], str, str]
+
+
+def agent_cache_key(
+    entity_id: uuid.UUID,
+    updated_at: Optional[datetime],
+    agent_params: dict,
+    model_id: str
+) -> AgentCacheKey:
+    """(entity id, updated_at, prompt hash, model id) - any edit of the entity yields a new key"""
+    prompt = json.dumps(
+        [agent_params.get("name"), agent_params.get("role"), agent_params.get("instructions")],
+        sort_keys=True,
+        default=str,
+    )
+    return (entity_id, updated_at, hashlib.sha256(prompt.encode("utf-8")).hexdigest(), model_id)
+
+
+def _reset_agent_state(agent: Agent):
+    """Drop per-run state so a reused agent never carries history into another run"""
+    agent.session_id = None
+    agent.session_name = None
+    agent.session_state = None
+    agent.agent_session = None
+    agent.session_metrics = None
+    agent.memory = AgentMemory()
+    # Media generated during the previous run
+    agent.images = None
+    agent.videos = None
+    agent.audio = None
+    agent.run_input = None
+    agent.run_messages = None
+    agent.run_response = None
+
+
+class AgentCache:
+    """
+    Bounded LRU/TTL pool of prepared agents.
+    agno agents keep per-run state, so an instance is leased to one caller at a
+    time and returned to the idle pool afterwards instead of being shared.
+    """
+
+    def __init__(self, max_size: int = AGENT_CACHE_MAX_SIZE, ttl_seconds: float = AGENT_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._idle: "OrderedDict[AgentCacheKey, List[Tuple[Agent, float]]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, key: AgentCacheKey, factory: Callable[[], Agent]) -> Agent:
+        now = time.monotonic()
+        with self._lock:
+            entries = self._idle.get(key)
+            while entries:
+                agent, created_at = entries.pop()
+                self._size -= 1
+                if now - created_at > self.ttl_seconds:
+                    AGENT_CACHE_EVICTIONS.labels(reason="ttl").inc()
+                    continue
+                if not entries:
+                    del self._idle[key]
+                else:
+                    self._idle.move_to_end(key)
+                AGENT_CACHE_SIZE.set(self._size)
+                AGENT_CACHE_HITS.inc()
+                agent._cache_created_at = created_at
+                return agent
+            if entries is not None:
+                del self._idle[key]
+            AGENT_CACHE_SIZE.set(self._size)
+
+        AGENT_CACHE_MISSES.inc()
+        agent = factory()
+        agent._cache_created_at = now
+        return agent
+
+    def release(self, key: AgentCacheKey, agent: Agent):
+        created_at = getattr(agent, "_cache_created_at", time.monotonic())
+        if time.monotonic() - created_at > self.ttl_seconds:
+            AGENT_CACHE_EVICTIONS.labels(reason="ttl").inc()
+            return
+
+        _reset_agent_state(agent)
+        with self._lock:
+            self._idle.setdefault(key, []).append((agent, created_at))
+            self._idle.move_to_end(key)
+            self._size += 1
+            while self._size > self.max_size:
+                oldest_key, entries = next(iter(self._idle.items()))
+                entries.pop(0)
+                self._size -= 1
+                if not entries:
+                    del self._idle[oldest_key]
+                AGENT_CACHE_EVICTIONS.labels(reason="lru").inc()
+            AGENT_CACHE_SIZE.set(self._size)
+
+    @contextmanager
+    def lease(self, key: AgentCacheKey, factory: Callable[[], Agent]):
+        agent = self.acquire(key, factory)
+        try:
+            yield agent
+        except Exception:
+            # An agent that failed mid-run may hold half-written state; let it go
+            AGENT_CACHE_EVICTIONS.labels(reason="error").inc()
+            raise
+        else:
+            self.release(key, agent)
+
+    def invalidate_entity(self, entity_id: uuid.UUID):
+        """Drop every cached agent built for an entity, e.g. after it was edited or deleted"""
+        with self._lock:
+            for key in [key for key in self._idle if key[0] == entity_id]:
+                removed = len(self._idle.pop(key))
+                self._size -= removed
+                AGENT_CACHE_EVICTIONS.labels(reason="invalidated").inc(removed)
+            AGENT_CACHE_SIZE.set(self._size)
+
+    def clear(self):
+        with self._lock:
+            self._idle.clear()
+            self._size = 0
+            AGENT_CACHE_SIZE.set(0)
+
+
+agent_cache = AgentCache()
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+from agno.storage.base import Storage
+from agno.storage.agent.postgres import PostgresAgentStorage
+from agno.storage.agent.sqlite import SqliteAgentStorage
+from sqlalchemy import text
+
+import database
+
+logger = logging.getLogger(__name__)
+
+# "postgres" shares database.engine's pool, "memory" keeps a bounded in-process store,
+# "sqlite" is the former single-file storage
+AGENT_STORAGE_BACKEND = os.getenv("AGENT_STORAGE_BACKEND", "postgres")
+AGENT_STORAGE_TABLE = os.getenv("AGENT_STORAGE_TABLE", "narrative_agent")
+AGENT_STORAGE_SCHEMA = os.getenv("AGENT_STORAGE_SCHEMA", "public")
+AGENT_STORAGE_MAX_SESSIONS = int(os.getenv("AGENT_STORAGE_MAX_SESSIONS", "10000"))
+AGENT_HISTORY_RETENTION_HOURS = float(os.getenv("AGENT_HISTORY_RETENTION_HOURS", "24"))
+AGENT_HISTORY_COMPACTION_INTERVAL = float(os.getenv("AGENT_HISTORY_COMPACTION_INTERVAL", "3600"))
+
+
+def run_session_id(run_id, entity_id) -> str:
+    """Agent sessions are scoped to one entity of one run so history never crosses runs"""
+    return f"{run_id}:{entity_id}"
+
+
+class BoundedMemoryAgentStorage(Storage):
+    """In-process agent session store with LRU eviction past max_sessions"""
+
+    def __init__(self, max_sessions: int = AGENT_STORAGE_MAX_SESSIONS, mode: str = "agent"):
+        super().__init__(mode)
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, object]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self) -> None:
+        pass
+
+    def read(self, session_id: str, user_id: Optional[str] = None):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or (user_id is not None and session.user_id != user_id):
+                return None
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def get_all_session_ids(self, user_id: Optional[str] = None, entity_id: Optional[str] = None) -> List[str]:
+        return [session.session_id for session in self.get_all_sessions(user_id, entity_id)]
+
+    def get_all_sessions(self, user_id: Optional[str] = None, entity_id: Optional[str] = None) -> list:
+        with self._lock:
+            sessions = list(self._sessions.values())
+        if user_id is not None:
+            sessions = [session for session in sessions if session.user_id == user_id]
+        if entity_id is not None:
+            sessions = [session for session in sessions if getattr(session, "agent_id", None) == entity_id]
+        return sessions
+
+    def upsert(self, session):
+        session.updated_at = int(time.time())
+        if session.created_at is None:
+            session.created_at = session.updated_at
+        with self._lock:
+            self._sessions[session.session_id] = session
+            self._sessions.move_to_end(session.session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session
+
+    def delete_session(self, session_id: Optional[str] = None):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def drop(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+
+    def upgrade_schema(self) -> None:
+        pass
+
+    def prune(self, older_than: int) -> int:
+        with self._lock:
+            stale = [key for key, session in self._sessions.items() if (session.updated_at or 0) < older_than]
+            for key in stale:
+                del self._sessions[key]
+        return len(stale)
+
+
+def create_agent_storage(backend: str = AGENT_STORAGE_BACKEND) -> Storage:
+    if backend == "memory":
+        return BoundedMemoryAgentStorage()
+    if backend == "sqlite":
+        return SqliteAgentStorage(table_name=AGENT_STORAGE_TABLE, db_file="agent_storage.db")
+    if backend != "postgres":
+        raise ValueError(f"Unknown agent storage backend: {backend}")
+
+    if database.engine.dialect.name != "postgresql":
+        # Test setups run on SQLite; keep the sessions next to the service tables
+        return SqliteAgentStorage(table_name=AGENT_STORAGE_TABLE, db_engine=database.engine)
+    return PostgresAgentStorage(
+        table_name=AGENT_STORAGE_TABLE,
+        schema=AGENT_STORAGE_SCHEMA,
+        db_engine=database.engine,
+    )
+
+
+_agent_storage: Optional[Storage] = None
+_agent_storage_lock = threading.Lock()
+
+def get_agent_storage() -> Storage:
+    global _agent_storage
+    with _agent_storage_lock:
+        if _agent_storage is None:
+            _agent_storage = create_agent_storage()
+            logger.info(f"Agent storage backend: {type(_agent_storage).__name__}")
+        return _agent_storage
+
+
+def prune_agent_sessions(storage: Storage, max_age_hours: float = AGENT_HISTORY_RETENTION_HOURS) -> int:
+    """Delete agent sessions untouched for max_age_hours; SQLite files are vacuumed afterwards"""
+    cutoff = int(time.time() - max_age_hours * 3600)
+    if isinstance(storage, BoundedMemoryAgentStorage):
+        return storage.prune(cutoff)
+
+    table = getattr(storage, "table", None)
+    if table is None:
+        return 0
+    with storage.db_engine.begin() as connection:
+        removed = connection.execute(table.delete().where(table.c.updated_at < cutoff)).rowcount
+    if removed and storage.db_engine.dialect.name == "sqlite":
+        with storage.db_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(text("VACUUM"))
+    return removed
+
+
+async def agent_storage_retention_loop():
+    """Periodic retention/compaction of agent history, started from the app lifespan"""
+    while True:
+        await asyncio.sleep(AGENT_HISTORY_COMPACTION_INTERVAL)
+        try:
+            removed = await asyncio.to_thread(prune_agent_sessions, get_agent_storage())
+            if removed:
+                logger.info(f"Pruned {removed} agent sessions older than {AGENT_HISTORY_RETENTION_HOURS}h")
+        except Exception as e:
+            logger.error(f"Agent history retention failed: {str(e)}")
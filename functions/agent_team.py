@@ -1,10 +1,12 @@
 from agno.agent import Agent
-from agno.models.openai import OpenAIChat
-from agno.models.groq import Groq
 import asyncio
 import os 
+from functools import lru_cache
 from dotenv import load_dotenv
-from agno.storage.agent.sqlite import SqliteAgentStorage
+from functions.agent_storage import get_agent_storage
+from functions.http_clients import get_http_client, groq_clients, openai_clients
+from functions.model_limits import limit_model
+from functions.model_router import route_model
 load_dotenv()
 from templates.st_instructions import (
     leadInstructions,
@@ -21,35 +23,80 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 NVIDIA_API_KEY = os.getenv("NVIDIA_API_KEY")
 
-textModel = OpenAIChat(id="gpt-3.5-turbo", api_key=OPENAI_API_KEY)
-groqModel = Groq(id="qwen-2.5-32b", api_key=GROQ_API_KEY)
-groqMultiModel = Groq(id="llama-3.2-90b-vision-preview", api_key=GROQ_API_KEY)
-nvidiaModel = OpenAIChat(id="nvidia/llama-3.3-nemotron-super-49b-v1", api_key=NVIDIA_API_KEY, base_url="https://integrate.api.nvidia.com/v1")
+TEXT_MODEL_ID = "gpt-3.5-turbo"
+GROQ_MODEL_ID = "qwen-2.5-32b"
+GROQ_MULTI_MODEL_ID = "llama-3.2-90b-vision-preview"
+NVIDIA_MODEL_ID = "nvidia/llama-3.3-nemotron-super-49b-v1"
+
+# Model clients and their SDKs are only loaded when the first agent needs them,
+# so importing this module stays cheap for workers that never run agents.
+# Every client calls its provider through the shared per-model limiter; node agents
+# answer from Groq and fall back to OpenAI and NVIDIA when it fails or stalls.
+# All models of a provider share one pooled, keep-alive HTTP client
+
+def _openai_chat(model_id: str, provider: str, api_key: str, base_url: str = None):
+    from agno.models.openai import OpenAIChat
+    model = OpenAIChat(id=model_id, api_key=api_key, base_url=base_url, http_client=get_http_client(provider))
+    model.client, model.async_client = openai_clients(provider, api_key, base_url)
+    return limit_model(model, provider)
+
+def _groq(model_id: str):
+    from agno.models.groq import Groq
+    model = Groq(id=model_id, api_key=GROQ_API_KEY, http_client=get_http_client("groq"))
+    model.client, model.async_client = groq_clients(GROQ_API_KEY)
+    return limit_model(model, "groq")
+
+@lru_cache(maxsize=None)
+def get_text_model():
+    return _openai_chat(TEXT_MODEL_ID, "openai", OPENAI_API_KEY)
+
+@lru_cache(maxsize=None)
+def get_groq_model():
+    return route_model(
+        _groq(GROQ_MODEL_ID),
+        f"groq:{GROQ_MODEL_ID}",
+        lambda: [(f"openai:{TEXT_MODEL_ID}", get_text_model()), (f"nvidia:{NVIDIA_MODEL_ID}", get_nvidia_model())],
+    )
 
+@lru_cache(maxsize=None)
+def get_groq_multi_model():
+    return _groq(GROQ_MULTI_MODEL_ID)
 
-agent_config = {
-    "storage": SqliteAgentStorage(table_name="narrative_agent", db_file="agent_storage.db"),
-    "add_datetime_to_instructions": True,
-    "add_history_to_messages": True,
-    "num_history_responses": 5,
-    "markdown": True,
-    "debug_mode": True,
-    "monitoring": True,
-}
+@lru_cache(maxsize=None)
+def get_nvidia_model():
+    return _openai_chat(NVIDIA_MODEL_ID, "nvidia", NVIDIA_API_KEY, "https://integrate.api.nvidia.com/v1")
+
+
+def get_agent_config():
+    return {
+        "storage": get_agent_storage(),
+        "add_datetime_to_instructions": True,
+        "add_history_to_messages": True,
+        "num_history_responses": 5,
+        "markdown": True,
+        "debug_mode": True,
+        "monitoring": True,
+    }
 
-def create_agent_with_config(name, role, instructions, apply_config=False):
+def create_agent_with_config(name, role, instructions, apply_config=False, history_responses=None):
     """
-    Factory function to create an agent with optional configuration
+    Factory function to create an agent with optional configuration.
+    history_responses overrides num_history_responses of the config; 0 disables history and session storage
     """
     agent_params = {
         "name": name,
         "role": role,
-        "model": groqModel,
+        "model": get_groq_model(),
         "instructions": instructions,
     }
     
     if apply_config:
-        agent_params.update(agent_config)
+        agent_params.update(get_agent_config())
+        if history_responses is not None:
+            agent_params["num_history_responses"] = history_responses
+            agent_params["add_history_to_messages"] = history_responses > 0
+            if history_responses == 0:
+                agent_params.pop("storage")
         
     return Agent(**agent_params)
 
@@ -118,7 +165,7 @@ def create_narrative_team(apply_config=False):
     narrative_team_params = {
         "team": team,
         "name": "Narrative Team",
-        "model": textModel,
+        "model": get_text_model(),
         "instructions": [
             "First ask the search journalist to search for the most relevant URLs for that topic.",
             "Then ask the writer to get an engaging draft of the article.",
@@ -133,20 +180,37 @@ def create_narrative_team(apply_config=False):
     }
     
     if apply_config:
-        narrative_team_params.update({k: v for k, v in agent_config.items() if k not in ["markdown", "debug_mode", "show_team_responses"]})
+        narrative_team_params.update({k: v for k, v in get_agent_config().items() if k not in ["markdown", "debug_mode", "show_team_responses"]})
     
     agent_team = Agent(**narrative_team_params)
     
     return team, agent_team
 
 
-# Create default instances (without config)
-agent_team, team = create_narrative_team()
+@lru_cache(maxsize=None)
+def get_narrative_team():
+    """Default instances (without config), built on first use"""
+    return create_narrative_team()
+
+_LAZY_ATTRIBUTES = {
+    "textModel": get_text_model,
+    "groqModel": get_groq_model,
+    "groqMultiModel": get_groq_multi_model,
+    "nvidiaModel": get_nvidia_model,
+    "team": lambda: get_narrative_team()[0],
+    "agent_team": lambda: get_narrative_team()[1],
+}
+
+def __getattr__(name):
+    # Former module-level instances keep working as attributes, constructed on first access
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Example discussion
 if __name__ == "__main__":
     asyncio.run(
-        agent_team.print_response(
+        get_narrative_team()[1].print_response(
             message="Start the discussion on the topic: 'What is the best way to learn to code?'",
             stream=True,
             stream_intermediate_steps=True,
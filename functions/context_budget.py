@@ -0,0 +1,212 @@
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from prometheus_client import Counter
+
+try:
+    import tiktoken
+except ImportError:  # optional; token counts fall back to about 4 characters per token
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Entities set data["context"] = {"max_tokens", "strategy", "fields", "keep"};
+# these defaults apply to entities that don't. 0 tokens leaves inputs untouched
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "0"))
+CONTEXT_STRATEGY = os.getenv("CONTEXT_STRATEGY", "truncate")
+CONTEXT_TOKEN_ENCODING = os.getenv("CONTEXT_TOKEN_ENCODING", "cl100k_base")
+
+CONTEXT_STRATEGIES = ("truncate", "fields", "summarize")
+
+CONTEXT_FITS = Counter(
+    "workflow_context_fits_total", "Node inputs cut down to their token budget", ["strategy", "result"]
+)
+CONTEXT_TOKENS_REMOVED = Counter(
+    "workflow_context_tokens_removed_total", "Input tokens kept from node agents by context budgets"
+)
+
+SUMMARY_INSTRUCTIONS = (
+    "Condense the text you are given for the next agent in a workflow. Keep names, facts, "
+    "decisions and open questions; drop repetition and style. Answer with the condensed text only, "
+    "in at most {max_tokens} tokens."
+)
+
+
+@dataclass(frozen=True)
+class ContextBudget:
+    """How much of its merged parent output a node passes on to its agent"""
+    max_tokens: int = 0
+    strategy: str = "truncate"
+    # strategy "fields": JSON keys or markdown section headings to keep
+    fields: Tuple[str, ...] = ()
+    # strategy "truncate" (and the fallback of the others): "head" or "tail"
+    keep: str = "head"
+
+    @property
+    def limited(self) -> bool:
+        return self.max_tokens > 0
+
+    @property
+    def cache_key(self) -> Optional[str]:
+        """Part of the response cache key; None while inputs are passed on unchanged"""
+        if not self.limited:
+            return None
+        return json.dumps([self.max_tokens, self.strategy, self.fields, self.keep])
+
+
+def entity_context_budget(data: Optional[dict]) -> ContextBudget:
+    """Budget of an entity from data["context"]; unknown strategies fall back to truncate"""
+    context = (data or {}).get("context") or {}
+    strategy = context.get("strategy", CONTEXT_STRATEGY)
+    if strategy not in CONTEXT_STRATEGIES:
+        logger.warning(f"Unknown context strategy {strategy!r}, truncating instead")
+        strategy = "truncate"
+    return ContextBudget(
+        max_tokens=int(context.get("max_tokens", CONTEXT_MAX_TOKENS)),
+        strategy=strategy,
+        fields=tuple(context.get("fields") or ()),
+        keep="tail" if context.get("keep") == "tail" else "head",
+    )
+
+
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding(CONTEXT_TOKEN_ENCODING)
+        except Exception as e:
+            # The encoding is downloaded on first use; offline workers estimate instead
+            logger.warning(f"Token encoding {CONTEXT_TOKEN_ENCODING} unavailable, estimating: {str(e)}")
+            _encoding = False
+    return _encoding or None
+
+
+def count_tokens(text: Optional[str]) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, keep: str = "head") -> str:
+    encoding = _get_encoding()
+    if encoding is None:
+        limit = max_tokens * 4
+        return text[:limit] if keep == "head" else text[-limit:]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens] if keep == "head" else tokens[-max_tokens:])
+
+
+_FENCE = re.compile(r"^```(?:json)?\s*(.*?)\s*```$", re.DOTALL)
+_HEADING = re.compile(r"^#{1,6}\s+(.+?)\s*#*\s*$", re.MULTILINE)
+
+
+def extract_fields(text: str, fields: Tuple[str, ...]) -> Optional[str]:
+    """
+    The requested fields of a node output: keys of a JSON object, otherwise
+    markdown sections by heading (merged parent outputs are headed by label).
+    None when nothing matched.
+    """
+    wanted = {field.lower() for field in fields}
+    fence = _FENCE.match(text.strip())
+    try:
+        value = json.loads(fence.group(1) if fence else text)
+    except ValueError:
+        value = None
+    if isinstance(value, dict):
+        selected = {key: item for key, item in value.items() if key.lower() in wanted}
+        return json.dumps(selected, ensure_ascii=False) if selected else None
+
+    headings = list(_HEADING.finditer(text))
+    sections = []
+    for index, heading in enumerate(headings):
+        if heading.group(1).lower() not in wanted:
+            continue
+        end = headings[index + 1].start() if index + 1 < len(headings) else len(text)
+        sections.append(text[heading.start():end].strip())
+    return "\n\n".join(sections) or None
+
+
+def _summary_agent(max_tokens: int):
+    # A plain agent on the shared node model: no storage, no history
+    from agno.agent import Agent
+    from functions.agent_team import get_groq_model
+    return Agent(
+        name="Context Summarizer",
+        model=get_groq_model(),
+        instructions=SUMMARY_INSTRUCTIONS.format(max_tokens=max_tokens),
+    )
+
+
+def _extract(text: str, budget: ContextBudget) -> Optional[str]:
+    if budget.strategy != "fields" or not budget.fields:
+        return None
+    return extract_fields(text, budget.fields)
+
+
+def _finish(text: str, budget: ContextBudget, strategy: str, source_tokens: int) -> Tuple[str, int]:
+    """Truncate whatever the strategy left over the budget and account for it"""
+    tokens = count_tokens(text)
+    if tokens > budget.max_tokens:
+        text = truncate_tokens(text, budget.max_tokens, budget.keep)
+        tokens = count_tokens(text)
+    CONTEXT_FITS.labels(strategy, "ok").inc()
+    CONTEXT_TOKENS_REMOVED.inc(max(0, source_tokens - tokens))
+    return text, tokens
+
+
+def _fit_without_summary(text: str, budget: ContextBudget) -> Tuple[Optional[Tuple[str, int]], int]:
+    """
+    Steps of fit_context that need no model: returns (input, token count), or
+    None when the summary agent has to run, together with the source tokens
+    """
+    tokens = count_tokens(text)
+    if not budget.limited or tokens <= budget.max_tokens:
+        return (text, tokens), tokens
+    extracted = _extract(text, budget)
+    if extracted is not None:
+        return _finish(extracted, budget, "fields", tokens), tokens
+    if budget.strategy != "summarize":
+        return _finish(text, budget, "truncate", tokens), tokens
+    return None, tokens
+
+
+def _summary_failed(text: str, budget: ContextBudget, source_tokens: int, error: Exception) -> Tuple[str, int]:
+    CONTEXT_FITS.labels("summarize", "error").inc()
+    logger.warning(f"Context summary failed, truncating instead: {str(error)}")
+    return _finish(text, budget, "truncate", source_tokens)
+
+
+def fit_context(text: str, budget: ContextBudget) -> Tuple[str, int]:
+    """Cut a node input down to its budget; returns (input, token count)"""
+    fitted, tokens = _fit_without_summary(text, budget)
+    if fitted is not None:
+        return fitted
+    try:
+        summary = _summary_agent(budget.max_tokens).run(text).content or ""
+    except Exception as e:
+        return _summary_failed(text, budget, tokens, e)
+    return _finish(summary, budget, "summarize", tokens)
+
+
+async def afit_context(text: str, budget: ContextBudget) -> Tuple[str, int]:
+    """Async variant of fit_context"""
+    fitted, tokens = _fit_without_summary(text, budget)
+    if fitted is not None:
+        return fitted
+    try:
+        summary = (await _summary_agent(budget.max_tokens).arun(text)).content or ""
+    except Exception as e:
+        return _summary_failed(text, budget, tokens, e)
+    return _finish(summary, budget, "summarize", tokens)
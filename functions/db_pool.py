@@ -0,0 +1,76 @@
+import logging
+import os
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+logger = logging.getLogger(__name__)
+
+# Per engine and per worker process: DB_POOL_SIZE + DB_MAX_OVERFLOW connections at most
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Recycle before server or proxy idle timeouts close connections under us
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+
+DB_POOL_CHECKED_OUT = Gauge("workflow_db_pool_checked_out", "Connections currently checked out", ["engine"])
+DB_POOL_OVERFLOW = Gauge("workflow_db_pool_overflow", "Connections open beyond the pool size", ["engine"])
+DB_POOL_SIZE_GAUGE = Gauge("workflow_db_pool_size", "Configured pool size", ["engine"])
+DB_POOL_WAIT_SECONDS = Histogram(
+    "workflow_db_pool_wait_seconds", "Time spent waiting for a pooled connection", ["engine"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+DB_POOL_TIMEOUTS = Counter(
+    "workflow_db_pool_timeouts_total", "Checkouts that gave up after DB_POOL_TIMEOUT", ["engine"]
+)
+
+
+class _InstrumentedPoolMixin:
+    """Times every checkout, including the wait for a free connection once the pool is exhausted"""
+    metrics_label = "sync"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            DB_POOL_TIMEOUTS.labels(self.metrics_label).inc()
+            logger.warning(f"Database pool ({self.metrics_label}) exhausted: {self.status()}")
+            raise
+        finally:
+            DB_POOL_WAIT_SECONDS.labels(self.metrics_label).observe(time.perf_counter() - start)
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    metrics_label = "sync"
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    metrics_label = "async"
+
+
+def pool_options(url: str, asyncio: bool = False) -> dict:
+    """create_engine/create_async_engine pool arguments; SQLite keeps SQLAlchemy's default pool"""
+    if url.startswith("sqlite"):
+        return {}
+    return {
+        "poolclass": InstrumentedAsyncQueuePool if asyncio else InstrumentedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def instrument_pool(pool, label: str) -> None:
+    """Expose a pool's occupancy as gauges read at scrape time"""
+    if not isinstance(pool, QueuePool):
+        return
+    DB_POOL_CHECKED_OUT.labels(label).set_function(pool.checkedout)
+    # overflow() starts at -pool_size and counts up as connections are opened
+    DB_POOL_OVERFLOW.labels(label).set_function(lambda: max(pool.overflow(), 0))
+    DB_POOL_SIZE_GAUGE.labels(label).set(pool.size())
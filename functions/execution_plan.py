@@ -0,0 +1,203 @@
+import copy
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from types import MappingProxyType
+from typing import Any, Mapping, Optional, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.workflow import Workflow
+from functions.response_cache import entity_cache_ttl
+from functions.context_budget import ContextBudget, entity_context_budget
+from functions.workflow_graph import WorkflowGraph, build_graph, edges_query, entities_query
+
+logger = logging.getLogger(__name__)
+
+PLAN_CACHE_MAX_SIZE = int(os.getenv("PLAN_CACHE_MAX_SIZE", "256"))
+# Other workers bump versions too; a cached plan is re-checked against workflows.version this often
+PLAN_CACHE_REVALIDATE_SECONDS = float(os.getenv("PLAN_CACHE_REVALIDATE_SECONDS", "5"))
+
+PLAN_CACHE_LOOKUPS = Counter(
+    "workflow_plan_cache_lookups_total", "Execution plan lookups", ["result"]  # hit, revalidated, miss
+)
+PLAN_COMPILE_SECONDS = Histogram("workflow_plan_compile_seconds", "Time to load and compile an execution plan")
+PLAN_CACHE_SIZE = Gauge("workflow_plan_cache_size", "Execution plans currently cached")
+
+
+@dataclass(frozen=True)
+class NodeSpec:
+    """Snapshot of a workflow entity with its agent settings resolved; attribute names follow WorkflowEntity"""
+    id: uuid.UUID
+    external_id: str
+    type: str
+    label: Optional[str]
+    prompt: Optional[str]
+    data: Optional[Mapping[str, Any]]
+    order: Optional[float]
+    updated_at: Optional[datetime]
+    agent_name: str
+    agent_role: str
+    cache_ttl: int
+    context_budget: ContextBudget
+
+
+@dataclass(frozen=True)
+class ExecutionPlan:
+    """Everything a run needs to know about a workflow version, built once and shared read-only"""
+    workflow_id: uuid.UUID
+    version: int
+    name: str
+    project_id: uuid.UUID
+    nodes: Mapping[uuid.UUID, NodeSpec]
+    graph: WorkflowGraph
+
+
+def _node_spec(entity) -> NodeSpec:
+    return NodeSpec(
+        id=entity.id,
+        external_id=entity.external_id,
+        type=entity.type,
+        label=entity.label,
+        prompt=entity.prompt,
+        data=MappingProxyType(copy.deepcopy(entity.data)) if entity.data is not None else None,
+        order=entity.order,
+        updated_at=entity.updated_at,
+        agent_name=entity.label or f"{entity.type.title()} Agent",
+        agent_role=f"Processes content as a {entity.type}",
+        cache_ttl=entity_cache_ttl(entity.data),
+        context_budget=entity_context_budget(entity.data),
+    )
+
+
+def compile_plan(workflow: Workflow, entities: list, edges: list) -> ExecutionPlan:
+    """Build the immutable plan; raises WorkflowCycleError for graphs that cannot be scheduled"""
+    nodes = [_node_spec(entity) for entity in entities]
+    return ExecutionPlan(
+        workflow_id=workflow.id,
+        version=workflow.version,
+        name=workflow.name,
+        project_id=workflow.project_id,
+        nodes=MappingProxyType({node.id: node for node in nodes}),
+        graph=build_graph(nodes, edges),
+    )
+
+
+def bump_workflow_version(db: Session, workflow_id: uuid.UUID):
+    """Mark the graph of a workflow as changed; part of the caller's transaction"""
+    db.execute(
+        update(Workflow)
+        .where(Workflow.id == workflow_id)
+        .values(version=Workflow.version + 1, updated_at=datetime.utcnow())
+    )
+
+
+class ExecutionPlanCache:
+    """
+    In-process LRU of compiled plans keyed by (workflow id, version).
+    Within PLAN_CACHE_REVALIDATE_SECONDS of its last check a plan is served
+    without touching the database; after that one primary key lookup of the
+    version decides whether it is still current.
+    """
+
+    def __init__(self, max_size: int = PLAN_CACHE_MAX_SIZE, revalidate_seconds: float = PLAN_CACHE_REVALIDATE_SECONDS):
+        self.max_size = max_size
+        self.revalidate_seconds = revalidate_seconds
+        self._plans: "OrderedDict[uuid.UUID, Tuple[ExecutionPlan, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _fresh(self, workflow_id: uuid.UUID) -> Tuple[Optional[ExecutionPlan], bool]:
+        """(cached plan, whether it can be used without a version check)"""
+        with self._lock:
+            entry = self._plans.get(workflow_id)
+            if entry is None:
+                return None, False
+            self._plans.move_to_end(workflow_id)
+            plan, checked_at = entry
+            return plan, time.monotonic() - checked_at < self.revalidate_seconds
+
+    def _store(self, plan: ExecutionPlan):
+        with self._lock:
+            self._plans[plan.workflow_id] = (plan, time.monotonic())
+            self._plans.move_to_end(plan.workflow_id)
+            while len(self._plans) > self.max_size:
+                self._plans.popitem(last=False)
+            PLAN_CACHE_SIZE.set(len(self._plans))
+
+    def get(self, db: Session, workflow_id: uuid.UUID) -> Optional[ExecutionPlan]:
+        """Current plan of a workflow, or None when the workflow does not exist"""
+        plan, fresh = self._fresh(workflow_id)
+        if plan is not None and fresh:
+            PLAN_CACHE_LOOKUPS.labels(result="hit").inc()
+            return plan
+        if plan is not None:
+            version = db.execute(select(Workflow.version).where(Workflow.id == workflow_id)).scalar()
+            if version == plan.version:
+                PLAN_CACHE_LOOKUPS.labels(result="revalidated").inc()
+                self._store(plan)
+                return plan
+
+        PLAN_CACHE_LOOKUPS.labels(result="miss").inc()
+        start = time.perf_counter()
+        workflow = db.get(Workflow, workflow_id)
+        if workflow is None:
+            self.invalidate(workflow_id)
+            return None
+        plan = compile_plan(
+            workflow,
+            db.execute(entities_query(workflow_id)).scalars().all(),
+            db.execute(edges_query(workflow_id)).all(),
+        )
+        PLAN_COMPILE_SECONDS.observe(time.perf_counter() - start)
+        self._store(plan)
+        return plan
+
+    async def aget(self, db: AsyncSession, workflow_id: uuid.UUID) -> Optional[ExecutionPlan]:
+        """Async variant of get"""
+        plan, fresh = self._fresh(workflow_id)
+        if plan is not None and fresh:
+            PLAN_CACHE_LOOKUPS.labels(result="hit").inc()
+            return plan
+        if plan is not None:
+            version = (await db.execute(select(Workflow.version).where(Workflow.id == workflow_id))).scalar()
+            if version == plan.version:
+                PLAN_CACHE_LOOKUPS.labels(result="revalidated").inc()
+                self._store(plan)
+                return plan
+
+        PLAN_CACHE_LOOKUPS.labels(result="miss").inc()
+        start = time.perf_counter()
+        workflow = await db.get(Workflow, workflow_id)
+        if workflow is None:
+            self.invalidate(workflow_id)
+            return None
+        plan = compile_plan(
+            workflow,
+            (await db.execute(entities_query(workflow_id))).scalars().all(),
+            (await db.execute(edges_query(workflow_id))).all(),
+        )
+        PLAN_COMPILE_SECONDS.observe(time.perf_counter() - start)
+        self._store(plan)
+        return plan
+
+    def invalidate(self, workflow_id: uuid.UUID):
+        """Drop the local plan right away; other workers notice the new version on revalidation"""
+        with self._lock:
+            self._plans.pop(workflow_id, None)
+            PLAN_CACHE_SIZE.set(len(self._plans))
+
+    def clear(self):
+        with self._lock:
+            self._plans.clear()
+            PLAN_CACHE_SIZE.set(0)
+
+
+execution_plan_cache = ExecutionPlanCache()
@@ -0,0 +1,141 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, Tuple
+
+import httpx
+from prometheus_client import Counter, Histogram
+
+try:
+    import h2  # noqa: F401
+except ImportError:  # optional; clients fall back to HTTP/1.1 keep-alive
+    h2 = None
+
+logger = logging.getLogger(__name__)
+
+MODEL_HTTP2 = os.getenv("MODEL_HTTP2", "1") == "1" and h2 is not None
+MODEL_HTTP_MAX_CONNECTIONS = int(os.getenv("MODEL_HTTP_MAX_CONNECTIONS", "100"))
+MODEL_HTTP_MAX_KEEPALIVE = int(os.getenv("MODEL_HTTP_MAX_KEEPALIVE", "20"))
+MODEL_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("MODEL_HTTP_KEEPALIVE_EXPIRY", "120"))
+MODEL_HTTP_CONNECT_TIMEOUT = float(os.getenv("MODEL_HTTP_CONNECT_TIMEOUT", "10"))
+MODEL_HTTP_TIMEOUT = float(os.getenv("MODEL_HTTP_TIMEOUT", "120"))
+# 429s are retried by the model limiter and failures by the model router, not by the SDKs
+MODEL_SDK_MAX_RETRIES = int(os.getenv("MODEL_SDK_MAX_RETRIES", "0"))
+
+MODEL_HTTP_REQUESTS = Counter(
+    "workflow_model_http_requests_total", "HTTP requests to model providers", ["provider", "http_version"]
+)
+MODEL_HTTP_CONNECTIONS = Counter(
+    "workflow_model_http_connections_opened_total", "New TCP connections to model providers", ["provider"]
+)
+MODEL_HTTP_TLS_SECONDS = Histogram(
+    "workflow_model_http_tls_handshake_seconds", "TLS handshakes with model providers", ["provider"]
+)
+
+
+class _ConnectionTrace:
+    """httpcore trace hook counting new connections and timing TLS handshakes"""
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self._tls_started = None
+
+    def __call__(self, event: str, info: dict):
+        if event == "connection.connect_tcp.complete":
+            MODEL_HTTP_CONNECTIONS.labels(self.provider).inc()
+        elif event == "connection.start_tls.started":
+            self._tls_started = time.perf_counter()
+        elif event == "connection.start_tls.complete" and self._tls_started is not None:
+            MODEL_HTTP_TLS_SECONDS.labels(self.provider).observe(time.perf_counter() - self._tls_started)
+
+
+class _AsyncConnectionTrace(_ConnectionTrace):
+    async def __call__(self, event: str, info: dict):
+        super().__call__(event, info)
+
+
+def _client_options(provider: str) -> dict:
+    return {
+        "http2": MODEL_HTTP2,
+        "limits": httpx.Limits(
+            max_connections=MODEL_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=MODEL_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=MODEL_HTTP_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(MODEL_HTTP_TIMEOUT, connect=MODEL_HTTP_CONNECT_TIMEOUT),
+    }
+
+
+_clients: Dict[str, httpx.Client] = {}
+_async_clients: Dict[str, httpx.AsyncClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_http_client(provider: str) -> httpx.Client:
+    """Process-wide pooled client of a provider for the executor threads"""
+    with _clients_lock:
+        client = _clients.get(provider)
+        if client is None:
+            def on_request(request: httpx.Request):
+                request.extensions["trace"] = _ConnectionTrace(provider)
+
+            def on_response(response: httpx.Response):
+                MODEL_HTTP_REQUESTS.labels(provider, response.http_version).inc()
+
+            client = httpx.Client(
+                event_hooks={"request": [on_request], "response": [on_response]}, **_client_options(provider)
+            )
+            _clients[provider] = client
+            logger.info(f"Shared HTTP client for {provider} (http2={MODEL_HTTP2})")
+        return client
+
+
+def get_async_http_client(provider: str) -> httpx.AsyncClient:
+    """Process-wide pooled client of a provider for the event loop"""
+    with _clients_lock:
+        client = _async_clients.get(provider)
+        if client is None:
+            async def on_request(request: httpx.Request):
+                request.extensions["trace"] = _AsyncConnectionTrace(provider)
+
+            async def on_response(response: httpx.Response):
+                MODEL_HTTP_REQUESTS.labels(provider, response.http_version).inc()
+
+            client = httpx.AsyncClient(
+                event_hooks={"request": [on_request], "response": [on_response]}, **_client_options(provider)
+            )
+            _async_clients[provider] = client
+        return client
+
+
+def openai_clients(provider: str, api_key: str, base_url: str = None) -> Tuple[object, object]:
+    """OpenAI SDK clients (sync, async) on the shared connection pools of provider"""
+    from openai import AsyncOpenAI, OpenAI
+    options = {"api_key": api_key, "base_url": base_url, "max_retries": MODEL_SDK_MAX_RETRIES}
+    return (
+        OpenAI(http_client=get_http_client(provider), **options),
+        AsyncOpenAI(http_client=get_async_http_client(provider), **options),
+    )
+
+
+def groq_clients(api_key: str) -> Tuple[object, object]:
+    """Groq SDK clients (sync, async) on the shared connection pools"""
+    from groq import AsyncGroq, Groq
+    options = {"api_key": api_key, "max_retries": MODEL_SDK_MAX_RETRIES}
+    return (
+        Groq(http_client=get_http_client("groq"), **options),
+        AsyncGroq(http_client=get_async_http_client("groq"), **options),
+    )
+
+
+async def close_http_clients():
+    """Close the shared pools on shutdown"""
+    with _clients_lock:
+        clients, async_clients = list(_clients.values()), list(_async_clients.values())
+        _clients.clear()
+        _async_clients.clear()
+    for client in clients:
+        client.close()
+    for client in async_clients:
+        await client.aclose()
@@ -0,0 +1,390 @@
+import asyncio
+import copy
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from functions.tracing import span, start_span
+
+logger = logging.getLogger(__name__)
+
+# Requests and tokens per minute per provider model; 0 disables the bucket.
+# MODEL_RATE_LIMITS='{"groq:qwen-2.5-32b": {"rpm": 30, "tpm": 6000}}' overrides single models
+PROVIDER_RATE_LIMITS = {
+    "groq": {"rpm": int(os.getenv("GROQ_RPM", "30")), "tpm": int(os.getenv("GROQ_TPM", "6000"))},
+    "openai": {"rpm": int(os.getenv("OPENAI_RPM", "500")), "tpm": int(os.getenv("OPENAI_TPM", "200000"))},
+    "nvidia": {"rpm": int(os.getenv("NVIDIA_RPM", "40")), "tpm": int(os.getenv("NVIDIA_TPM", "0"))},
+}
+MODEL_RATE_LIMITS = json.loads(os.getenv("MODEL_RATE_LIMITS", "{}"))
+
+MODEL_MIN_CONCURRENCY = int(os.getenv("MODEL_MIN_CONCURRENCY", "1"))
+MODEL_MAX_CONCURRENCY = int(os.getenv("MODEL_MAX_CONCURRENCY", "64"))
+MODEL_INITIAL_CONCURRENCY = int(os.getenv("MODEL_INITIAL_CONCURRENCY", "8"))
+# Calls slower than this multiple of the best recent latency count as congestion
+MODEL_LATENCY_TOLERANCE = float(os.getenv("MODEL_LATENCY_TOLERANCE", "2.0"))
+# 429s are retried after waiting instead of failing the node
+MODEL_RATE_LIMIT_RETRIES = int(os.getenv("MODEL_RATE_LIMIT_RETRIES", "3"))
+MODEL_RATE_LIMIT_BACKOFF = float(os.getenv("MODEL_RATE_LIMIT_BACKOFF", "2"))
+# Completion tokens reserved per call until the provider reports the real usage
+MODEL_COMPLETION_TOKENS_ESTIMATE = int(os.getenv("MODEL_COMPLETION_TOKENS_ESTIMATE", "512"))
+
+MODEL_LIMITER_WAIT_SECONDS = Histogram(
+    "workflow_model_limiter_wait_seconds", "Time model calls waited for a slot", ["provider", "model"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+)
+MODEL_LIMITER_CONCURRENCY = Gauge(
+    "workflow_model_limiter_concurrency", "Current adaptive concurrency limit", ["provider", "model"]
+)
+MODEL_LIMITER_IN_FLIGHT = Gauge("workflow_model_limiter_in_flight", "Model calls in flight", ["provider", "model"])
+MODEL_LIMITER_WAITING = Gauge("workflow_model_limiter_waiting", "Model calls queued for a slot", ["provider", "model"])
+MODEL_LIMITER_RATE_LIMITED = Counter(
+    "workflow_model_limiter_rate_limited_total", "429 responses from model providers", ["provider", "model"]
+)
+
+
+class TokenBucket:
+    """Continuously refilled bucket of per_minute units; not thread-safe on its own"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """Seconds until amount is available; requests above the capacity wait for a full bucket"""
+        self._refill(now)
+        needed = min(amount, self.capacity)
+        return 0.0 if self.level >= needed else (needed - self.level) / self.rate
+
+    def take(self, amount: float):
+        # May go negative: an oversized call is paid off before the next one starts
+        self.level -= amount
+
+
+class _Waiter:
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.event = asyncio.Event() if loop else threading.Event()
+
+    def wake(self):
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.event.set)
+        else:
+            self.event.set()
+
+
+class ModelLimiter:
+    """
+    Admission control for one provider model, shared by threads and event loops.
+
+    Calls queue in FIFO order until a concurrency slot, a request token and
+    enough model tokens are available. The concurrency limit adapts AIMD-style:
+    it grows by one per window of calls with healthy latency and is cut when
+    latency exceeds MODEL_LATENCY_TOLERANCE times the best recent latency
+    (x0.9) or the provider answers 429 (x0.5, plus a pause of Retry-After).
+    """
+
+    def __init__(self, provider: str, model: str, rpm: int = 0, tpm: int = 0):
+        self.provider = provider
+        self.model = model
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.limit = float(max(MODEL_MIN_CONCURRENCY, min(MODEL_INITIAL_CONCURRENCY, MODEL_MAX_CONCURRENCY)))
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.best_latency: Optional[float] = None
+        self._waiters: deque = deque()
+        self._lock = threading.Lock()
+        self._labels = (provider, model)
+        MODEL_LIMITER_CONCURRENCY.labels(*self._labels).set(self.limit)
+
+    def _try_acquire(self, waiter: _Waiter, tokens: int) -> Optional[float]:
+        """Take a slot when waiter is first in line; otherwise the seconds worth waiting (None: until woken)"""
+        with self._lock:
+            if self._waiters[0] is not waiter:
+                return None
+            now = time.monotonic()
+            delay = max(self.paused_until - now, 0.0)
+            if self.requests:
+                delay = max(delay, self.requests.delay(1, now))
+            if self.tokens:
+                delay = max(delay, self.tokens.delay(tokens, now))
+            if delay > 0:
+                return delay
+            if self.in_flight >= int(self.limit):
+                return None
+
+            self._waiters.popleft()
+            self.in_flight += 1
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(tokens)
+            self._update_gauges()
+            next_waiter = self._waiters[0] if self._waiters else None
+        # The next caller re-checks right away; it may fit as well
+        if next_waiter:
+            next_waiter.wake()
+        return 0.0
+
+    def _enqueue(self, waiter: _Waiter):
+        with self._lock:
+            self._waiters.append(waiter)
+            self._update_gauges()
+
+    def _abandon(self, waiter: _Waiter):
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            next_waiter = self._waiters[0] if self._waiters else None
+            self._update_gauges()
+        if next_waiter:
+            next_waiter.wake()
+
+    def acquire(self, tokens: int):
+        waiter = _Waiter()
+        self._enqueue(waiter)
+        start = time.perf_counter()
+        try:
+            with span("model.queue", provider=self.provider, model=self.model):
+                while True:
+                    delay = self._try_acquire(waiter, tokens)
+                    if delay == 0.0:
+                        break
+                    waiter.event.wait(delay)
+                    waiter.event.clear()
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        MODEL_LIMITER_WAIT_SECONDS.labels(*self._labels).observe(time.perf_counter() - start)
+
+    async def aacquire(self, tokens: int):
+        waiter = _Waiter(asyncio.get_running_loop())
+        self._enqueue(waiter)
+        start = time.perf_counter()
+        try:
+            with span("model.queue", provider=self.provider, model=self.model):
+                while True:
+                    delay = self._try_acquire(waiter, tokens)
+                    if delay == 0.0:
+                        break
+                    try:
+                        await asyncio.wait_for(waiter.event.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    waiter.event.clear()
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        MODEL_LIMITER_WAIT_SECONDS.labels(*self._labels).observe(time.perf_counter() - start)
+
+    def release(
+        self,
+        reserved_tokens: int,
+        used_tokens: Optional[int],
+        latency: Optional[float],
+        rate_limited: bool = False,
+        retry_after: Optional[float] = None
+    ):
+        """Return a slot and feed the call's outcome into the concurrency limit"""
+        with self._lock:
+            self.in_flight -= 1
+            if self.tokens and used_tokens is not None:
+                self.tokens.take(used_tokens - reserved_tokens)
+            if rate_limited:
+                MODEL_LIMITER_RATE_LIMITED.labels(*self._labels).inc()
+                self.limit = max(MODEL_MIN_CONCURRENCY, self.limit * 0.5)
+                self.paused_until = max(self.paused_until, time.monotonic() + (retry_after or MODEL_RATE_LIMIT_BACKOFF))
+            elif latency is not None:
+                # The best latency drifts up slowly so a permanently slower provider becomes the new normal
+                self.best_latency = latency if self.best_latency is None else min(self.best_latency * 1.01, latency)
+                if latency > self.best_latency * MODEL_LATENCY_TOLERANCE:
+                    self.limit = max(MODEL_MIN_CONCURRENCY, self.limit * 0.9)
+                else:
+                    self.limit = min(MODEL_MAX_CONCURRENCY, self.limit + 1 / self.limit)
+            MODEL_LIMITER_CONCURRENCY.labels(*self._labels).set(self.limit)
+            self._update_gauges()
+            next_waiter = self._waiters[0] if self._waiters else None
+        if next_waiter:
+            next_waiter.wake()
+
+    def _update_gauges(self):
+        MODEL_LIMITER_IN_FLIGHT.labels(*self._labels).set(self.in_flight)
+        MODEL_LIMITER_WAITING.labels(*self._labels).set(len(self._waiters))
+
+    def call(self, fn: Callable, tokens: int, *args, **kwargs):
+        for attempt in range(MODEL_RATE_LIMIT_RETRIES + 1):
+            self.acquire(tokens)
+            start = time.perf_counter()
+            try:
+                with span("model.call", provider=self.provider, model=self.model, attempt=attempt, reserved_tokens=tokens):
+                    result = fn(*args, **kwargs)
+            except Exception as e:
+                if _is_rate_limited(e):
+                    self.release(tokens, None, None, rate_limited=True, retry_after=_retry_after(e))
+                    if attempt < MODEL_RATE_LIMIT_RETRIES:
+                        logger.warning(f"{self.provider}/{self.model} rate limited, retrying after backoff")
+                        continue
+                else:
+                    self.release(tokens, None, None)
+                raise
+            self.release(tokens, _usage_tokens(result), time.perf_counter() - start)
+            return result
+
+    async def acall(self, fn: Callable, tokens: int, *args, **kwargs):
+        for attempt in range(MODEL_RATE_LIMIT_RETRIES + 1):
+            await self.aacquire(tokens)
+            start = time.perf_counter()
+            try:
+                with span("model.call", provider=self.provider, model=self.model, attempt=attempt, reserved_tokens=tokens):
+                    result = await fn(*args, **kwargs)
+            except Exception as e:
+                if _is_rate_limited(e):
+                    self.release(tokens, None, None, rate_limited=True, retry_after=_retry_after(e))
+                    if attempt < MODEL_RATE_LIMIT_RETRIES:
+                        logger.warning(f"{self.provider}/{self.model} rate limited, retrying after backoff")
+                        continue
+                else:
+                    self.release(tokens, None, None)
+                raise
+            self.release(tokens, _usage_tokens(result), time.perf_counter() - start)
+            return result
+
+    def stream(self, fn: Callable, tokens: int, *args, **kwargs):
+        """Limited streaming call; a 429 is only retried before the first chunk arrived"""
+        for attempt in range(MODEL_RATE_LIMIT_RETRIES + 1):
+            self.acquire(tokens)
+            outcome = {"used": None, "latency": None, "rate_limited": False, "retry_after": None}
+            # Started by hand: a span made current here would parent the consumer's spans between chunks
+            call_span = start_span("model.call", provider=self.provider, model=self.model, attempt=attempt, stream=True)
+            start = time.perf_counter()
+            try:
+                for chunk in fn(*args, **kwargs):
+                    if outcome["latency"] is None:
+                        outcome["latency"] = time.perf_counter() - start
+                    outcome["used"] = _usage_tokens(chunk) or outcome["used"]
+                    yield chunk
+                return
+            except Exception as e:
+                call_span.end(error=e)
+                if _is_rate_limited(e):
+                    outcome.update(rate_limited=True, retry_after=_retry_after(e))
+                    if outcome["latency"] is None and attempt < MODEL_RATE_LIMIT_RETRIES:
+                        continue
+                raise
+            finally:
+                # Also runs when the consumer stops iterating early
+                call_span.set_attributes(first_chunk_seconds=outcome["latency"], used_tokens=outcome["used"])
+                call_span.end()
+                self.release(tokens, outcome["used"], outcome["latency"], outcome["rate_limited"], outcome["retry_after"])
+
+    async def astream(self, fn: Callable, tokens: int, *args, **kwargs):
+        """Async variant of stream"""
+        for attempt in range(MODEL_RATE_LIMIT_RETRIES + 1):
+            await self.aacquire(tokens)
+            outcome = {"used": None, "latency": None, "rate_limited": False, "retry_after": None}
+            # Started by hand: a span made current here would parent the consumer's spans between chunks
+            call_span = start_span("model.call", provider=self.provider, model=self.model, attempt=attempt, stream=True)
+            start = time.perf_counter()
+            try:
+                async for chunk in fn(*args, **kwargs):
+                    if outcome["latency"] is None:
+                        outcome["latency"] = time.perf_counter() - start
+                    outcome["used"] = _usage_tokens(chunk) or outcome["used"]
+                    yield chunk
+                return
+            except Exception as e:
+                call_span.end(error=e)
+                if _is_rate_limited(e):
+                    outcome.update(rate_limited=True, retry_after=_retry_after(e))
+                    if outcome["latency"] is None and attempt < MODEL_RATE_LIMIT_RETRIES:
+                        continue
+                raise
+            finally:
+                call_span.set_attributes(first_chunk_seconds=outcome["latency"], used_tokens=outcome["used"])
+                call_span.end()
+                self.release(tokens, outcome["used"], outcome["latency"], outcome["rate_limited"], outcome["retry_after"])
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _usage_tokens(response: Any) -> Optional[int]:
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None)
+
+
+def estimate_tokens(messages) -> int:
+    """Prompt tokens (about 4 characters each) plus the completion reservation"""
+    characters = sum(len(str(getattr(message, "content", "") or "")) for message in messages or [])
+    return characters // 4 + MODEL_COMPLETION_TOKENS_ESTIMATE
+
+
+_limiters: Dict[Tuple[str, str], ModelLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def model_limiter(provider: str, model: str) -> ModelLimiter:
+    with _limiters_lock:
+        limiter = _limiters.get((provider, model))
+        if limiter is None:
+            limits = {**PROVIDER_RATE_LIMITS.get(provider, {}), **MODEL_RATE_LIMITS.get(f"{provider}:{model}", {})}
+            limiter = ModelLimiter(provider, model, limits.get("rpm", 0), limits.get("tpm", 0))
+            _limiters[(provider, model)] = limiter
+        return limiter
+
+
+LIMITED_METHODS = ("invoke", "ainvoke", "invoke_stream", "ainvoke_stream")
+
+
+def limit_model(model, provider: str):
+    """
+    Route every provider request of an agno model through its limiter.
+    invoke/ainvoke/invoke_stream/ainvoke_stream are the methods agno uses for
+    the raw API calls, so tool-call round trips are limited one by one.
+    """
+    limiter = model_limiter(provider, model.id)
+    invoke, ainvoke = model.invoke, model.ainvoke
+    invoke_stream, ainvoke_stream = model.invoke_stream, model.ainvoke_stream
+
+    def _tokens(args, kwargs) -> int:
+        return estimate_tokens(kwargs.get("messages", args[0] if args else None))
+
+    model.invoke = lambda *args, **kwargs: limiter.call(invoke, _tokens(args, kwargs), *args, **kwargs)
+    model.ainvoke = lambda *args, **kwargs: limiter.acall(ainvoke, _tokens(args, kwargs), *args, **kwargs)
+    model.invoke_stream = lambda *args, **kwargs: limiter.stream(invoke_stream, _tokens(args, kwargs), *args, **kwargs)
+    model.ainvoke_stream = lambda *args, **kwargs: limiter.astream(ainvoke_stream, _tokens(args, kwargs), *args, **kwargs)
+    model.limiter = limiter
+    return model
+
+
+def copy_limited_model(model):
+    """Shallow copy of a limited model whose calls go through the copy's own settings"""
+    duplicate = copy.copy(model)
+    limiter = getattr(model, "limiter", None)
+    if limiter is None:
+        return duplicate
+    for method in LIMITED_METHODS:
+        duplicate.__dict__.pop(method, None)
+    return limit_model(duplicate, limiter.provider)
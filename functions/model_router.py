@@ -0,0 +1,477 @@
+import asyncio
+import contextvars
+import copy
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, List, Optional, Tuple
+
+from circuitbreaker import CircuitBreaker
+from prometheus_client import Counter, Gauge
+
+from functions.model_limits import copy_limited_model
+from functions.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Duplicate a slow request on the next healthy provider once the primary passes its p95
+MODEL_HEDGING = os.getenv("MODEL_HEDGING", "0") == "1"
+# p95 is only trusted once this many latencies are known
+MODEL_HEDGE_MIN_SAMPLES = int(os.getenv("MODEL_HEDGE_MIN_SAMPLES", "20"))
+MODEL_HEDGE_MAX_THREADS = int(os.getenv("MODEL_HEDGE_MAX_THREADS", "32"))
+MODEL_STATS_WINDOW = int(os.getenv("MODEL_STATS_WINDOW", "200"))
+MODEL_CIRCUIT_FAILURES = int(os.getenv("MODEL_CIRCUIT_FAILURES", "5"))
+MODEL_CIRCUIT_RECOVERY_SECONDS = int(os.getenv("MODEL_CIRCUIT_RECOVERY_SECONDS", "30"))
+
+MODEL_ROUTE_LATENCY = Gauge(
+    "workflow_model_route_latency_seconds", "Rolling latency of model responses", ["route", "quantile"]
+)
+MODEL_ROUTE_FIRST_CHUNK_LATENCY = Gauge(
+    "workflow_model_route_first_chunk_latency_seconds", "Rolling latency until a model stream's first chunk", ["route", "quantile"]
+)
+MODEL_ROUTE_ERROR_RATE = Gauge("workflow_model_route_error_rate", "Rolling share of failed model responses", ["route"])
+MODEL_ROUTE_CIRCUIT_OPEN = Gauge("workflow_model_route_circuit_open", "1 while the route's circuit is open", ["route"])
+MODEL_ROUTE_FALLBACKS = Counter(
+    "workflow_model_route_fallbacks_total", "Responses served by a fallback route", ["route"]
+)
+MODEL_ROUTE_HEDGES = Counter(
+    "workflow_model_route_hedges_total", "Hedged duplicate requests by the route that answered first", ["winner"]
+)
+
+# Per-agent settings agno puts on the model; a fallback model gets them for the call it takes over
+AGENT_MODEL_ATTRIBUTES = (
+    "tools", "functions", "tool_choice", "tool_call_limit", "show_tool_calls",
+    "response_format", "structured_outputs",
+)
+
+# Marks a stream that ended without yielding anything
+_END = object()
+
+# Fallback routes that answered inside the current fallback_routes() block
+_fallback_log: contextvars.ContextVar[Optional[List[str]]] = contextvars.ContextVar("model_fallback_log", default=None)
+
+
+@contextmanager
+def fallback_routes():
+    """Collect the names of fallback routes that answered model calls made inside the block"""
+    answered: List[str] = []
+    token = _fallback_log.set(answered)
+    try:
+        yield answered
+    finally:
+        _fallback_log.reset(token)
+
+
+def _record_fallback(route: "ModelRoute") -> None:
+    MODEL_ROUTE_FALLBACKS.labels(route.name).inc()
+    answered = _fallback_log.get()
+    if answered is not None:
+        answered.append(route.name)
+
+
+class RouteStats:
+    """
+    Rolling latency percentiles and error rate of one route.
+    Streams are timed to their first chunk and kept apart from full responses.
+    """
+
+    def __init__(self, name: str, window: int = MODEL_STATS_WINDOW):
+        self.name = name
+        self._latencies: deque = deque(maxlen=window)
+        self._first_chunk_latencies: deque = deque(maxlen=window)
+        self._outcomes: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency: Optional[float], ok: bool, first_chunk: bool = False):
+        latencies = self._first_chunk_latencies if first_chunk else self._latencies
+        with self._lock:
+            self._outcomes.append(ok)
+            if ok and latency is not None:
+                latencies.append(latency)
+            p50, p95 = self.percentile(0.5, first_chunk=first_chunk), self.percentile(0.95, first_chunk=first_chunk)
+            error_rate = self._outcomes.count(False) / len(self._outcomes)
+        gauge = MODEL_ROUTE_FIRST_CHUNK_LATENCY if first_chunk else MODEL_ROUTE_LATENCY
+        if p50 is not None:
+            gauge.labels(self.name, "0.5").set(p50)
+            gauge.labels(self.name, "0.95").set(p95)
+        MODEL_ROUTE_ERROR_RATE.labels(self.name).set(error_rate)
+
+    def percentile(self, quantile: float, min_samples: int = 1, first_chunk: bool = False) -> Optional[float]:
+        latencies = self._first_chunk_latencies if first_chunk else self._latencies
+        if len(latencies) < min_samples:
+            return None
+        ordered = sorted(latencies)
+        return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+class ModelRoute:
+    """One provider model with its circuit breaker and statistics"""
+
+    def __init__(self, name: str, model):
+        self.name = name
+        self.model = model
+        self.stats = RouteStats(name)
+        self.breaker = CircuitBreaker(
+            failure_threshold=MODEL_CIRCUIT_FAILURES,
+            recovery_timeout=MODEL_CIRCUIT_RECOVERY_SECONDS,
+            name=name,
+        )
+
+    @property
+    def available(self) -> bool:
+        return not self.breaker.opened
+
+    def _timed(self, fn: Callable, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.stats.record(None, False)
+            raise
+        self.stats.record(time.perf_counter() - start, True)
+        return result
+
+    async def _atimed(self, fn: Callable, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception:
+            self.stats.record(None, False)
+            raise
+        self.stats.record(time.perf_counter() - start, True)
+        return result
+
+    def _first_chunk(self, fn: Callable, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            stream = iter(fn(*args, **kwargs))
+            first = next(stream, _END)
+        except Exception:
+            self.stats.record(None, False)
+            raise
+        self.stats.record(time.perf_counter() - start, True, first_chunk=True)
+        return stream, first
+
+    async def _afirst_chunk(self, fn: Callable, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            stream = fn(*args, **kwargs).__aiter__()
+            try:
+                first = await stream.__anext__()
+            except StopAsyncIteration:
+                first = _END
+        except Exception:
+            self.stats.record(None, False)
+            raise
+        self.stats.record(time.perf_counter() - start, True, first_chunk=True)
+        return stream, first
+
+    def call(self, fn: Callable, *args, **kwargs):
+        try:
+            with span("model.route", route=self.name):
+                return self.breaker.call(self._timed, fn, *args, **kwargs)
+        finally:
+            MODEL_ROUTE_CIRCUIT_OPEN.labels(self.name).set(1 if self.breaker.opened else 0)
+
+    async def acall(self, fn: Callable, *args, **kwargs):
+        try:
+            with span("model.route", route=self.name):
+                return await self.breaker.call_async(self._atimed, fn, *args, **kwargs)
+        finally:
+            MODEL_ROUTE_CIRCUIT_OPEN.labels(self.name).set(1 if self.breaker.opened else 0)
+
+    def open_stream(self, fn: Callable, *args, **kwargs):
+        """Start a stream and wait for its first chunk; the breaker only judges the route up to that chunk"""
+        try:
+            with span("model.route", route=self.name, stream=True):
+                return self.breaker.call(self._first_chunk, fn, *args, **kwargs)
+        finally:
+            MODEL_ROUTE_CIRCUIT_OPEN.labels(self.name).set(1 if self.breaker.opened else 0)
+
+    async def aopen_stream(self, fn: Callable, *args, **kwargs):
+        try:
+            with span("model.route", route=self.name, stream=True):
+                return await self.breaker.call_async(self._afirst_chunk, fn, *args, **kwargs)
+        finally:
+            MODEL_ROUTE_CIRCUIT_OPEN.labels(self.name).set(1 if self.breaker.opened else 0)
+
+
+def _close_stream(stream) -> None:
+    close = getattr(stream, "close", None)
+    if close:
+        close()
+
+
+async def _aclose_stream(stream) -> None:
+    aclose = getattr(stream, "aclose", None)
+    if aclose:
+        await aclose()
+
+
+def _bind(route: ModelRoute, primary, method: str) -> Callable:
+    """The route's response method configured like the primary model for this call"""
+    if route.model is primary:
+        return getattr(primary, f"_unrouted_{method}")
+    model = copy_limited_model(route.model)
+    for attribute in AGENT_MODEL_ATTRIBUTES:
+        if hasattr(primary, attribute):
+            setattr(model, attribute, getattr(primary, attribute))
+    return getattr(model, method)
+
+
+class ModelRouter:
+    """
+    Routes agno model responses over a primary provider and its fallbacks.
+
+    Routes whose circuit is open are skipped; a failing route falls through to
+    the next one. With MODEL_HEDGING=1 a response still pending after the
+    primary's rolling p95 is duplicated on the next healthy route and the
+    first answer wins. Each attempt works on its own copy of the messages;
+    the winner's messages are written back for the agent.
+
+    Streams are routed the same way until their first chunk arrives (hedged
+    on the p95 of first-chunk latency); after that they stay on the winner.
+    """
+
+    def __init__(self, primary: ModelRoute, fallbacks: Callable[[], List[ModelRoute]]):
+        self.primary = primary
+        self._fallbacks = fallbacks
+        self._routes: Optional[List[ModelRoute]] = None
+        self._hedge_pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def routes(self) -> List[ModelRoute]:
+        # Fallback clients are built on first use, like the primary
+        if self._routes is None:
+            with self._lock:
+                if self._routes is None:
+                    self._routes = [self.primary] + self._fallbacks()
+        return self._routes
+
+    def _candidates(self) -> List[ModelRoute]:
+        healthy = [route for route in self.routes if route.available]
+        return healthy or self.routes
+
+    def _hedge_delay(self, route: ModelRoute, first_chunk: bool = False) -> Optional[float]:
+        if not MODEL_HEDGING:
+            return None
+        return route.stats.percentile(0.95, MODEL_HEDGE_MIN_SAMPLES, first_chunk=first_chunk)
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(max_workers=MODEL_HEDGE_MAX_THREADS, thread_name_prefix="model-hedge")
+            return self._hedge_pool
+
+    def _attempt(self, route: ModelRoute, method: str, messages: list, kwargs: dict):
+        attempt_messages = copy.deepcopy(messages)
+        result = route.call(_bind(route, self.primary.model, method), messages=attempt_messages, **kwargs)
+        return result, attempt_messages
+
+    async def _aattempt(self, route: ModelRoute, method: str, messages: list, kwargs: dict):
+        attempt_messages = copy.deepcopy(messages)
+        result = await route.acall(_bind(route, self.primary.model, method), messages=attempt_messages, **kwargs)
+        return result, attempt_messages
+
+    def _open_stream(self, route: ModelRoute, method: str, messages: list, kwargs: dict):
+        attempt_messages = copy.deepcopy(messages)
+        stream, first = route.open_stream(_bind(route, self.primary.model, method), messages=attempt_messages, **kwargs)
+        return stream, first, attempt_messages
+
+    async def _aopen_stream(self, route: ModelRoute, method: str, messages: list, kwargs: dict):
+        attempt_messages = copy.deepcopy(messages)
+        stream, first = await route.aopen_stream(_bind(route, self.primary.model, method), messages=attempt_messages, **kwargs)
+        return stream, first, attempt_messages
+
+    def _hedged(self, first: ModelRoute, second: ModelRoute, delay: float, method: str, messages: list, kwargs: dict,
+                attempt: Optional[Callable] = None, discard: Optional[Callable] = None):
+        """
+        Race first against second once delay has passed. attempt defaults to a
+        full response; discard cleans up a losing attempt's result.
+        """
+        pool = self._pool()
+        attempt = attempt or self._attempt
+        # Each attempt runs in a copy of the caller's context, so its spans join the run trace
+        submit = lambda route: pool.submit(contextvars.copy_context().run, attempt, route, method, messages, kwargs)
+        futures = {submit(first): first}
+        done, _ = wait(list(futures), timeout=delay)
+        if not done:
+            futures[submit(second)] = second
+        errors = []
+        while futures:
+            done, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+            for future in done:
+                route = futures.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                # A slower duplicate keeps running on its thread; its answer is discarded
+                if len(futures) or route is second:
+                    MODEL_ROUTE_HEDGES.labels(route.name).inc()
+                if discard:
+                    for loser in futures:
+                        loser.add_done_callback(lambda f: f.exception() is None and discard(f.result()))
+                return route, result
+        raise errors[-1]
+
+    async def _ahedged(self, first: ModelRoute, second: ModelRoute, delay: float, method: str, messages: list, kwargs: dict,
+                       attempt: Optional[Callable] = None, discard: Optional[Callable] = None):
+        attempt = attempt or self._aattempt
+        tasks = {asyncio.ensure_future(attempt(first, method, messages, kwargs)): first}
+        done, _ = await asyncio.wait(list(tasks), timeout=delay)
+        if not done:
+            tasks[asyncio.ensure_future(attempt(second, method, messages, kwargs))] = second
+        errors = []
+        try:
+            while tasks:
+                done, _ = await asyncio.wait(list(tasks), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    route = tasks.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        errors.append(e)
+                        continue
+                    if len(tasks) or route is second:
+                        MODEL_ROUTE_HEDGES.labels(route.name).inc()
+                    if discard:
+                        # A duplicate finishing in the same wakeup is not cancelled below
+                        for loser in done:
+                            if loser in tasks and loser.exception() is None:
+                                await discard(loser.result())
+                    return route, result
+        finally:
+            for task in tasks:
+                task.cancel()
+        raise errors[-1]
+
+    def response(self, method: str, messages: list, **kwargs):
+        candidates = self._candidates()
+        error: Optional[Exception] = None
+        for index, route in enumerate(candidates):
+            delay = self._hedge_delay(route) if index + 1 < len(candidates) else None
+            try:
+                if delay is not None:
+                    winner, (result, attempt_messages) = self._hedged(
+                        route, candidates[index + 1], delay, method, messages, kwargs
+                    )
+                else:
+                    winner, (result, attempt_messages) = route, self._attempt(route, method, messages, kwargs)
+            except Exception as e:
+                logger.warning(f"Model route {route.name} failed: {str(e)}")
+                error = e
+                continue
+            if winner is not self.primary:
+                _record_fallback(winner)
+            messages[:] = attempt_messages
+            return result
+        raise error
+
+    async def aresponse(self, method: str, messages: list, **kwargs):
+        candidates = self._candidates()
+        error: Optional[Exception] = None
+        for index, route in enumerate(candidates):
+            delay = self._hedge_delay(route) if index + 1 < len(candidates) else None
+            try:
+                if delay is not None:
+                    winner, (result, attempt_messages) = await self._ahedged(
+                        route, candidates[index + 1], delay, method, messages, kwargs
+                    )
+                else:
+                    winner, (result, attempt_messages) = route, await self._aattempt(route, method, messages, kwargs)
+            except Exception as e:
+                logger.warning(f"Model route {route.name} failed: {str(e)}")
+                error = e
+                continue
+            if winner is not self.primary:
+                _record_fallback(winner)
+            messages[:] = attempt_messages
+            return result
+        raise error
+
+
+    def response_stream(self, method: str, messages: list, **kwargs):
+        candidates = self._candidates()
+        error: Optional[Exception] = None
+        for index, route in enumerate(candidates):
+            delay = self._hedge_delay(route, first_chunk=True) if index + 1 < len(candidates) else None
+            try:
+                if delay is not None:
+                    winner, (stream, first, attempt_messages) = self._hedged(
+                        route, candidates[index + 1], delay, method, messages, kwargs,
+                        attempt=self._open_stream, discard=lambda opened: _close_stream(opened[0])
+                    )
+                else:
+                    winner, (stream, first, attempt_messages) = route, self._open_stream(route, method, messages, kwargs)
+            except Exception as e:
+                logger.warning(f"Model route {route.name} failed: {str(e)}")
+                error = e
+                continue
+            if winner is not self.primary:
+                _record_fallback(winner)
+            # From the first chunk on the stream stays on the winner; later errors reach the agent
+            try:
+                if first is not _END:
+                    yield first
+                yield from stream
+            finally:
+                _close_stream(stream)
+                messages[:] = attempt_messages
+            return
+        raise error
+
+    async def aresponse_stream(self, method: str, messages: list, **kwargs):
+        candidates = self._candidates()
+        error: Optional[Exception] = None
+        for index, route in enumerate(candidates):
+            delay = self._hedge_delay(route, first_chunk=True) if index + 1 < len(candidates) else None
+            try:
+                if delay is not None:
+                    winner, (stream, first, attempt_messages) = await self._ahedged(
+                        route, candidates[index + 1], delay, method, messages, kwargs,
+                        attempt=self._aopen_stream, discard=lambda opened: _aclose_stream(opened[0])
+                    )
+                else:
+                    winner, (stream, first, attempt_messages) = route, await self._aopen_stream(route, method, messages, kwargs)
+            except Exception as e:
+                logger.warning(f"Model route {route.name} failed: {str(e)}")
+                error = e
+                continue
+            if winner is not self.primary:
+                _record_fallback(winner)
+            try:
+                if first is not _END:
+                    yield first
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                await _aclose_stream(stream)
+                messages[:] = attempt_messages
+            return
+        raise error
+
+
+def route_model(model, name: str, fallbacks: Callable[[], List[Tuple[str, object]]]):
+    """
+    Put an agno model behind a ModelRouter. fallbacks returns (name, model)
+    pairs and is only called on the first response. Streams are routed until
+    their first chunk and then stay on the model that produced it.
+    """
+    router = ModelRouter(ModelRoute(name, model), lambda: [ModelRoute(n, m) for n, m in fallbacks()])
+    model._unrouted_response = model.response
+    model._unrouted_aresponse = model.aresponse
+    model._unrouted_response_stream = model.response_stream
+    model._unrouted_aresponse_stream = model.aresponse_stream
+    model.response = lambda messages, **kwargs: router.response("response", messages, **kwargs)
+    model.aresponse = lambda messages, **kwargs: router.aresponse("aresponse", messages, **kwargs)
+    model.response_stream = lambda messages, **kwargs: router.response_stream("response_stream", messages, **kwargs)
+    model.aresponse_stream = lambda messages, **kwargs: router.aresponse_stream("aresponse_stream", messages, **kwargs)
+    model.router = router
+    return model
@@ -0,0 +1,67 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(created_at: datetime, row_id: uuid.UUID) -> str:
+    """Opaque cursor pointing just past the row with this (created_at, id)"""
+    raw = json.dumps([created_at.isoformat(), str(row_id)]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """Inverse of encode_cursor; raises ValueError for anything it did not produce"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), uuid.UUID(row_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def _after_cursor(created_at_column, id_column, cursor: str):
+    created_at, row_id = decode_cursor(cursor)
+    return tuple_(created_at_column, id_column) < tuple_(created_at, row_id)
+
+
+def _page(rows: List, created_at_column, id_column, limit: int) -> Tuple[List, Optional[str]]:
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, created_at_column.key), getattr(last, id_column.key))
+
+
+def keyset_paginate(query, created_at_column, id_column, cursor: Optional[str], limit: int) -> Tuple[List, Optional[str]]:
+    """
+    Newest-first page of query seeking on (created_at, id) instead of OFFSET,
+    so every page costs one index range scan. Returns (rows, next_cursor).
+    """
+    if cursor:
+        query = query.filter(_after_cursor(created_at_column, id_column, cursor))
+
+    rows = query.order_by(created_at_column.desc(), id_column.desc()).limit(limit + 1).all()
+    return _page(rows, created_at_column, id_column, limit)
+
+
+async def akeyset_paginate(
+    db: AsyncSession, statement, created_at_column, id_column, cursor: Optional[str], limit: int
+) -> Tuple[List, Optional[str]]:
+    """keyset_paginate for a select() statement on an AsyncSession"""
+    if cursor:
+        statement = statement.where(_after_cursor(created_at_column, id_column, cursor))
+
+    result = await db.execute(statement.order_by(created_at_column.desc(), id_column.desc()).limit(limit + 1))
+    # select(Model) pages hold the instances, column selects the rows
+    descriptions = statement.column_descriptions
+    entity_select = len(descriptions) == 1 and isinstance(descriptions[0]["expr"], type)
+    rows = result.scalars().all() if entity_select else result.all()
+    return _page(rows, created_at_column, id_column, limit)
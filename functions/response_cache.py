@@ -0,0 +1,153 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from prometheus_client import Counter
+
+import database
+from models.workflow import ResponseCacheEntry
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_MEMORY_SIZE = int(os.getenv("RESPONSE_CACHE_MEMORY_SIZE", "1024"))
+# Entities opt in with data["cache_ttl"] (seconds); this default applies to entities that don't set it
+RESPONSE_CACHE_DEFAULT_TTL = int(os.getenv("RESPONSE_CACHE_DEFAULT_TTL", "0"))
+RESPONSE_CACHE_PERSISTENT = os.getenv("RESPONSE_CACHE_PERSISTENT", "1") == "1"
+
+RESPONSE_CACHE_LOOKUPS = Counter(
+    "workflow_response_cache_lookups_total", "Response cache lookups", ["tier", "result"]
+)
+RESPONSE_CACHE_WRITES = Counter("workflow_response_cache_writes_total", "Responses stored in the cache")
+
+
+def response_cache_key(
+    model_id: str, instructions, prompt: Optional[str], input_text: str, context: Optional[str] = None
+) -> str:
+    """context identifies the budget the input is fitted to; unbudgeted nodes keep their former keys"""
+    input_hash = hashlib.sha256(input_text.encode("utf-8")).hexdigest()
+    parts = [model_id, instructions, prompt, input_hash] + ([context] if context is not None else [])
+    material = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def entity_cache_ttl(data: Optional[dict]) -> int:
+    """Seconds a response of this entity may be reused; 0 disables caching"""
+    if data and data.get("cache_ttl") is not None:
+        return int(data["cache_ttl"])
+    return RESPONSE_CACHE_DEFAULT_TTL
+
+
+class ResponseCache:
+    """
+    Two-tier memo of agent responses: an in-process LRU in front of the
+    response_cache table, so all workers and restarts share the persistent tier.
+    """
+
+    def __init__(self, max_size: int = RESPONSE_CACHE_MEMORY_SIZE, persistent: bool = RESPONSE_CACHE_PERSISTENT):
+        self.max_size = max_size
+        self.persistent = persistent
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            text, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return text
+
+    def _memory_put(self, key: str, text: str, expires_at: float):
+        with self._lock:
+            self._entries[key] = (text, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _lookup(self, key: str, entry: Optional[ResponseCacheEntry]) -> Optional[str]:
+        RESPONSE_CACHE_LOOKUPS.labels(tier="memory", result="miss").inc()
+        if entry is None or entry.expires_at < datetime.utcnow():
+            RESPONSE_CACHE_LOOKUPS.labels(tier="postgres", result="miss").inc()
+            return None
+        RESPONSE_CACHE_LOOKUPS.labels(tier="postgres", result="hit").inc()
+        self._memory_put(key, entry.response_text, time.time() + (entry.expires_at - datetime.utcnow()).total_seconds())
+        return entry.response_text
+
+    def get(self, key: str) -> Optional[str]:
+        text = self._memory_get(key)
+        if text is not None:
+            RESPONSE_CACHE_LOOKUPS.labels(tier="memory", result="hit").inc()
+            return text
+        if not self.persistent:
+            RESPONSE_CACHE_LOOKUPS.labels(tier="memory", result="miss").inc()
+            return None
+
+        db = database.SessionLocal()
+        try:
+            return self._lookup(key, db.get(ResponseCacheEntry, key))
+        finally:
+            db.close()
+
+    async def aget(self, key: str) -> Optional[str]:
+        text = self._memory_get(key)
+        if text is not None:
+            RESPONSE_CACHE_LOOKUPS.labels(tier="memory", result="hit").inc()
+            return text
+        if not self.persistent:
+            RESPONSE_CACHE_LOOKUPS.labels(tier="memory", result="miss").inc()
+            return None
+
+        async with database.async_session() as db:
+            return self._lookup(key, await db.get(ResponseCacheEntry, key))
+
+    def _entry(self, key: str, model_id: str, text: str, ttl: int) -> ResponseCacheEntry:
+        now = datetime.utcnow()
+        return ResponseCacheEntry(
+            key=key,
+            model_id=model_id,
+            response_text=text,
+            created_at=now,
+            expires_at=now + timedelta(seconds=ttl),
+        )
+
+    def put(self, key: str, model_id: str, text: str, ttl: int):
+        self._memory_put(key, text, time.time() + ttl)
+        RESPONSE_CACHE_WRITES.inc()
+        if not self.persistent:
+            return
+        db = database.SessionLocal()
+        try:
+            db.merge(self._entry(key, model_id, text, ttl))
+            db.commit()
+        except Exception as e:
+            # The cache is an optimisation; a failed write must not fail the node
+            logger.error(f"Could not persist cached response: {str(e)}")
+            db.rollback()
+        finally:
+            db.close()
+
+    async def aput(self, key: str, model_id: str, text: str, ttl: int):
+        self._memory_put(key, text, time.time() + ttl)
+        RESPONSE_CACHE_WRITES.inc()
+        if not self.persistent:
+            return
+        async with database.async_session() as db:
+            try:
+                await db.merge(self._entry(key, model_id, text, ttl))
+                await db.commit()
+            except Exception as e:
+                logger.error(f"Could not persist cached response: {str(e)}")
+                await db.rollback()
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,84 @@
+import gzip
+import hashlib
+import logging
+import os
+from typing import List, Tuple
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.workflow import RunPayload
+
+try:
+    import zstandard
+except ImportError:  # optional; payloads fall back to gzip
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# "zstd", "gzip" or "none" for new payloads; stored rows keep the codec they were written with
+RUN_PAYLOAD_CODEC = os.getenv("RUN_PAYLOAD_CODEC", "zstd" if zstandard else "gzip")
+RUN_PAYLOAD_COMPRESS_MIN_BYTES = int(os.getenv("RUN_PAYLOAD_COMPRESS_MIN_BYTES", "256"))
+RUN_PAYLOAD_ZSTD_LEVEL = int(os.getenv("RUN_PAYLOAD_ZSTD_LEVEL", "9"))
+
+
+def payload_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def compress_payload(text: str, codec: str = RUN_PAYLOAD_CODEC) -> Tuple[str, bytes]:
+    """(codec, bytes) of a payload; short texts are not worth a compression frame"""
+    raw = text.encode("utf-8")
+    if len(raw) < RUN_PAYLOAD_COMPRESS_MIN_BYTES or codec == "none":
+        return "none", raw
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("RUN_PAYLOAD_CODEC=zstd requires the zstandard package")
+        return "zstd", zstandard.ZstdCompressor(level=RUN_PAYLOAD_ZSTD_LEVEL).compress(raw)
+    if codec == "gzip":
+        return "gzip", gzip.compress(raw, mtime=0)
+    raise ValueError(f"Unknown run payload codec: {codec}")
+
+
+def decompress_payload(codec: str, data: bytes) -> str:
+    if codec == "none":
+        raw = data
+    elif codec == "gzip":
+        raw = gzip.decompress(data)
+    elif codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Reading zstd run payloads requires the zstandard package")
+        raw = zstandard.ZstdDecompressor().decompress(data)
+    else:
+        raise ValueError(f"Unknown run payload codec: {codec}")
+    return bytes(raw).decode("utf-8")
+
+
+def payload_row(text: str) -> dict:
+    """run_payloads values of a text"""
+    codec, data = compress_payload(text, RUN_PAYLOAD_CODEC)
+    return {"hash": payload_hash(text), "codec": codec, "size": len(text.encode("utf-8")), "data": data}
+
+
+def payloads_insert(dialect_name: str, rows: List[dict]):
+    """Multi-row INSERT of payloads that skips the ones already stored"""
+    dialect = postgresql if dialect_name == "postgresql" else sqlite
+    return dialect.insert(RunPayload).values(rows).on_conflict_do_nothing(index_elements=["hash"])
+
+
+def _payload_insert(dialect_name: str, text: str):
+    """INSERT of a payload that is a no-op when the same content is already stored"""
+    return payloads_insert(dialect_name, [payload_row(text)])
+
+
+def store_payload(db: Session, text: str) -> str:
+    """Store a run input/output once and return the hash the run rows reference"""
+    db.execute(_payload_insert(db.get_bind().dialect.name, text))
+    return payload_hash(text)
+
+
+async def astore_payload(db: AsyncSession, text: str) -> str:
+    """Async variant of store_payload"""
+    await db.execute(_payload_insert(db.get_bind().dialect.name, text))
+    return payload_hash(text)
@@ -0,0 +1,270 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Union
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+import database
+from models.workflow import RunJob, WorkflowRun
+from functions.wf_agents import run_workflow
+from functions.tracing import record_span, span, trace_run
+
+logger = logging.getLogger(__name__)
+
+RUN_QUEUE_WORKERS = int(os.getenv("RUN_QUEUE_WORKERS", "4"))
+RUN_QUEUE_MAX_DEPTH = int(os.getenv("RUN_QUEUE_MAX_DEPTH", "1000"))
+RUN_QUEUE_PER_WORKFLOW_LIMIT = int(os.getenv("RUN_QUEUE_PER_WORKFLOW_LIMIT", "2"))
+RUN_QUEUE_POLL_INTERVAL = float(os.getenv("RUN_QUEUE_POLL_INTERVAL", "1.0"))
+RUN_QUEUE_LEASE_SECONDS = int(os.getenv("RUN_QUEUE_LEASE_SECONDS", "300"))
+RUN_QUEUE_MAX_ATTEMPTS = int(os.getenv("RUN_QUEUE_MAX_ATTEMPTS", "3"))
+# Claims retried in one poll after losing a race to another worker
+RUN_QUEUE_CLAIM_ATTEMPTS = int(os.getenv("RUN_QUEUE_CLAIM_ATTEMPTS", "3"))
+
+
+class QueueFullError(Exception):
+    """Raised when the run queue has reached RUN_QUEUE_MAX_DEPTH queued jobs."""
+
+
+async def enqueue_run(
+    db: AsyncSession,
+    workflow_id: uuid.UUID,
+    run_id: uuid.UUID,
+    input_text: str,
+    agent_prompts: Optional[Union[List[str], Dict[str, str]]] = None,
+    bypass_cache: bool = False
+) -> RunJob:
+    """Persist a queued job for the worker pool, refusing it when the queue is full"""
+    depth = (await db.execute(
+        select(func.count(RunJob.id)).where(RunJob.status == "queued")
+    )).scalar()
+    if depth >= RUN_QUEUE_MAX_DEPTH:
+        raise QueueFullError(f"Run queue is full ({depth} queued jobs)")
+
+    job = RunJob(
+        id=run_id,
+        workflow_id=workflow_id,
+        input_text=input_text,
+        agent_prompts=agent_prompts,
+        bypass_cache=bypass_cache,
+        status="queued",
+        attempts=0,
+    )
+    db.add(job)
+    # The run header exists from the start so status polling sees queued runs
+    db.add(WorkflowRun(id=run_id, workflow_id=workflow_id, status="queued"))
+    await db.commit()
+    return job
+
+
+async def claim_next_job(db: AsyncSession, worker_id: str) -> Optional[RunJob]:
+    """
+    Claim the oldest queued job whose workflow is below its concurrency limit.
+    The claim is a conditional UPDATE that only succeeds while the job is still queued
+    and its workflow still has a free slot, so concurrent workers (and replicas) never
+    claim the same row or overrun RUN_QUEUE_PER_WORKFLOW_LIMIT.
+    """
+    running = aliased(RunJob)
+    processing = (
+        select(func.count(running.id))
+        .where(running.workflow_id == RunJob.workflow_id, running.status == "processing")
+        .scalar_subquery()
+    )
+    postgres = db.bind.dialect.name == "postgresql"
+
+    for _ in range(RUN_QUEUE_CLAIM_ATTEMPTS):
+        candidate = select(RunJob.id, RunJob.workflow_id).where(
+            RunJob.status == "queued",
+            processing < RUN_QUEUE_PER_WORKFLOW_LIMIT
+        ).order_by(RunJob.created_at).limit(1)
+        if postgres:
+            candidate = candidate.with_for_update(of=RunJob, skip_locked=True)
+        row = (await db.execute(candidate)).first()
+        if not row:
+            await db.rollback()
+            return None
+
+        job_id, workflow_id = row
+        if postgres:
+            # Serialises claims per workflow so the slot count below sees every committed claim
+            await db.execute(select(func.pg_advisory_xact_lock(func.hashtext(str(workflow_id)))))
+
+        now = datetime.utcnow()
+        result = await db.execute(
+            update(RunJob)
+            .where(
+                RunJob.id == job_id,
+                RunJob.status == "queued",
+                processing < RUN_QUEUE_PER_WORKFLOW_LIMIT
+            )
+            .values(
+                status="processing",
+                attempts=RunJob.attempts + 1,
+                worker_id=worker_id,
+                started_at=now,
+                lease_expires_at=now + timedelta(seconds=RUN_QUEUE_LEASE_SECONDS)
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        if result.rowcount == 1:
+            return await db.get(RunJob, job_id, populate_existing=True)
+        # Another worker claimed the job or filled the workflow's last slot first
+
+    return None
+
+
+async def renew_lease(db: AsyncSession, job_id: uuid.UUID, worker_id: str) -> None:
+    """Extend the lease of a job this worker is still processing"""
+    await db.execute(
+        update(RunJob)
+        .where(
+            RunJob.id == job_id,
+            RunJob.worker_id == worker_id,
+            RunJob.status == "processing"
+        )
+        .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=RUN_QUEUE_LEASE_SECONDS))
+    )
+    await db.commit()
+
+
+async def requeue_expired_jobs(db: AsyncSession) -> int:
+    """
+    Return jobs whose worker died mid-run (lease expired) to the queue.
+    Jobs that already used up RUN_QUEUE_MAX_ATTEMPTS are marked failed instead.
+    """
+    expired = (await db.execute(
+        select(RunJob)
+        .where(
+            RunJob.status == "processing",
+            RunJob.lease_expires_at < datetime.utcnow()
+        )
+        .with_for_update(skip_locked=True)
+    )).scalars().all()
+
+    for job in expired:
+        if job.attempts >= RUN_QUEUE_MAX_ATTEMPTS:
+            job.status = "failed"
+            job.error = f"Abandoned after {job.attempts} attempts"
+            job.finished_at = datetime.utcnow()
+        else:
+            job.status = "queued"
+        job.worker_id = None
+        job.lease_expires_at = None
+        await _sync_run_header(db, job)
+    await db.commit()
+
+    if expired:
+        logger.warning(f"Recovered {len(expired)} run jobs with expired leases")
+    return len(expired)
+
+
+async def _sync_run_header(db: AsyncSession, job: RunJob) -> None:
+    """Carry a queue-side status change over to a run header the executor did not finish"""
+    values = {"status": job.status}
+    if job.status == "failed":
+        values["finished_at"] = datetime.utcnow()
+    await db.execute(
+        update(WorkflowRun)
+        .where(
+            WorkflowRun.id == job.id,
+            WorkflowRun.status.in_(["queued", "processing"])
+        )
+        .values(**values)
+    )
+
+
+async def execute_job(db: AsyncSession, job: RunJob) -> None:
+    """Run a claimed job to completion and record the outcome"""
+    with trace_run("run_job", job.id, workflow_id=str(job.workflow_id), attempt=job.attempts, worker_id=job.worker_id):
+        # Time between enqueueing and this claim
+        record_span("run.queued", job.created_at, job.started_at or datetime.utcnow())
+        try:
+            await run_workflow(job.workflow_id, job.input_text, job.id, job.agent_prompts, job.bypass_cache)
+            job.status = "completed"
+            job.error = None
+        except Exception as e:
+            logger.error(f"Run job {job.id} failed: {str(e)}")
+            job.status = "failed"
+            job.error = str(e)
+            await _sync_run_header(db, job)
+
+        job.finished_at = datetime.utcnow()
+        job.lease_expires_at = None
+        with span("db.finish_job", status=job.status):
+            await db.commit()
+
+
+async def _with_session(fn, *args):
+    async with database.async_session() as db:
+        return await fn(db, *args)
+
+
+class RunWorkerPool:
+    """
+    Bounded pool of asyncio workers pulling run jobs from the database queue.
+    Each worker executes one run at a time on the configured execution path.
+    """
+
+    def __init__(self, size: int = RUN_QUEUE_WORKERS):
+        self.size = size
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        await _with_session(requeue_expired_jobs)
+        self._tasks = [asyncio.create_task(self._worker_loop(i)) for i in range(self.size)]
+        self._tasks.append(asyncio.create_task(self._reaper_loop()))
+        logger.info(f"Run worker pool started with {self.size} workers ({self.worker_id})")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Run worker pool stopped")
+
+    async def _worker_loop(self, index: int):
+        while True:
+            try:
+                async with database.async_session() as db:
+                    job = await claim_next_job(db, self.worker_id)
+                    if job is None:
+                        await asyncio.sleep(RUN_QUEUE_POLL_INTERVAL)
+                        continue
+
+                    logger.info(f"Worker {index} picked up run {job.id}")
+                    heartbeat = asyncio.create_task(self._heartbeat_loop(job.id))
+                    try:
+                        await execute_job(db, job)
+                    finally:
+                        heartbeat.cancel()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Run worker {index} error: {str(e)}")
+                await asyncio.sleep(RUN_QUEUE_POLL_INTERVAL)
+
+    async def _heartbeat_loop(self, job_id: uuid.UUID):
+        while True:
+            await asyncio.sleep(RUN_QUEUE_LEASE_SECONDS / 3)
+            try:
+                await _with_session(renew_lease, job_id, self.worker_id)
+            except Exception as e:
+                logger.error(f"Could not renew lease for run {job_id}: {str(e)}")
+
+    async def _reaper_loop(self):
+        while True:
+            await asyncio.sleep(RUN_QUEUE_LEASE_SECONDS / 2)
+            try:
+                await _with_session(requeue_expired_jobs)
+            except Exception as e:
+                logger.error(f"Run queue reaper error: {str(e)}")
+
+
+run_worker_pool = RunWorkerPool()
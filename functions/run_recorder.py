@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Optional, Set, Tuple, Union
+
+from prometheus_client import Counter, Histogram
+from sqlalchemy import bindparam
+from sqlalchemy.dialects import postgresql, sqlite
+
+import database
+from models.workflow import WorkflowRun, RunStep
+from functions.run_payloads import payload_hash, payload_row, payloads_insert
+from functions.run_retention import is_partitioned
+from functions.tracing import span
+
+logger = logging.getLogger(__name__)
+
+RUN_RECORDER_FLUSH_INTERVAL = float(os.getenv("RUN_RECORDER_FLUSH_INTERVAL", "0.5"))
+# Pending run/step transitions that trigger a flush before the interval is up
+RUN_RECORDER_MAX_PENDING = int(os.getenv("RUN_RECORDER_MAX_PENDING", "500"))
+
+RUN_RECORDER_FLUSHES = Counter("workflow_run_recorder_flushes_total", "Batched run state flushes", ["result"])
+RUN_RECORDER_FLUSH_ROWS = Counter(
+    "workflow_run_recorder_flush_rows_total", "Rows written by run state flushes", ["table"]
+)
+RUN_RECORDER_FLUSH_SECONDS = Histogram("workflow_run_recorder_flush_seconds", "Duration of a run state flush")
+
+RUN_HEADER_FIELDS = (
+    "status", "total_steps", "completed_steps", "failed_steps", "cache_hits", "started_at", "finished_at"
+)
+RUN_STEP_COLUMNS = (
+    "run_id", "entity_id", "run_created_at", "input_hash", "output_hash",
+    "status", "cache_hit", "created_at", "finished_at", "input_tokens", "context_tokens", "output_tokens"
+)
+
+StepKey = Tuple[uuid.UUID, uuid.UUID]
+
+
+class RunStateRecorder:
+    """
+    Write-behind buffer for run status transitions.
+
+    Executors record run header and step states here instead of committing
+    each transition. Dirty states are written in one transaction of batched
+    statements (payload insert, step upsert, header update) every
+    RUN_RECORDER_FLUSH_INTERVAL, once RUN_RECORDER_MAX_PENDING transitions
+    are waiting, and whenever an executor finishes or fails a run.
+    Until a state is written, run_state/step_states serve it as an overlay
+    over the database rows, so status polling on this process stays fresh.
+    """
+
+    def __init__(self):
+        # Run headers are keyed by run id, steps by (run id, entity id); a state leaves
+        # the overlay once the version that was written is still the latest
+        self._states: Dict[Union[uuid.UUID, StepKey], dict] = {}
+        self._versions: Dict[Union[uuid.UUID, StepKey], int] = {}
+        self._dirty: Set[Union[uuid.UUID, StepKey]] = set()
+        self._lock = threading.Lock()
+        # Serialises flushes so an older snapshot is never written after a newer one
+        self._flush_lock = threading.Lock()
+        self._flush_tasks: Set[asyncio.Task] = set()
+        self._step_conflict: Optional[list] = None
+
+    def record_run(self, state: dict) -> None:
+        """Record the header of a run; state holds "id" and the WorkflowRun columns"""
+        with self._lock:
+            self._states[state["id"]] = dict(state)
+            self._touch(state["id"])
+        self._flush_if_full()
+
+    def record_step(self, state: dict) -> None:
+        """Record a step; state holds the RunStep columns with input_text/output_text instead of hashes"""
+        state = dict(state)
+        state["input_hash"] = payload_hash(state["input_text"])
+        state["output_hash"] = payload_hash(state["output_text"]) if state.get("output_text") is not None else None
+        key = (state["run_id"], state["entity_id"])
+        with self._lock:
+            self._states[key] = state
+            self._touch(key)
+        self._flush_if_full()
+
+    def _touch(self, key) -> None:
+        self._versions[key] = self._versions.get(key, 0) + 1
+        self._dirty.add(key)
+
+    @property
+    def pending(self) -> int:
+        return len(self._dirty)
+
+    def run_state(self, run_id: uuid.UUID) -> Optional[dict]:
+        """Header of a run not written yet, None when the database is up to date"""
+        with self._lock:
+            state = self._states.get(run_id)
+            return dict(state) if state else None
+
+    def step_states(self, run_id: uuid.UUID) -> Dict[uuid.UUID, dict]:
+        """Steps of a run not written yet, by entity id"""
+        with self._lock:
+            return {
+                key[1]: dict(state) for key, state in self._states.items()
+                if isinstance(key, tuple) and key[0] == run_id
+            }
+
+    def _flush_if_full(self) -> None:
+        if self.pending < RUN_RECORDER_MAX_PENDING:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Executor threads flush inline
+            self.flush()
+            return
+        task = loop.create_task(self.aflush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    def _step_conflict_columns(self, db) -> list:
+        # Partitioned run_steps are keyed on the partition key as well
+        if self._step_conflict is None:
+            self._step_conflict = ["run_id", "entity_id"] + (["run_created_at"] if is_partitioned(db) else [])
+        return self._step_conflict
+
+    def flush(self) -> int:
+        """Write every pending transition; returns the number of states written"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return 0
+                keys = list(self._dirty)
+                self._dirty.clear()
+                snapshot = {key: (self._versions[key], dict(self._states[key])) for key in keys}
+
+            start = time.perf_counter()
+            try:
+                # Part of the trace of the run whose executor triggered the flush
+                with span("db.recorder_flush", states=len(snapshot)):
+                    self._write(snapshot)
+            except Exception:
+                RUN_RECORDER_FLUSHES.labels("error").inc()
+                with self._lock:
+                    self._dirty.update(snapshot)
+                raise
+            RUN_RECORDER_FLUSH_SECONDS.observe(time.perf_counter() - start)
+            RUN_RECORDER_FLUSHES.labels("ok").inc()
+
+            with self._lock:
+                for key, (version, _) in snapshot.items():
+                    if self._versions.get(key) == version and key not in self._dirty:
+                        del self._versions[key]
+                        del self._states[key]
+            return len(snapshot)
+
+    async def aflush(self) -> int:
+        """flush on a worker thread, for callers on the event loop"""
+        return await asyncio.to_thread(self.flush)
+
+    def _write(self, snapshot: dict) -> None:
+        runs = [state for key, (_, state) in snapshot.items() if not isinstance(key, tuple)]
+        steps = [state for key, (_, state) in snapshot.items() if isinstance(key, tuple)]
+
+        payloads = {}
+        for step in steps:
+            for text in (step["input_text"], step.get("output_text")):
+                if text is not None:
+                    payloads.setdefault(payload_hash(text), text)
+
+        db = database.SessionLocal()
+        try:
+            dialect_name = db.get_bind().dialect.name
+            if payloads:
+                db.execute(payloads_insert(dialect_name, [payload_row(text) for text in payloads.values()]))
+            if steps:
+                dialect = postgresql if dialect_name == "postgresql" else sqlite
+                statement = dialect.insert(RunStep.__table__).values(
+                    [{column: step.get(column) for column in RUN_STEP_COLUMNS} for step in steps]
+                )
+                db.execute(statement.on_conflict_do_update(
+                    index_elements=self._step_conflict_columns(db),
+                    set_={
+                        column: statement.excluded[column]
+                        for column in (
+                            "input_hash", "output_hash", "status", "cache_hit", "finished_at",
+                            "input_tokens", "context_tokens", "output_tokens",
+                        )
+                    },
+                ))
+            if runs:
+                table = WorkflowRun.__table__
+                # created_at narrows the update down to the run's partition
+                db.execute(
+                    table.update()
+                    .where(table.c.id == bindparam("b_id"), table.c.created_at == bindparam("b_created_at"))
+                    .values({field: bindparam(f"b_{field}") for field in RUN_HEADER_FIELDS}),
+                    [
+                        {"b_id": run["id"], "b_created_at": run["created_at"], **{f"b_{field}": run[field] for field in RUN_HEADER_FIELDS}}
+                        for run in runs
+                    ]
+                )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        RUN_RECORDER_FLUSH_ROWS.labels("run_payloads").inc(len(payloads))
+        RUN_RECORDER_FLUSH_ROWS.labels("run_steps").inc(len(steps))
+        RUN_RECORDER_FLUSH_ROWS.labels("workflow_runs").inc(len(runs))
+
+
+run_recorder = RunStateRecorder()
+
+
+async def run_recorder_loop():
+    """Interval flush of the run state recorder, started from the app lifespan"""
+    while True:
+        await asyncio.sleep(RUN_RECORDER_FLUSH_INTERVAL)
+        if not run_recorder.pending:
+            continue
+        try:
+            await run_recorder.aflush()
+        except Exception as e:
+            logger.error(f"Run state flush failed, retrying: {str(e)}")
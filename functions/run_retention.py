@@ -0,0 +1,408 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+import uuid
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional
+
+from sqlalchemy import delete, exists, or_, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, selectinload
+
+import database
+from models.workflow import WorkflowRun, RunStep, RunPayload, RunArchive
+from functions.run_payloads import store_payload
+
+logger = logging.getLogger(__name__)
+
+# Months of run history kept in the database; 0 disables archiving
+RUN_RETENTION_MONTHS = int(os.getenv("RUN_RETENTION_MONTHS", "6"))
+RUN_ARCHIVE_DIR = os.getenv("RUN_ARCHIVE_DIR", "run_archive")
+# Monthly partitions created ahead of time so inserts never land in the DEFAULT partition
+RUN_PARTITIONS_AHEAD = int(os.getenv("RUN_PARTITIONS_AHEAD", "2"))
+RUN_RETENTION_INTERVAL = float(os.getenv("RUN_RETENTION_INTERVAL", "3600"))
+# Re-hydrated runs are removed again after this many hours (they stay in the archive)
+RUN_REHYDRATED_TTL_HOURS = float(os.getenv("RUN_REHYDRATED_TTL_HOURS", "24"))
+RUN_ARCHIVE_BATCH_SIZE = 500
+
+# Partitioned table -> partition key; steps are detached before the runs they reference
+PARTITIONED_TABLES = {"run_steps": "run_created_at", "workflow_runs": "created_at"}
+PARTITION_NAME = re.compile(r"_y(\d{4})m(\d{2})$")
+# Rows outside the monthly partitions, e.g. inserted before their month was created, land here
+DEFAULT_PARTITIONS = {table: f"{table}_default" for table in PARTITIONED_TABLES}
+
+
+def month_start(value: datetime) -> datetime:
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    return f"{table}_y{month.year}m{month.month:02d}"
+
+
+def is_partitioned(db: Session) -> bool:
+    """True on Postgres databases migrated to the partitioned layout; SQLite keeps plain tables"""
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    return db.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = 'workflow_runs'"
+    )).first() is not None
+
+
+def ensure_partitions(db: Session, months_ahead: int = RUN_PARTITIONS_AHEAD) -> List[str]:
+    """Create the monthly partitions from the current month up to months_ahead"""
+    created = []
+    current = month_start(datetime.utcnow())
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        for table in reversed(list(PARTITIONED_TABLES)):
+            name = partition_name(table, month)
+            exists_already = db.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar()
+            if exists_already:
+                continue
+            db.execute(text(
+                f"CREATE TABLE {name} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+            ))
+            created.append(name)
+    db.commit()
+    if created:
+        logger.info(f"Created run partitions: {', '.join(created)}")
+    return created
+
+
+def _partition_months(db: Session) -> List[datetime]:
+    rows = db.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = 'workflow_runs'"
+    )).scalars().all()
+    months = []
+    for name in rows:
+        match = PARTITION_NAME.search(name)
+        if match:
+            months.append(datetime(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def _not_rehydrated():
+    """Runs that are not a re-hydrated copy of an archived run; those are never archived again"""
+    return ~exists().where(RunArchive.run_id == WorkflowRun.id, RunArchive.rehydrated_at.isnot(None))
+
+
+def _default_partition_months(db: Session, cutoff: datetime) -> List[datetime]:
+    """Months of the runs in the DEFAULT partition created before cutoff, re-hydrated runs aside"""
+    return db.execute(text(
+        f"SELECT DISTINCT date_trunc('month', created_at) FROM {DEFAULT_PARTITIONS['workflow_runs']} "
+        "WHERE created_at < :cutoff "
+        "AND id NOT IN (SELECT run_id FROM run_archive_index WHERE rehydrated_at IS NOT NULL)"
+    ), {"cutoff": cutoff}).scalars().all()
+
+
+def _expired_months(db: Session, cutoff: datetime) -> List[datetime]:
+    if is_partitioned(db):
+        months = {month for month in _partition_months(db) if add_months(month, 1) <= cutoff}
+        months.update(month for month in _default_partition_months(db, cutoff) if add_months(month, 1) <= cutoff)
+        return sorted(months)
+    oldest = db.execute(
+        select(WorkflowRun.created_at).where(_not_rehydrated()).order_by(WorkflowRun.created_at).limit(1)
+    ).scalar()
+    if oldest is None:
+        return []
+    months = []
+    month = month_start(oldest)
+    while add_months(month, 1) <= cutoff:
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def _archive_record(run: WorkflowRun) -> dict:
+    return {
+        "run": {
+            "id": str(run.id),
+            "workflow_id": str(run.workflow_id),
+            "status": run.status,
+            "total_steps": run.total_steps,
+            "completed_steps": run.completed_steps,
+            "failed_steps": run.failed_steps,
+            "cache_hits": run.cache_hits,
+            "created_at": run.created_at.isoformat(),
+            "started_at": run.started_at.isoformat() if run.started_at else None,
+            "finished_at": run.finished_at.isoformat() if run.finished_at else None,
+        },
+        "steps": [
+            {
+                "entity_id": str(step.entity_id),
+                "status": step.status,
+                "cache_hit": step.cache_hit,
+                "created_at": step.created_at.isoformat(),
+                "finished_at": step.finished_at.isoformat() if step.finished_at else None,
+                "input_text": step.input_text,
+                "output_text": step.output_text if step.output_hash else None,
+                "input_tokens": step.input_tokens,
+                "context_tokens": step.context_tokens,
+                "output_tokens": step.output_tokens,
+            }
+            for step in run.steps
+        ],
+    }
+
+
+def _runs_in_month(db: Session, month: datetime) -> Iterator[List[WorkflowRun]]:
+    """Runs created in month, in batches with their steps and payloads loaded"""
+    last_id = None
+    while True:
+        query = (
+            select(WorkflowRun)
+            .options(selectinload(WorkflowRun.steps).selectinload(RunStep.input_payload))
+            .options(selectinload(WorkflowRun.steps).selectinload(RunStep.output_payload))
+            .where(WorkflowRun.created_at >= month, WorkflowRun.created_at < add_months(month, 1), _not_rehydrated())
+            .order_by(WorkflowRun.id)
+            .limit(RUN_ARCHIVE_BATCH_SIZE)
+        )
+        if last_id is not None:
+            query = query.where(WorkflowRun.id > last_id)
+        runs = db.execute(query).scalars().all()
+        if not runs:
+            return
+        yield runs
+        last_id = runs[-1].id
+        db.expunge_all()
+
+
+def _index_insert(dialect_name: str, rows: List[dict]):
+    dialect = postgresql if dialect_name == "postgresql" else sqlite
+    statement = dialect.insert(RunArchive).values(rows)
+    return statement.on_conflict_do_update(
+        index_elements=["run_id"],
+        set_={"archive_path": statement.excluded.archive_path, "archived_at": statement.excluded.archived_at},
+    )
+
+
+def archive_month(db: Session, month: datetime, archive_dir: str = RUN_ARCHIVE_DIR) -> int:
+    """
+    Write the runs of one month to a gzip-compressed JSONL file, index them in
+    run_archive_index and remove them: partitions are detached and dropped on
+    Postgres (rows in the DEFAULT partitions are deleted), rows are deleted on
+    SQLite. Returns the number of archived runs.
+    Every pass writes a file of its own, so runs indexed by an earlier file
+    of the same month stay re-hydratable.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    dialect_name = db.get_bind().dialect.name
+    now = datetime.utcnow()
+    path = os.path.join(archive_dir, f"runs_{month.year}_{month.month:02d}_{now:%Y%m%dT%H%M%S%f}.jsonl.gz")
+    partial = f"{path}.partial"
+
+    archived = 0
+    with gzip.open(partial, "wt", encoding="utf-8") as archive:
+        for runs in _runs_in_month(db, month):
+            index_rows = []
+            for run in runs:
+                archive.write(json.dumps(_archive_record(run)) + "\n")
+                index_rows.append({
+                    "run_id": run.id,
+                    "workflow_id": run.workflow_id,
+                    "created_at": run.created_at,
+                    "archive_path": path,
+                    "archived_at": now,
+                })
+            db.execute(_index_insert(dialect_name, index_rows))
+            archived += len(runs)
+    if archived:
+        # The index rows only become visible together with a complete file
+        os.replace(partial, path)
+    else:
+        os.remove(partial)
+    db.commit()
+
+    next_month = add_months(month, 1)
+    if is_partitioned(db):
+        _drop_month_partitions(db, month)
+    else:
+        rehydrated = select(RunArchive.run_id).where(RunArchive.rehydrated_at.isnot(None))
+        db.execute(delete(RunStep).where(
+            RunStep.run_created_at >= month, RunStep.run_created_at < next_month, RunStep.run_id.notin_(rehydrated)
+        ))
+        db.execute(delete(WorkflowRun).where(
+            WorkflowRun.created_at >= month, WorkflowRun.created_at < next_month, WorkflowRun.id.notin_(rehydrated)
+        ))
+    db.commit()
+
+    pruned = prune_payloads(db, next_month)
+    logger.info(f"Archived {archived} runs of {month:%Y-%m} to {path}, pruned {pruned} payloads")
+    return archived
+
+
+def _drop_month_partitions(db: Session, month: datetime) -> None:
+    """
+    Remove the archived runs of month on Postgres: rows that landed in the
+    DEFAULT partitions are deleted, the month partitions are detached and
+    dropped. Every step of the month is gone before any of its runs, as
+    run_steps references workflow_runs.
+    """
+    bounds = {"month": month, "next_month": add_months(month, 1)}
+    not_rehydrated = "NOT IN (SELECT run_id FROM run_archive_index WHERE rehydrated_at IS NOT NULL)"
+    for table, key in PARTITIONED_TABLES.items():
+        run_id = "run_id" if table == "run_steps" else "id"
+        db.execute(text(
+            f"DELETE FROM {DEFAULT_PARTITIONS[table]} "
+            f"WHERE {key} >= :month AND {key} < :next_month AND {run_id} {not_rehydrated}"
+        ), bounds)
+
+        name = partition_name(table, month)
+        if not db.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar():
+            continue
+        if table == "workflow_runs":
+            # A detached partition keeps no rows referenced; fail the pass instead of dropping them
+            referencing = db.execute(text(
+                f"SELECT 1 FROM run_steps s JOIN {name} r ON r.id = s.run_id AND r.created_at = s.run_created_at LIMIT 1"
+            )).first()
+            if referencing:
+                raise RuntimeError(f"Run steps still reference runs of partition {name}, not detaching it")
+        db.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+        db.execute(text(f"DROP TABLE {name}"))
+
+
+def prune_payloads(db: Session, created_before: datetime) -> int:
+    """Delete payloads no run step references any more"""
+    referenced = exists().where(or_(RunStep.input_hash == RunPayload.hash, RunStep.output_hash == RunPayload.hash))
+    removed = db.execute(
+        delete(RunPayload)
+        .where(RunPayload.created_at < created_before, ~referenced)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return removed
+
+
+def _read_archived_run(path: str, run_id: uuid.UUID) -> Optional[dict]:
+    wanted = f'"id": "{run_id}"'
+    with gzip.open(path, "rt", encoding="utf-8") as archive:
+        for line in archive:
+            # Cheap substring test before parsing; the run id is the first field of each line
+            if wanted in line:
+                record = json.loads(line)
+                if record["run"]["id"] == str(run_id):
+                    return record
+    return None
+
+
+def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def rehydrate_run(db: Session, run_id: uuid.UUID) -> Optional[WorkflowRun]:
+    """
+    Load an archived run back into the run tables (the DEFAULT partition on
+    Postgres). Returns None when the run was never archived.
+    """
+    run = db.get(WorkflowRun, run_id)
+    if run:
+        return run
+    entry = db.get(RunArchive, run_id)
+    if not entry:
+        return None
+
+    record = _read_archived_run(entry.archive_path, run_id)
+    if record is None:
+        raise FileNotFoundError(f"Run {run_id} is missing from archive {entry.archive_path}")
+
+    header = record["run"]
+    created_at = _parse_datetime(header["created_at"])
+    run = WorkflowRun(
+        id=run_id,
+        workflow_id=uuid.UUID(header["workflow_id"]),
+        status=header["status"],
+        total_steps=header["total_steps"],
+        completed_steps=header["completed_steps"],
+        failed_steps=header["failed_steps"],
+        cache_hits=header["cache_hits"],
+        created_at=created_at,
+        started_at=_parse_datetime(header["started_at"]),
+        finished_at=_parse_datetime(header["finished_at"]),
+    )
+    db.add(run)
+    db.flush()
+    for step in record["steps"]:
+        db.add(RunStep(
+            run_id=run_id,
+            entity_id=uuid.UUID(step["entity_id"]),
+            run_created_at=created_at,
+            input_hash=store_payload(db, step["input_text"]),
+            output_hash=store_payload(db, step["output_text"]) if step["output_text"] is not None else None,
+            status=step["status"],
+            cache_hit=step["cache_hit"],
+            # Archives written while created_at was still nullable may have none
+            created_at=_parse_datetime(step["created_at"]) or created_at,
+            finished_at=_parse_datetime(step["finished_at"]),
+            # Archives written before token counts were recorded have none
+            input_tokens=step.get("input_tokens"),
+            context_tokens=step.get("context_tokens"),
+            output_tokens=step.get("output_tokens"),
+        ))
+    entry.rehydrated_at = datetime.utcnow()
+    db.commit()
+    logger.info(f"Re-hydrated run {run_id} from {entry.archive_path}")
+    return run
+
+
+def expire_rehydrated_runs(db: Session, ttl_hours: float = RUN_REHYDRATED_TTL_HOURS) -> int:
+    """Remove re-hydrated runs again once nobody needed them for ttl_hours"""
+    expired = db.execute(
+        select(RunArchive.run_id).where(
+            RunArchive.rehydrated_at.isnot(None),
+            RunArchive.rehydrated_at < datetime.utcnow() - timedelta(hours=ttl_hours)
+        )
+    ).scalars().all()
+    if not expired:
+        return 0
+    db.execute(delete(RunStep).where(RunStep.run_id.in_(expired)))
+    db.execute(delete(WorkflowRun).where(WorkflowRun.id.in_(expired)))
+    db.execute(
+        RunArchive.__table__.update().where(RunArchive.run_id.in_(expired)).values(rehydrated_at=None)
+    )
+    db.commit()
+    return len(expired)
+
+
+def run_retention_pass(
+    retention_months: int = RUN_RETENTION_MONTHS,
+    archive_dir: str = RUN_ARCHIVE_DIR
+) -> int:
+    """One maintenance round: premake partitions, archive expired months, expire re-hydrated runs"""
+    db = database.SessionLocal()
+    try:
+        if is_partitioned(db):
+            ensure_partitions(db)
+        # Expired copies go first; the remaining re-hydrated runs are skipped by archiving
+        expire_rehydrated_runs(db)
+        archived = 0
+        if retention_months > 0:
+            cutoff = add_months(month_start(datetime.utcnow()), -retention_months)
+            for month in _expired_months(db, cutoff):
+                archived += archive_month(db, month, archive_dir)
+        return archived
+    finally:
+        db.close()
+
+
+async def run_retention_loop():
+    """Periodic partition maintenance and archival of old runs, started from the app lifespan"""
+    while True:
+        try:
+            await asyncio.to_thread(run_retention_pass)
+        except Exception as e:
+            logger.error(f"Run retention failed: {str(e)}")
+        await asyncio.sleep(RUN_RETENTION_INTERVAL)
@@ -1,17 +1,251 @@
 import asyncio
-from typing import Dict
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set
 import json
 from fastapi import Request
+from prometheus_client import Counter, Gauge
+from functions.sse_bus import event_bus
+from functions.tracing import span
+
+logger = logging.getLogger(__name__)
+
 # SSE config
-CONNECTIONS: Dict[str, asyncio.Queue] = {}
-async def add_client(client_id: str) -> asyncio.Queue:
-    queue = asyncio.Queue()
+SSE_QUEUE_MAXSIZE = int(os.getenv("SSE_QUEUE_MAXSIZE", "1000"))
+# What to do when a client queue is full: "drop_oldest", "coalesce" or "disconnect"
+SSE_SLOW_CONSUMER_POLICY = os.getenv("SSE_SLOW_CONSUMER_POLICY", "coalesce")
+
+SSE_EVENTS_DROPPED = Counter(
+    "workflow_sse_events_dropped_total", "SSE events dropped because a client queue was full", ["event"]
+)
+SSE_EVENTS_COALESCED = Counter(
+    "workflow_sse_events_coalesced_total", "SSE events merged into a pending event of the same key", ["event"]
+)
+SSE_SLOW_CONSUMER_DISCONNECTS = Counter(
+    "workflow_sse_slow_consumer_disconnects_total", "SSE clients disconnected for not keeping up"
+)
+
+
+class SlowConsumerError(Exception):
+    """Raised to the reader of a queue that was closed by the disconnect policy."""
+
+
+class ClientQueue:
+    """
+    Bounded per-client event queue. Producers never block: once maxsize events
+    are pending the slow-consumer policy decides what gives way.
+    """
+
+    def __init__(self, maxsize: int = SSE_QUEUE_MAXSIZE, policy: str = SSE_SLOW_CONSUMER_POLICY):
+        self.maxsize = maxsize
+        self.policy = policy
+        self.closed = False
+        self._items = deque()
+        # Newest pending message per coalescing key
+        self._latest: Dict[tuple, dict] = {}
+        self._ready = asyncio.Event()
+
+    @staticmethod
+    def _key(message: dict) -> tuple:
+        data = message.get("data") or {}
+        return (message.get("event"), data.get("run_id"), data.get("entity_id"))
+
+    def qsize(self) -> int:
+        return len(self._items)
+
+    def _coalesce(self, message: dict) -> bool:
+        pending = self._latest.get(self._key(message))
+        if pending is None:
+            return False
+        if message["event"] == "agent-delta":
+            # Deltas are fragments of one text: concatenate instead of replacing
+            merged = dict(message["data"])
+            merged["delta"] = pending["data"]["delta"] + message["data"]["delta"]
+            pending["data"] = merged
+        else:
+            pending["data"] = message["data"]
+        SSE_EVENTS_COALESCED.labels(event=message["event"]).inc()
+        return True
+
+    def _drop_oldest(self):
+        dropped = self._items.popleft()
+        key = self._key(dropped)
+        if self._latest.get(key) is dropped:
+            del self._latest[key]
+        SSE_EVENTS_DROPPED.labels(event=dropped["event"]).inc()
+
+    def put_nowait(self, message: dict):
+        if self.closed:
+            return
+        if len(self._items) >= self.maxsize:
+            if self.policy == "disconnect":
+                self.closed = True
+                self._items.clear()
+                self._latest.clear()
+                SSE_SLOW_CONSUMER_DISCONNECTS.inc()
+                self._ready.set()
+                return
+            if self.policy == "coalesce" and self._coalesce(message):
+                return
+            self._drop_oldest()
+
+        message = dict(message)
+        self._items.append(message)
+        self._latest[self._key(message)] = message
+        self._ready.set()
+
+    async def put(self, message: dict):
+        self.put_nowait(message)
+
+    async def get(self) -> dict:
+        while not self._items:
+            if self.closed:
+                raise SlowConsumerError("Client could not keep up with its event stream")
+            self._ready.clear()
+            await self._ready.wait()
+        message = self._items.popleft()
+        key = self._key(message)
+        if self._latest.get(key) is message:
+            del self._latest[key]
+        return message
+
+
+CONNECTIONS: Dict[str, ClientQueue] = {}
+
+SSE_CONNECTED_CLIENTS = Gauge("workflow_sse_connected_clients", "Connected SSE clients")
+SSE_CONNECTED_CLIENTS.set_function(lambda: len(CONNECTIONS))
+SSE_QUEUE_DEPTH = Gauge("workflow_sse_queue_depth", "Pending events across all SSE client queues")
+SSE_QUEUE_DEPTH.set_function(lambda: sum(queue.qsize() for queue in list(CONNECTIONS.values())))
+SSE_QUEUE_DEPTH_MAX = Gauge("workflow_sse_queue_depth_max", "Pending events in the fullest SSE client queue")
+SSE_QUEUE_DEPTH_MAX.set_function(lambda: max((queue.qsize() for queue in list(CONNECTIONS.values())), default=0))
+# Fan-out index: topic ("run:<id>", "workflow:<id>", "project:<id>") -> subscribed client ids
+SUBSCRIPTIONS: Dict[str, Set[str]] = {}
+CLIENT_TOPICS: Dict[str, Set[str]] = {}
+# Loop owning the client queues, needed to publish from worker threads
+_LOOP: Optional[asyncio.AbstractEventLoop] = None
+# Streaming deltas are sent in batches of at most this many characters / seconds
+SSE_DELTA_MAX_CHARS = int(os.getenv("SSE_DELTA_MAX_CHARS", "200"))
+SSE_DELTA_MAX_INTERVAL = float(os.getenv("SSE_DELTA_MAX_INTERVAL", "0.1"))
+# How long a subscription change waits for the worker holding the client's stream to apply it
+SSE_SUBSCRIPTION_TIMEOUT = float(os.getenv("SSE_SUBSCRIPTION_TIMEOUT", "2.0"))
+# Subscription changes sent over the bus, by request id, until a worker confirms them
+_PENDING_CHANGES: Dict[str, asyncio.Future] = {}
+
+async def start_event_delivery():
+    """Bind delivery to the serving loop and join the event bus; called once from the lifespan"""
+    global _LOOP
+    # Set before any client connects, so worker threads can publish to the bus on every worker
+    _LOOP = asyncio.get_running_loop()
+    await event_bus.start(deliver_local)
+
+async def stop_event_delivery():
+    global _LOOP
+    await event_bus.stop()
+    _LOOP = None
+
+async def add_client(client_id: str) -> ClientQueue:
+    queue = ClientQueue()
     CONNECTIONS[client_id] = queue
     return queue
 
 def remove_client(client_id: str):
     if client_id in CONNECTIONS:
         del CONNECTIONS[client_id]
+    unsubscribe(client_id, list(CLIENT_TOPICS.get(client_id, ())))
+
+def run_topics(run_id, workflow_id=None, project_id=None) -> List[str]:
+    """Topics an event of a run is published on"""
+    topics = [f"run:{run_id}"]
+    if workflow_id is not None:
+        topics.append(f"workflow:{workflow_id}")
+    if project_id is not None:
+        topics.append(f"project:{project_id}")
+    return topics
+
+def subscription_topics(run_ids=None, workflow_ids=None, project_ids=None) -> List[str]:
+    return (
+        [f"run:{run_id}" for run_id in run_ids or []]
+        + [f"workflow:{workflow_id}" for workflow_id in workflow_ids or []]
+        + [f"project:{project_id}" for project_id in project_ids or []]
+    )
+
+def subscribe(client_id: str, topics: Iterable[str]):
+    for topic in topics:
+        SUBSCRIPTIONS.setdefault(topic, set()).add(client_id)
+        CLIENT_TOPICS.setdefault(client_id, set()).add(topic)
+
+def unsubscribe(client_id: str, topics: Iterable[str]):
+    for topic in topics:
+        subscribers = SUBSCRIPTIONS.get(topic)
+        if subscribers is not None:
+            subscribers.discard(client_id)
+            if not subscribers:
+                del SUBSCRIPTIONS[topic]
+        client_topics = CLIENT_TOPICS.get(client_id)
+        if client_topics is not None:
+            client_topics.discard(topic)
+            if not client_topics:
+                del CLIENT_TOPICS[client_id]
+
+def _change_local_subscription(client_id: str, topics: List[str], subscribed: bool) -> Optional[List[str]]:
+    """Apply a change to a client of this worker; None when the client is not connected here"""
+    if client_id not in CONNECTIONS:
+        return None
+    if subscribed:
+        subscribe(client_id, topics)
+    else:
+        unsubscribe(client_id, topics)
+    return sorted(CLIENT_TOPICS.get(client_id, ()))
+
+async def change_subscription(client_id: str, topics: List[str], subscribed: bool = True) -> Optional[List[str]]:
+    """
+    Add (or remove) topics of a client's stream on whichever worker holds it.
+    Returns the client's topics afterwards, or None when no worker has the client.
+    """
+    current = _change_local_subscription(client_id, topics, subscribed)
+    if current is not None or not event_bus.has_peers:
+        return current
+    request_id = uuid.uuid4().hex
+    answer = asyncio.get_running_loop().create_future()
+    _PENDING_CHANGES[request_id] = answer
+    try:
+        event_bus.publish(None, {
+            "control": "subscription",
+            "request_id": request_id,
+            "client_id": client_id,
+            "topics": list(topics),
+            "subscribed": subscribed,
+        })
+        return await asyncio.wait_for(answer, SSE_SUBSCRIPTION_TIMEOUT)
+    except asyncio.TimeoutError:
+        return None
+    finally:
+        _PENDING_CHANGES.pop(request_id, None)
+
+def _on_control(message: dict):
+    """Subscription changes and their confirmations travelling between workers"""
+    if message["control"] == "subscription":
+        current = _change_local_subscription(message["client_id"], message["topics"], message["subscribed"])
+        if current is not None:
+            event_bus.publish(None, {
+                "control": "subscription-applied",
+                "request_id": message["request_id"],
+                "topics": current,
+            })
+    elif message["control"] == "subscription-applied":
+        answer = _PENDING_CHANGES.get(message["request_id"])
+        if answer is not None and not answer.done():
+            answer.set_result(message["topics"])
+
+def _subscribers(topics: Iterable[str]) -> Set[str]:
+    """Clients interested in any of the topics; cost depends on subscribers, not on connections"""
+    clients = set()
+    for topic in topics:
+        clients |= SUBSCRIPTIONS.get(topic, set())
+    return clients
         
 def format_sse_event(data: dict, event: str = None) -> str:
     message = f"data: {json.dumps(data)}\n"
@@ -20,8 +254,10 @@ def format_sse_event(data: dict, event: str = None) -> str:
     message += "\n"
     return message
 
-async def event_generator(request: Request, client_id: str):
+async def event_generator(request: Request, client_id: str, topics: Optional[List[str]] = None):
     queue = await add_client(client_id)
+    if topics:
+        subscribe(client_id, topics)
     try:
         yield format_sse_event({"message": "Connection established"}, event="connected")
         while True:
@@ -32,23 +268,100 @@ async def event_generator(request: Request, client_id: str):
                 yield format_sse_event(data["data"], event=data["event"])
             except asyncio.TimeoutError:
                 yield ": keep-alive\n\n"
+            except SlowConsumerError as e:
+                logger.warning(f"Disconnecting slow SSE client {client_id}")
+                yield format_sse_event({"message": str(e)}, event="overflow")
+                break
     finally:
         remove_client(client_id)
 
+def deliver_local(topics: Optional[List[str]], message: dict):
+    """Queue a message for the clients of this worker; topics None reaches every client"""
+    if "control" in message:
+        _on_control(message)
+        return
+    if topics is None:
+        client_ids = list(CONNECTIONS)
+    else:
+        client_ids = _subscribers(topics)
+    for client_id in client_ids:
+        queue = CONNECTIONS.get(client_id)
+        if queue is not None:
+            queue.put_nowait(message)
+
+def _dispatch(topics: Optional[List[str]], message: dict):
+    deliver_local(topics, message)
+    # Clients connected to other workers receive it through the event bus
+    event_bus.publish(topics, message)
+
 async def broadcast_event(event: str, data: dict):
     """Broadcast an event to all connected clients."""
-    for client_id, queue in CONNECTIONS.items():
-        await queue.put({
+    _dispatch(None, {
+        "event": event,
+        "data": data
+    })
+
+def broadcast_event_threadsafe(event: str, data: dict):
+    """Broadcast from a worker thread; asyncio queues may only be touched on their loop."""
+    if _LOOP is None:
+        return
+    _LOOP.call_soon_threadsafe(_dispatch, None, {
+        "event": event,
+        "data": data
+    })
+
+async def publish_event(topics: List[str], event: str, data: dict):
+    """Send an event only to the clients subscribed to one of the topics."""
+    with span("sse.publish", event=event):
+        _dispatch(topics, {"event": event, "data": data})
+
+def publish_event_threadsafe(topics: List[str], event: str, data: dict):
+    """publish_event for worker threads; the subscriber lookup runs on the loop."""
+    if _LOOP is None:
+        return
+    with span("sse.publish", event=event):
+        _LOOP.call_soon_threadsafe(_dispatch, topics, {
             "event": event,
             "data": data
         })
 
+class DeltaCoalescer:
+    """
+    Buffers streamed tokens and releases them as one batch once the buffer
+    reaches max_chars or max_interval has elapsed since the last batch.
+    """
+
+    def __init__(self, max_chars: int = SSE_DELTA_MAX_CHARS, max_interval: float = SSE_DELTA_MAX_INTERVAL):
+        self.max_chars = max_chars
+        self.max_interval = max_interval
+        self.seq = 0
+        self._buffer = []
+        self._size = 0
+        self._last_flush = time.monotonic()
+
+    def add(self, delta: str) -> Optional[str]:
+        self._buffer.append(delta)
+        self._size += len(delta)
+        if self._size >= self.max_chars or time.monotonic() - self._last_flush >= self.max_interval:
+            return self.flush()
+        return None
+
+    def flush(self) -> Optional[str]:
+        if not self._buffer:
+            return None
+        batch = "".join(self._buffer)
+        self._buffer = []
+        self._size = 0
+        self._last_flush = time.monotonic()
+        self.seq += 1
+        return batch
+
 async def background_task():
     count = 0
     while True:
         count += 1
         if CONNECTIONS:
-            for client_id, queue in CONNECTIONS.items():
+            for client_id, queue in list(CONNECTIONS.items()):
                 await queue.put({
                     "event": "background-update",
                     "data": {"count": count, "message": "Automatic update"}
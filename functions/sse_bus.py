@@ -0,0 +1,249 @@
+import abc
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from typing import Callable, List, Optional
+
+import database
+
+logger = logging.getLogger(__name__)
+
+# "postgres" (LISTEN/NOTIFY on DATABASE_URL) or "memory"; defaults to postgres when the service runs on it
+SSE_BUS_BACKEND = os.getenv(
+    "SSE_BUS_BACKEND", "postgres" if database.engine.dialect.name == "postgresql" else "memory"
+)
+SSE_BUS_CHANNEL = os.getenv("SSE_BUS_CHANNEL", "workflow_sse")
+SSE_BUS_FLUSH_INTERVAL = float(os.getenv("SSE_BUS_FLUSH_INTERVAL", "0.05"))
+SSE_BUS_BATCH_SIZE = int(os.getenv("SSE_BUS_BATCH_SIZE", "100"))
+# NOTIFY payloads are limited to 8000 bytes; larger events are spilled into sse_event_spill
+SSE_BUS_MAX_PAYLOAD = int(os.getenv("SSE_BUS_MAX_PAYLOAD", "7500"))
+SSE_BUS_SPILL_RETENTION_SECONDS = int(os.getenv("SSE_BUS_SPILL_RETENTION_SECONDS", "300"))
+# Events kept for the next flush while the database is unreachable; the oldest give way beyond this
+SSE_BUS_MAX_BUFFER = int(os.getenv("SSE_BUS_MAX_BUFFER", "10000"))
+
+# deliver(topics, message): topics None means a broadcast to every local client
+DeliverCallback = Callable[[Optional[List[str]], dict], None]
+
+
+class EventBus(abc.ABC):
+    """
+    Pub/sub between the workers of the service. Every worker delivers its own
+    events locally; the bus carries them to the clients connected elsewhere.
+    """
+
+    def __init__(self):
+        self.origin = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._deliver: Optional[DeliverCallback] = None
+
+    async def start(self, deliver: DeliverCallback):
+        self._deliver = deliver
+
+    async def stop(self):
+        self._deliver = None
+
+    @property
+    def has_peers(self) -> bool:
+        """False when no other worker can be listening, so waiting for an answer is pointless"""
+        return True
+
+    @abc.abstractmethod
+    def publish(self, topics: Optional[List[str]], message: dict):
+        """Hand an event to the other workers; called on the event loop, never blocks"""
+
+
+class InMemoryEventBus(EventBus):
+    """Buses sharing one hub list behave like workers of one deployment; used in tests"""
+
+    def __init__(self, hub: Optional[list] = None):
+        super().__init__()
+        self.hub = hub if hub is not None else []
+
+    async def start(self, deliver: DeliverCallback):
+        await super().start(deliver)
+        self.hub.append(self)
+
+    async def stop(self):
+        if self in self.hub:
+            self.hub.remove(self)
+        await super().stop()
+
+    @property
+    def has_peers(self) -> bool:
+        return any(bus is not self for bus in self.hub)
+
+    def publish(self, topics: Optional[List[str]], message: dict):
+        for bus in list(self.hub):
+            if bus is not self and bus._deliver is not None:
+                bus._deliver(topics, message)
+
+
+class PostgresEventBus(EventBus):
+    """
+    LISTEN/NOTIFY bus on the service database. Events are buffered and sent as
+    one NOTIFY per batch; events too large for a payload travel through the
+    sse_event_spill table and only their id is notified. Received batches are
+    delivered one after the other, so a spilled event keeps its place.
+    """
+
+    def __init__(self, dsn: str, channel: str = SSE_BUS_CHANNEL):
+        super().__init__()
+        self.dsn = dsn
+        self.channel = channel
+        self._buffer: List[dict] = []
+        self._flush_needed: Optional[asyncio.Event] = None
+        # Notification payloads in arrival order, delivered by _receive_loop
+        self._inbox: Optional[asyncio.Queue] = None
+        # Small pool: flushes, spill reads and maintenance may overlap
+        self._pool = None
+        self._listener = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self, deliver: DeliverCallback):
+        import asyncpg
+
+        self._flush_needed = asyncio.Event()
+        self._inbox = asyncio.Queue()
+        self._pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=3)
+        await self._listen()
+        await super().start(deliver)
+        self._tasks = [
+            asyncio.create_task(self._flush_loop()),
+            asyncio.create_task(self._receive_loop()),
+            asyncio.create_task(self._maintenance_loop()),
+        ]
+        logger.info(f"SSE event bus listening on channel {self.channel} as {self.origin}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self._flush()
+        await super().stop()
+        if self._listener is not None and not self._listener.is_closed():
+            await self._listener.close()
+        if self._pool is not None:
+            await self._pool.close()
+
+    async def _listen(self):
+        import asyncpg
+
+        self._listener = await asyncpg.connect(self.dsn)
+        await self._listener.add_listener(self.channel, self._on_notify)
+
+    def publish(self, topics: Optional[List[str]], message: dict):
+        if self._deliver is None:
+            return
+        self._buffer.append({"t": topics, "m": message})
+        if len(self._buffer) >= SSE_BUS_BATCH_SIZE:
+            self._flush_needed.set()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_needed.wait(), timeout=SSE_BUS_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_needed.clear()
+            try:
+                await self._flush()
+            except Exception as e:
+                logger.error(f"SSE event bus flush failed: {str(e)}")
+
+    async def _flush(self):
+        if not self._buffer or self._pool is None:
+            return
+        events, self._buffer = self._buffer, []
+        # Events up to this index went out in a NOTIFY
+        sent = 0
+        try:
+            batch: List[str] = []
+            size = 0
+            for index, event in enumerate(events):
+                encoded = json.dumps(event, default=str)
+                if len(encoded) > SSE_BUS_MAX_PAYLOAD:
+                    spill_id = await self._pool.fetchval(
+                        "INSERT INTO sse_event_spill (payload) VALUES ($1) RETURNING id", encoded
+                    )
+                    encoded = json.dumps({"ref": spill_id})
+                if batch and size + len(encoded) > SSE_BUS_MAX_PAYLOAD:
+                    await self._notify(batch)
+                    sent = index
+                    batch, size = [], 0
+                batch.append(encoded)
+                size += len(encoded) + 1
+            if batch:
+                await self._notify(batch)
+            sent = len(events)
+        finally:
+            # Failed or cancelled: unsent events go back ahead of the ones published meanwhile
+            if sent < len(events):
+                self._buffer[:0] = events[sent:]
+                overflow = len(self._buffer) - SSE_BUS_MAX_BUFFER
+                if overflow > 0:
+                    del self._buffer[:overflow]
+                    logger.warning(f"SSE event bus buffer full, dropped {overflow} events")
+
+    async def _notify(self, encoded_events: List[str]):
+        payload = '{"o":%s,"e":[%s]}' % (json.dumps(self.origin), ",".join(encoded_events))
+        await self._pool.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        self._inbox.put_nowait(payload)
+
+    async def _receive_loop(self):
+        while True:
+            payload = await self._inbox.get()
+            try:
+                await self._deliver_batch(payload)
+            except Exception as e:
+                logger.error(f"SSE event bus delivery failed: {str(e)}")
+
+    async def _deliver_batch(self, payload: str):
+        batch = json.loads(payload)
+        if batch["o"] == self.origin:
+            return
+        for event in batch["e"]:
+            if "ref" in event:
+                event = await self._load_spilled(event["ref"])
+                if event is None:
+                    continue
+            if self._deliver is not None:
+                self._deliver(event["t"], event["m"])
+
+    async def _load_spilled(self, spill_id: int) -> Optional[dict]:
+        try:
+            encoded = await self._pool.fetchval("SELECT payload FROM sse_event_spill WHERE id = $1", spill_id)
+        except Exception as e:
+            logger.error(f"Could not load spilled SSE event {spill_id}: {str(e)}")
+            return None
+        return json.loads(encoded) if encoded is not None else None
+
+    async def _maintenance_loop(self):
+        """Reconnect a dropped listener and purge spilled events every receiver had time to read"""
+        while True:
+            await asyncio.sleep(5)
+            try:
+                if self._listener is None or self._listener.is_closed():
+                    logger.warning("SSE event bus listener lost, reconnecting")
+                    await self._listen()
+                await self._pool.execute(
+                    "DELETE FROM sse_event_spill WHERE created_at < now() - make_interval(secs => $1)",
+                    float(SSE_BUS_SPILL_RETENTION_SECONDS)
+                )
+            except Exception as e:
+                logger.error(f"SSE event bus maintenance failed: {str(e)}")
+
+
+def create_event_bus(backend: str = SSE_BUS_BACKEND) -> EventBus:
+    if backend == "memory":
+        return InMemoryEventBus()
+    if backend == "postgres":
+        dsn = database.engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        return PostgresEventBus(dsn)
+    raise ValueError(f"Unknown SSE bus backend: {backend}")
+
+
+event_bus = create_event_bus()
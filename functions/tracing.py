@@ -0,0 +1,401 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Union
+
+from prometheus_client import Counter
+
+logger = logging.getLogger(__name__)
+
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "1") == "1"
+# Finished spans are appended here as OTLP/JSON export requests, one per line; empty disables the file
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "traces/spans.jsonl")
+# The export file is rotated at this size into <path>.1 ... <path>.N; older files are deleted
+TRACE_EXPORT_MAX_BYTES = int(os.getenv("TRACE_EXPORT_MAX_BYTES", str(50 * 1024 * 1024)))
+TRACE_EXPORT_BACKUPS = int(os.getenv("TRACE_EXPORT_BACKUPS", "3"))
+# OTLP/HTTP traces endpoint of a collector, e.g. http://otel-collector:4318/v1/traces
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "")
+TRACE_EXPORT_INTERVAL = float(os.getenv("TRACE_EXPORT_INTERVAL", "2"))
+# Recent runs whose spans GET /runs/{run_id}/trace serves from memory
+TRACE_MEMORY_RUNS = int(os.getenv("TRACE_MEMORY_RUNS", "256"))
+TRACE_MAX_SPANS_PER_RUN = int(os.getenv("TRACE_MAX_SPANS_PER_RUN", "2000"))
+SERVICE_NAME = os.getenv("SERVICE_NAME", "workflow")
+
+TRACE_SPANS_EXPORTED = Counter("workflow_trace_spans_exported_total", "Spans exported", ["target", "result"])
+TRACE_SPANS_DROPPED = Counter(
+    "workflow_trace_spans_dropped_total", "Spans exported but left out of the in-memory trace of a run"
+)
+
+# OTLP span status codes
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+def _now_ns() -> int:
+    return time.time_ns()
+
+
+def _datetime_ns(value: datetime) -> int:
+    # Model timestamps are naive UTC
+    return int((value - datetime(1970, 1, 1)).total_seconds() * 1e9)
+
+
+def run_trace_id(run_id: Union[uuid.UUID, str]) -> str:
+    """A run's trace id is its uuid, so traces are found without an index"""
+    return uuid.UUID(str(run_id)).hex
+
+
+class Span:
+    """One timed operation of a run trace"""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: dict, start_ns: Optional[int] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = {key: value for key, value in attributes.items() if value is not None}
+        self.start_ns = start_ns or _now_ns()
+        self.end_ns: Optional[int] = None
+        self.status = STATUS_OK
+        self.status_message: Optional[str] = None
+
+    def set_attributes(self, **attributes) -> None:
+        self.attributes.update({key: value for key, value in attributes.items() if value is not None})
+
+    def end(self, error: Union[BaseException, str, None] = None, end_ns: Optional[int] = None) -> None:
+        if self.end_ns is not None:
+            return
+        if error is not None:
+            self.status = STATUS_ERROR
+            self.status_message = str(error) or type(error).__name__
+        self.end_ns = end_ns or _now_ns()
+        tracer.on_end(self)
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or _now_ns()),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": self.status, **({"message": self.status_message} if self.status_message else {})},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _NoopSpan:
+    """Stands in for spans started outside of a run trace"""
+    trace_id = None
+    span_id = None
+
+    def set_attributes(self, **attributes) -> None:
+        pass
+
+    def end(self, error=None, end_ns=None) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _plain_value(value: dict):
+    if "intValue" in value:
+        return int(value["intValue"])
+    for key in ("boolValue", "doubleValue", "stringValue"):
+        if key in value:
+            return value[key]
+    return None
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """
+    Keeps the spans of recent runs in memory for the trace endpoint and
+    buffers finished spans for the exporter.
+    """
+
+    def __init__(self, memory_runs: int = TRACE_MEMORY_RUNS):
+        self.memory_runs = memory_runs
+        self._traces: "OrderedDict[str, List[Span]]" = OrderedDict()
+        self._finished: List[Span] = []
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()
+
+    def on_start(self, span: Span) -> None:
+        with self._lock:
+            spans = self._traces.get(span.trace_id)
+            if spans is None:
+                spans = self._traces[span.trace_id] = []
+                while len(self._traces) > self.memory_runs:
+                    self._traces.popitem(last=False)
+            else:
+                self._traces.move_to_end(span.trace_id)
+            if len(spans) < TRACE_MAX_SPANS_PER_RUN:
+                spans.append(span)
+            else:
+                TRACE_SPANS_DROPPED.inc()
+
+    def on_end(self, span: Span) -> None:
+        with self._lock:
+            self._finished.append(span)
+
+    def spans(self, trace_id: str) -> Optional[List[dict]]:
+        """Spans of a trace kept in memory, in-flight ones without an end"""
+        with self._lock:
+            spans = list(self._traces.get(trace_id) or [])
+        if not spans:
+            return None
+        return [_span_record(span.to_otlp(), finished=span.end_ns is not None) for span in spans]
+
+    def export(self) -> int:
+        """Write finished spans to the file and the collector; returns the number of spans"""
+        with self._export_lock:
+            with self._lock:
+                finished, self._finished = self._finished, []
+            if not finished:
+                return 0
+            request = json.dumps({
+                "resourceSpans": [{
+                    "resource": {"attributes": [
+                        {"key": "service.name", "value": {"stringValue": SERVICE_NAME}},
+                        {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+                    ]},
+                    "scopeSpans": [{
+                        "scope": {"name": "wf_service"},
+                        "spans": [span.to_otlp() for span in finished],
+                    }],
+                }]
+            }, default=str)
+            if TRACE_EXPORT_PATH:
+                self._export_file(request, len(finished))
+            if TRACE_OTLP_ENDPOINT:
+                self._export_collector(request, len(finished))
+            return len(finished)
+
+    def _export_file(self, request: str, count: int) -> None:
+        try:
+            directory = os.path.dirname(TRACE_EXPORT_PATH)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            _rotate_export_file(TRACE_EXPORT_PATH, TRACE_EXPORT_MAX_BYTES, TRACE_EXPORT_BACKUPS)
+            with open(TRACE_EXPORT_PATH, "a", encoding="utf-8") as file:
+                file.write(request + "\n")
+            TRACE_SPANS_EXPORTED.labels("file", "ok").inc(count)
+        except OSError as e:
+            TRACE_SPANS_EXPORTED.labels("file", "error").inc(count)
+            logger.error(f"Could not write spans to {TRACE_EXPORT_PATH}: {str(e)}")
+
+    def _export_collector(self, request: str, count: int) -> None:
+        import httpx
+        try:
+            response = httpx.post(
+                TRACE_OTLP_ENDPOINT, content=request, headers={"Content-Type": "application/json"}, timeout=5
+            )
+            response.raise_for_status()
+            TRACE_SPANS_EXPORTED.labels("collector", "ok").inc(count)
+        except httpx.HTTPError as e:
+            # Spans are not retried; the file keeps a copy
+            TRACE_SPANS_EXPORTED.labels("collector", "error").inc(count)
+            logger.warning(f"Could not export spans to {TRACE_OTLP_ENDPOINT}: {str(e)}")
+
+    async def aexport(self) -> int:
+        return await asyncio.to_thread(self.export)
+
+
+tracer = Tracer()
+
+
+def start_span(name: str, start_time: Optional[datetime] = None, **attributes) -> Union[Span, _NoopSpan]:
+    """Start a child of the current span; the caller ends it. No-op outside of a run trace"""
+    parent = _current_span.get()
+    if not TRACE_ENABLED or parent is None:
+        return NOOP_SPAN
+    span = Span(name, parent.trace_id, parent.span_id, attributes, _datetime_ns(start_time) if start_time else None)
+    tracer.on_start(span)
+    return span
+
+
+def record_span(name: str, start_time: datetime, end_time: datetime, **attributes) -> None:
+    """A finished span of something timed elsewhere, e.g. from database timestamps"""
+    start_span(name, start_time=start_time, **attributes).end(end_ns=_datetime_ns(end_time))
+
+
+@contextmanager
+def use_span(span: Union[Span, _NoopSpan]) -> Iterator[Union[Span, _NoopSpan]]:
+    """Make span the parent of the spans started in this block, without ending it"""
+    if span is NOOP_SPAN:
+        yield span
+        return
+    token = _current_span.set(span)
+    try:
+        yield span
+    finally:
+        _current_span.reset(token)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Union[Span, _NoopSpan]]:
+    """Span around a block, marked as failed when the block raises"""
+    current = start_span(name, **attributes)
+    with use_span(current):
+        try:
+            yield current
+        except BaseException as e:
+            current.end(error=e)
+            raise
+        current.end()
+
+
+@contextmanager
+def trace_run(name: str, run_id: uuid.UUID, **attributes) -> Iterator[Union[Span, _NoopSpan]]:
+    """Root span of a run's trace, or a child when the block already is inside that trace"""
+    if not TRACE_ENABLED:
+        yield NOOP_SPAN
+        return
+    trace_id = run_trace_id(run_id)
+    parent = _current_span.get()
+    if parent is not None and parent.trace_id == trace_id:
+        with span(name, **attributes) as current:
+            yield current
+        return
+    root = Span(name, trace_id, None, {"run_id": str(run_id), **attributes})
+    tracer.on_start(root)
+    with use_span(root):
+        try:
+            yield root
+        except BaseException as e:
+            root.end(error=e)
+            raise
+        root.end()
+
+
+def _span_record(otlp: dict, finished: bool = True) -> dict:
+    return {
+        "span_id": otlp["spanId"],
+        "parent_span_id": otlp.get("parentSpanId"),
+        "name": otlp["name"],
+        "start_ns": int(otlp["startTimeUnixNano"]),
+        "end_ns": int(otlp["endTimeUnixNano"]) if finished else None,
+        "status": "error" if otlp.get("status", {}).get("code") == STATUS_ERROR else "ok",
+        "status_message": otlp.get("status", {}).get("message"),
+        "attributes": {item["key"]: _plain_value(item["value"]) for item in otlp.get("attributes", [])},
+    }
+
+
+def _export_files(path: str, backups: int) -> List[str]:
+    """The export file followed by its rotated copies, newest first"""
+    return [path] + [f"{path}.{index}" for index in range(1, backups + 1)]
+
+
+def _rotate_export_file(path: str, max_bytes: int, backups: int) -> None:
+    """Shift a full export file to <path>.1, keeping at most `backups` rotated copies"""
+    try:
+        if os.path.getsize(path) < max_bytes:
+            return
+    except OSError:
+        return
+    if backups < 1:
+        os.remove(path)
+        return
+    files = _export_files(path, backups)
+    for index in range(len(files) - 1, 0, -1):
+        if os.path.exists(files[index - 1]):
+            os.replace(files[index - 1], files[index])
+
+
+def load_exported_spans(trace_id: str, path: str = TRACE_EXPORT_PATH) -> Optional[List[dict]]:
+    """
+    Spans of a trace from the export file and its rotated copies, for runs no
+    longer (or never) in this process's memory. Blocking; call it off the event loop.
+    """
+    if not path:
+        return None
+    spans: Dict[str, dict] = {}
+    for export_file in reversed(_export_files(path, TRACE_EXPORT_BACKUPS)):
+        if not os.path.exists(export_file):
+            continue
+        with open(export_file, encoding="utf-8") as file:
+            for line in file:
+                # Cheap substring check before parsing a whole export request
+                if trace_id not in line:
+                    continue
+                request = json.loads(line)
+                for resource in request.get("resourceSpans", []):
+                    for scope in resource.get("scopeSpans", []):
+                        for otlp in scope.get("spans", []):
+                            if otlp.get("traceId") == trace_id:
+                                spans[otlp["spanId"]] = _span_record(otlp)
+    return list(spans.values()) or None
+
+
+def run_waterfall(run_id: uuid.UUID) -> Optional[dict]:
+    """Spans of a run ordered by start, with offsets from the first span and their depth"""
+    trace_id = run_trace_id(run_id)
+    spans = tracer.spans(trace_id) or load_exported_spans(trace_id)
+    if not spans:
+        return None
+    spans.sort(key=lambda item: item["start_ns"])
+    by_id = {item["span_id"]: item for item in spans}
+    origin = spans[0]["start_ns"]
+    end = max((item["end_ns"] or _now_ns()) for item in spans)
+
+    def depth(item: dict) -> int:
+        level = 0
+        while item.get("parent_span_id") in by_id and level < len(spans):
+            item = by_id[item["parent_span_id"]]
+            level += 1
+        return level
+
+    return {
+        "run_id": run_id,
+        "trace_id": trace_id,
+        "duration_ms": (end - origin) / 1e6,
+        "spans": [
+            {
+                "span_id": item["span_id"],
+                "parent_span_id": item["parent_span_id"],
+                "name": item["name"],
+                "depth": depth(item),
+                "start_offset_ms": (item["start_ns"] - origin) / 1e6,
+                "duration_ms": (item["end_ns"] - item["start_ns"]) / 1e6 if item["end_ns"] else None,
+                "status": item["status"],
+                "status_message": item["status_message"],
+                "attributes": item["attributes"],
+            }
+            for item in spans
+        ],
+    }
+
+
+async def trace_export_loop():
+    """Interval export of finished spans, started from the app lifespan"""
+    while True:
+        await asyncio.sleep(TRACE_EXPORT_INTERVAL)
+        try:
+            await tracer.aexport()
+        except Exception as e:
+            logger.error(f"Span export failed: {str(e)}")
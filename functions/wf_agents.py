@@ -1,16 +1,44 @@
-from models.workflow import Workflow, WorkflowEntity, Run
-from sqlalchemy.orm import Session
+from models.workflow import WorkflowEntity, WorkflowRun, RunStep
+from sqlalchemy import select
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+import database
 from functions.agent_team import (
-    create_agent_with_config, textModel
+    create_agent_with_config, GROQ_MODEL_ID
 )
+from functions.agent_cache import agent_cache, agent_cache_key
+from functions.response_cache import response_cache, response_cache_key
+from functions.context_budget import count_tokens, fit_context, afit_context
+from functions.run_recorder import run_recorder
+from functions.model_router import fallback_routes
+from functions.tracing import span, start_span, trace_run, use_span
 from agno.agent import Agent, RunResponse
+from agno.run.response import RunEvent
+import asyncio
+import os
+import threading
 import uuid
+from contextlib import closing
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
 from typing import List, Dict, Optional, Union
 import logging
-from functions.sse import format_sse_event, CONNECTIONS
+from functions.sse import (
+    format_sse_event, publish_event, publish_event_threadsafe, run_topics, DeltaCoalescer
+)
+from functions.execution_plan import execution_plan_cache, NodeSpec
 from pydantic import BaseModel 
 logger = logging.getLogger(__name__)
 
+# Upper bound on sibling nodes of one run calling their models at the same time
+WORKFLOW_MAX_PARALLEL_NODES = int(os.getenv("WORKFLOW_MAX_PARALLEL_NODES", "8"))
+# Native asyncio execution (agent.arun + AsyncSession); set to 0 to fall back to the threaded sync path
+WORKFLOW_ASYNC_EXECUTION = os.getenv("WORKFLOW_ASYNC_EXECUTION", "1") == "1"
+# Stream model output as batched agent-delta SSE events while a node runs
+WORKFLOW_STREAM_DELTAS = os.getenv("WORKFLOW_STREAM_DELTAS", "1") == "1"
+
+class NodeCancelledError(Exception):
+    """Raised inside a node whose run already failed on another branch."""
 
 class ResponseModel(BaseModel):
     agent_name: str
@@ -88,136 +116,555 @@ async def create_agent_for_entity(user_message: str, goal: str, entity: Workflow
     return agent
 
 async def run_workflow(
-    db: Session, 
-    workflow_id: str, 
-    text: str, 
-    agent_prompts: Optional[Union[List[str], Dict[str, str]]] = None
+    workflow_id: uuid.UUID,
+    text: str,
+    run_id: uuid.UUID,
+    agent_prompts: Optional[Union[List[str], Dict[str, str]]] = None,
+    bypass_cache: bool = False
+) -> str:
+    """Run a workflow on the configured execution path, each with its own session"""
+    execution = "async" if WORKFLOW_ASYNC_EXECUTION else "threaded"
+    with trace_run("workflow.run", run_id, workflow_id=str(workflow_id), execution=execution):
+        if WORKFLOW_ASYNC_EXECUTION:
+            async with database.async_session() as db:
+                return await process_workflow_async(db, workflow_id, text, run_id, agent_prompts, bypass_cache)
+        # to_thread carries the trace context over to the executor thread
+        return await asyncio.to_thread(
+            _process_workflow_in_session, workflow_id, text, run_id, agent_prompts, bypass_cache
+        )
+
+def _process_workflow_in_session(
+    workflow_id: uuid.UUID,
+    text: str,
+    run_id: uuid.UUID,
+    agent_prompts: Optional[Union[List[str], Dict[str, str]]] = None,
+    bypass_cache: bool = False
 ) -> str:
-    """Helper function to run workflow from synchronous code"""
+    db = database.SessionLocal()
     try:
-        workflow_uuid = uuid.UUID(workflow_id)
-        run_id = uuid.uuid4()
-        return await process_workflow_with_chain(db, workflow_uuid, text, run_id, agent_prompts)
-    except ValueError:
-        return f"Error: Invalid workflow ID format: {workflow_id}"
+        return process_workflow_with_chain(db, workflow_id, text, run_id, agent_prompts, bypass_cache)
+    finally:
+        db.close()
+
+def _agent_response_event(node_call: dict, agent_response_content) -> dict:
+    return {
+        "run_id": node_call["run_id"],
+        "entity_id": node_call["entity_id"],
+        "name": node_call["agent_params"]["name"],
+        "role": node_call["agent_params"]["role"],
+        "agent_response": agent_response_content
+    }
+
+def _agent_delta_event(node_call: dict, delta: str, seq: int) -> dict:
+    return {
+        "run_id": node_call["run_id"],
+        "entity_id": node_call["entity_id"],
+        "name": node_call["agent_params"]["name"],
+        "seq": seq,
+        "delta": delta
+    }
+
+def _content_delta(chunk: RunResponse) -> Optional[str]:
+    """Text of a streamed content chunk; intermediate events carry none"""
+    if chunk.event != RunEvent.run_response.value or not isinstance(chunk.content, str):
+        return None
+    return chunk.content or None
+
+def _reset_run_header(run: WorkflowRun, total_steps: int, completed_steps: List[RunStep]):
+    """Mark a new or resumed run as processing with the totals of the steps already done"""
+    run.status = "processing"
+    run.total_steps = total_steps
+    run.completed_steps = len(completed_steps)
+    run.failed_steps = 0
+    run.cache_hits = sum(1 for step in completed_steps if step.cache_hit)
+    run.started_at = run.started_at or datetime.utcnow()
+    run.finished_at = None
+
+def _start_run(
+    db: Session,
+    workflow_id: uuid.UUID,
+    run_id: uuid.UUID,
+    total_steps: int,
+    completed_steps: List[RunStep]
+) -> WorkflowRun:
+    """Create or resume the WorkflowRun header of a run"""
+    run = db.get(WorkflowRun, run_id)
+    if not run:
+        run = WorkflowRun(id=run_id, workflow_id=workflow_id)
+        db.add(run)
+    _reset_run_header(run, total_steps, completed_steps)
+    db.commit()
+    return run
+
+RUN_STATE_COLUMNS = (
+    "id", "workflow_id", "status", "total_steps", "completed_steps", "failed_steps", "cache_hits",
+    "created_at", "started_at", "finished_at"
+)
+
+def _run_state(run: WorkflowRun) -> dict:
+    return {column: getattr(run, column) for column in RUN_STATE_COLUMNS}
+
+def _start_entity_run(
+    step: Optional[RunStep],
+    run_id: uuid.UUID,
+    run_created_at: datetime,
+    entity_id: uuid.UUID,
+    input_text: str
+) -> dict:
+    """Record an entity as processing; returns its step state for the recorder"""
+    state = {
+        "run_id": run_id,
+        "entity_id": entity_id,
+        "run_created_at": run_created_at,
+        "input_text": input_text,
+        "output_text": None,
+        "input_tokens": count_tokens(input_text),
+        "context_tokens": None,
+        "output_tokens": None,
+        "status": "processing",
+        "cache_hit": False,
+        "created_at": step.created_at if step else datetime.utcnow(),
+        "finished_at": None,
+    }
+    run_recorder.record_step(state)
+    return state
+
+def _complete_entity_run(run: dict, step: dict, output_text: str, cache_hit: bool, context_tokens: Optional[int]):
+    """Record a finished step and roll it into the run totals"""
+    step.update(
+        output_text=output_text, status="completed", cache_hit=cache_hit, finished_at=datetime.utcnow(),
+        context_tokens=context_tokens, output_tokens=count_tokens(output_text),
+    )
+    run["completed_steps"] += 1
+    if cache_hit:
+        run["cache_hits"] += 1
+    run_recorder.record_step(step)
+    run_recorder.record_run(run)
+
+def _fail_entity_run(run: dict, step: dict, error: str):
+    step.update(output_text=error, status="failed", finished_at=datetime.utcnow())
+    run.update(status="failed", failed_steps=run["failed_steps"] + 1, finished_at=datetime.utcnow())
+    run_recorder.record_step(step)
+    run_recorder.record_run(run)
+
+def _fail_in_flight(run: dict, step: dict, error: str, siblings) -> None:
+    """Record a failed entity with the siblings cancelled along with it"""
+    _fail_entity_run(run, step, error)
+    for _, sibling, sibling_call in siblings:
+        _fail_entity_run(run, sibling, "Error: cancelled after a sibling entity failed")
+        sibling_call["span"].end(error="cancelled after a sibling entity failed")
+
+def _finish_run(run: dict):
+    run.update(status="completed", finished_at=datetime.utcnow())
+    run_recorder.record_run(run)
+
+def _flush_run_state(run_id: uuid.UUID):
+    """
+    Write a finished or failed run right away. The states stay dirty when this
+    fails and the interval flush retries them, so the run's outcome stands.
+    """
+    try:
+        run_recorder.flush()
+    except Exception as inner_e:
+        logger.error(f"Could not update run status of {run_id}, left to the interval flush: {str(inner_e)}")
+
+def _prepare_node_call(
+    node: NodeSpec,
+    run_id: uuid.UUID,
+    topics: List[str],
+    input_text: str,
+    agent_prompts: Optional[Union[List[str], Dict[str, str]]] = None,
+    bypass_cache: bool = False
+) -> dict:
+    """Plain settings of one node execution, safe to hand over to a worker thread"""
+    agent_params = {
+        "name": node.agent_name,
+        "role": node.agent_role,
+        "instructions": node.prompt or agent_prompts,
+    }
+    # Each node answers once per run, so a session would never hold an earlier turn:
+    # node agents run without history and without session storage
+    agent_params["history_responses"] = 0
+    budget = node.context_budget
+    model_id = GROQ_MODEL_ID
+    return {
+        "run_id": str(run_id),
+        "entity_id": str(node.id),
+        "topics": topics,
+        "agent_params": agent_params,
+        "agent_key": agent_cache_key(node.id, node.updated_at, agent_params, model_id),
+        "model_id": model_id,
+        "input_text": input_text,
+        "context_budget": budget,
+        # Keyed on the unfitted input, so a hit also skips fitting it to the budget
+        "response_key": response_cache_key(
+            model_id, agent_params["instructions"], node.prompt, input_text, budget.cache_key
+        ),
+        "cache_ttl": node.cache_ttl,
+        "bypass_cache": bypass_cache,
+    }
+
+def _check_cancelled(node_call: dict):
+    """Stop a threaded node once a sibling failed the run; set by process_workflow_with_chain"""
+    if node_call["cancelled"].is_set():
+        raise NodeCancelledError(f"Entity {node_call['entity_id']} cancelled after a sibling entity failed")
+
+def _agent_factory(node_call: dict):
+    """Builds the node agent when the agent cache has no idle instance"""
+    def factory():
+        with span("agent.build", agent=node_call["agent_params"]["name"]):
+            return create_agent_with_config(apply_config=True, **node_call["agent_params"])
+    return factory
+
+def _run_entity_agent(node_call: dict):
+    """
+    Answer a node from the response cache or run its leased agent on its
+    input fitted to the context budget. Executed in a worker thread;
+    returns (content, cache_hit, tokens of the input the agent was given).
+    """
+    with use_span(node_call["span"]):
+        use_cache = node_call["cache_ttl"] > 0
+        if use_cache and not node_call["bypass_cache"]:
+            with span("cache.lookup") as lookup:
+                cached = response_cache.get(node_call["response_key"])
+                lookup.set_attributes(hit=cached is not None)
+            if cached is not None:
+                return cached, True, None
+
+        _check_cancelled(node_call)
+        with span("context.fit", strategy=node_call["context_budget"].strategy):
+            input_text, context_tokens = fit_context(node_call["input_text"], node_call["context_budget"])
+        with agent_cache.lease(node_call["agent_key"], _agent_factory(node_call)) as agent:
+            _check_cancelled(node_call)
+            with span("agent.run", model=node_call["model_id"], stream=WORKFLOW_STREAM_DELTAS) as run_span, \
+                    fallback_routes() as fallbacks:
+                if WORKFLOW_STREAM_DELTAS:
+                    content = _stream_agent_run(agent, node_call, input_text)
+                else:
+                    agent_response: RunResponse = agent.run(input_text)
+                    content = agent_response.content
+                run_span.set_attributes(fallback_routes=",".join(fallbacks) or None)
+
+        _check_cancelled(node_call)
+        # The cache is keyed by the primary model; an answer from a fallback route is not stored under it
+        if use_cache and not fallbacks:
+            with span("cache.store"):
+                response_cache.put(node_call["response_key"], node_call["model_id"], content, node_call["cache_ttl"])
+        return content, False, context_tokens
+
+def _stream_agent_run(agent: Agent, node_call: dict, input_text: str) -> str:
+    """Run the agent with stream=True, pushing coalesced deltas; returns the full text"""
+    coalescer = DeltaCoalescer()
+    chunks = []
+    # Closing the stream on the way out ends the model request right away
+    with closing(agent.run(input_text, stream=True)) as stream:
+        for chunk in stream:
+            _check_cancelled(node_call)
+            delta = _content_delta(chunk)
+            if delta is None:
+                continue
+            chunks.append(delta)
+            batch = coalescer.add(delta)
+            if batch:
+                publish_event_threadsafe(
+                    node_call["topics"], "agent-delta", _agent_delta_event(node_call, batch, coalescer.seq)
+                )
+
+    batch = coalescer.flush()
+    if batch:
+        publish_event_threadsafe(
+            node_call["topics"], "agent-delta", _agent_delta_event(node_call, batch, coalescer.seq)
+        )
+    return "".join(chunks)
 
 def process_workflow_with_chain(
     db: Session,
     workflow_id: uuid.UUID, 
     text: str,
     run_id: uuid.UUID,
-    agent_prompts: Optional[Union[List[str], Dict[str, str]]] = None
+    agent_prompts: Optional[Union[List[str], Dict[str, str]]] = None,
+    bypass_cache: bool = False
 ) -> str:
     """
-    Process text through a workflow of agents using an agentic team structure.
-    Each entity processing is tracked with a Run record.
+    Process text through the workflow graph built from workflow_connections.
+    Nodes start as soon as all their parents completed, so independent branches
+    run concurrently; a node with several parents receives their merged outputs.
+    The run is tracked by a WorkflowRun header and one RunStep per entity.
     """
     logger.info(f"Starting workflow processing for workflow ID: {workflow_id}")
     
-    # Find the workflow
-    workflow = db.query(Workflow).filter(Workflow.id == workflow_id).first()
-    if not workflow:
+    # Compiled plan of the current workflow version; hot workflows need no queries here
+    with span("plan.load", workflow_id=str(workflow_id)):
+        plan = execution_plan_cache.get(db, workflow_id)
+    if not plan:
         logger.error(f"Workflow with ID {workflow_id} not found")
         raise ValueError(f"Workflow with ID {workflow_id} not found")
     
-    # Get all entities for this workflow, sorted by order
-    entities = db.query(WorkflowEntity).filter(
-        WorkflowEntity.workflow_id == workflow_id
-    ).order_by(WorkflowEntity.order).all()
-    
-    if not entities:
-        logger.error(f"No entities found for workflow '{workflow.name}'")
-        raise ValueError(f"No entities found for workflow '{workflow.name}'")
-    
-    current_input = text
-    final_output = ""
-    
-    # Process each entity sequentially and track with Run records
-    for entity in entities:
-        logger.info(f"Processing entity {entity.id} ({entity.type})")
-        
-        # Create or update Run record for this entity with "pending" status
-        entity_run = db.query(Run).filter(
-            Run.id == run_id,
-            Run.workflow_entity_id == entity.id
-        ).first()
-        
-        if entity_run:
-            entity_run.status = "processing"
-            entity_run.input_text = current_input
-        else:
-            entity_run = Run(
-                id=run_id,
-                workflow_id=workflow_id,
-                workflow_entity_id=entity.id,
-                input_text=current_input,
-                output_text="",
-                status="processing"
+    graph = plan.graph
+    if not graph.entities:
+        logger.error(f"No entities found for workflow '{plan.name}'")
+        raise ValueError(f"No entities found for workflow '{plan.name}'")
+
+    topics = run_topics(run_id, workflow_id, plan.project_id)
+    with span("db.load_steps"):
+        existing_steps = {
+            step.entity_id: step
+            for step in db.query(RunStep).options(selectinload(RunStep.output_payload)).filter(RunStep.run_id == run_id).all()
+        }
+
+    # A resumed run (e.g. a requeued job) keeps the work that already finished
+    completed_steps = [
+        step for entity_id, step in existing_steps.items()
+        if step.status == "completed" and entity_id in graph.entities
+    ]
+    outputs: Dict[uuid.UUID, str] = {step.entity_id: step.output_text for step in completed_steps}
+    # The header is committed once; later transitions go through the write-behind recorder
+    with span("db.start_run"):
+        run = _run_state(_start_run(db, workflow_id, run_id, len(graph.entities), completed_steps))
+    run_created_at = run["created_at"]
+    pending = [entity_id for entity_id in graph.order if entity_id not in outputs]
+    in_flight: Dict[Future, tuple] = {}
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(WORKFLOW_MAX_PARALLEL_NODES, len(pending))))
+    # Set when a node fails; running siblings stop at their next model chunk or step
+    cancelled = threading.Event()
+
+    def schedule_ready_entities():
+        for entity_id in list(pending):
+            if not graph.is_ready(entity_id, outputs):
+                continue
+            pending.remove(entity_id)
+            node = plan.nodes[entity_id]
+            logger.info(f"Processing entity {entity_id} ({node.type})")
+
+            current_input = graph.node_input(entity_id, outputs, text)
+            node_call = _prepare_node_call(node, run_id, topics, current_input, agent_prompts, bypass_cache)
+            node_call["cancelled"] = cancelled
+            # Ended when the node completes or fails; the worker parents its spans to it
+            node_call["span"] = start_span(
+                "workflow.node", entity_id=str(entity_id), entity_type=node.type, model=node_call["model_id"]
             )
-            db.add(entity_run)
-        
-        db.commit()
-        
+            step = _start_entity_run(existing_steps.get(entity_id), run_id, run_created_at, entity_id, current_input)
+            future = pool.submit(_run_entity_agent, node_call)
+            in_flight[future] = (entity_id, step, node_call)
+
+    try:
+        schedule_ready_entities()
+
+        while in_flight:
+            done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for future in done:
+                entity_id, step, node_call = in_flight.pop(future)
+                try:
+                    agent_response_content, cache_hit, context_tokens = future.result()
+
+                    # Broadcast SSE event for successful agent response
+                    publish_event_threadsafe(
+                        topics, "agent-response", _agent_response_event(node_call, agent_response_content)
+                    )
+
+                    # Update the step with completed status and agent response
+                    _complete_entity_run(run, step, agent_response_content, cache_hit, context_tokens)
+                    node_call["span"].set_attributes(cache_hit=cache_hit, context_tokens=context_tokens)
+                    node_call["span"].end()
+
+                    # The output of this entity feeds every child of it
+                    outputs[entity_id] = agent_response_content
+                except Exception as e:
+                    logger.error(f"Error processing entity {entity_id}: {str(e)}")
+                    node_call["span"].end(error=e)
+                    # Running siblings are stopped and awaited, so none of them outlives the failed run
+                    cancelled.set()
+                    pool.shutdown(wait=True, cancel_futures=True)
+                    _fail_in_flight(run, step, f"Error: {str(e)}", in_flight.values())
+                    _flush_run_state(run_id)
+                    raise
+
+            schedule_ready_entities()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    _finish_run(run)
+    _flush_run_state(run_id)
+    
+    logger.info("Workflow processing completed successfully")
+    return graph.merge_outputs(graph.sinks, outputs)
+
+async def _start_run_async(
+    db: AsyncSession,
+    workflow_id: uuid.UUID,
+    run_id: uuid.UUID,
+    total_steps: int,
+    completed_steps: List[RunStep]
+) -> WorkflowRun:
+    """Async variant of _start_run"""
+    run = await db.get(WorkflowRun, run_id)
+    if not run:
+        run = WorkflowRun(id=run_id, workflow_id=workflow_id)
+        db.add(run)
+    _reset_run_header(run, total_steps, completed_steps)
+    await db.commit()
+    return run
+
+async def _arun_entity_agent(semaphore: asyncio.Semaphore, node_call: dict):
+    """Async variant of _run_entity_agent"""
+    with use_span(node_call["span"]):
+        use_cache = node_call["cache_ttl"] > 0
+        if use_cache and not node_call["bypass_cache"]:
+            with span("cache.lookup") as lookup:
+                cached = await response_cache.aget(node_call["response_key"])
+                lookup.set_attributes(hit=cached is not None)
+            if cached is not None:
+                return cached, True, None
+
+        with span("node.wait_slot"):
+            await semaphore.acquire()
         try:
-            # Create agent for this entity
-            agent = create_agent_with_config(
-                name=entity.label or f"{entity.type.title()} Agent",
-                role=f"Processes content as a {entity.type}",
-                instructions=entity.prompt or agent_prompts,
-                apply_config=True,
+            # A summarizing budget calls a model too, so fitting counts against the node concurrency
+            with span("context.fit", strategy=node_call["context_budget"].strategy):
+                input_text, context_tokens = await afit_context(node_call["input_text"], node_call["context_budget"])
+            with agent_cache.lease(node_call["agent_key"], _agent_factory(node_call)) as agent:
+                with span("agent.run", model=node_call["model_id"], stream=WORKFLOW_STREAM_DELTAS) as run_span, \
+                        fallback_routes() as fallbacks:
+                    if WORKFLOW_STREAM_DELTAS:
+                        content = await _astream_agent_run(agent, node_call, input_text)
+                    else:
+                        agent_response: RunResponse = await agent.arun(input_text)
+                        content = agent_response.content
+                    run_span.set_attributes(fallback_routes=",".join(fallbacks) or None)
+        finally:
+            semaphore.release()
+
+        if use_cache and not fallbacks:
+            with span("cache.store"):
+                await response_cache.aput(node_call["response_key"], node_call["model_id"], content, node_call["cache_ttl"])
+        return content, False, context_tokens
+
+async def _astream_agent_run(agent: Agent, node_call: dict, input_text: str) -> str:
+    """Async variant of _stream_agent_run"""
+    coalescer = DeltaCoalescer()
+    chunks = []
+    async for chunk in await agent.arun(input_text, stream=True):
+        delta = _content_delta(chunk)
+        if delta is None:
+            continue
+        chunks.append(delta)
+        batch = coalescer.add(delta)
+        if batch:
+            await publish_event(
+                node_call["topics"], "agent-delta", _agent_delta_event(node_call, batch, coalescer.seq)
             )
-            
-            agent_response: RunResponse = agent.run(current_input)
-            agent_response_content = agent_response.content  
-
-            # Ensure agent_response is JSON-serializable
-            if not isinstance(agent_response, (str, dict, list, int, float, bool, type(None))):
-                agent_response = str(agent_response)
-            
-            # Broadcast SSE event for successful agent response
-            if CONNECTIONS:
-                sse_data = {
-                    "name": agent.name,
-                    "role": agent.role,
-                    "agent_response": agent_response_content 
-                }
-                for client_id, queue in CONNECTIONS.items():
-                    queue.put_nowait({
-                        "event": "agent-response",
-                        "data": sse_data
-                    })
-
-            # Update run record with completed status and agent response
-            entity_run.output_text = agent_response_content 
-            entity_run.status = "completed"
-            db.commit()
-            
-            # The output of this entity becomes the input for the next one
-            current_input = agent_response_content 
-            final_output = agent_response_content  
-            
-        except Exception as e:
-            logger.error(f"Error processing entity {entity.id}: {str(e)}")
-            # Rollback transaction to allow a new one
-            db.rollback()
-            
-            # Create a new transaction to update the error status
-            try:
-                entity_run = db.query(Run).filter(
-                    Run.id == run_id,
-                    Run.workflow_entity_id == entity.id
-                ).first()
-                
-                if entity_run:
-                    entity_run.status = "failed"
-                    entity_run.output_text = f"Error: {str(e)}"
-                    db.commit()
-            except Exception as inner_e:
-                logger.error(f"Could not update run status after error: {str(inner_e)}")
-                db.rollback()
-            
-            raise
-    
-    logger.info(f"Workflow processing completed successfully")
-    return final_output
 
+    batch = coalescer.flush()
+    if batch:
+        await publish_event(
+            node_call["topics"], "agent-delta", _agent_delta_event(node_call, batch, coalescer.seq)
+        )
+    return "".join(chunks)
+
+async def process_workflow_async(
+    db: AsyncSession,
+    workflow_id: uuid.UUID,
+    text: str,
+    run_id: uuid.UUID,
+    agent_prompts: Optional[Union[List[str], Dict[str, str]]] = None,
+    bypass_cache: bool = False
+) -> str:
+    """
+    Asyncio counterpart of process_workflow_with_chain.
+    Node calls are tasks on the running loop, so one worker can keep many
+    LLM requests in flight without holding a thread per run.
+    """
+    logger.info(f"Starting async workflow processing for workflow ID: {workflow_id}")
+
+    with span("plan.load", workflow_id=str(workflow_id)):
+        plan = await execution_plan_cache.aget(db, workflow_id)
+    if not plan:
+        logger.error(f"Workflow with ID {workflow_id} not found")
+        raise ValueError(f"Workflow with ID {workflow_id} not found")
+
+    graph = plan.graph
+    if not graph.entities:
+        logger.error(f"No entities found for workflow '{plan.name}'")
+        raise ValueError(f"No entities found for workflow '{plan.name}'")
+
+    topics = run_topics(run_id, workflow_id, plan.project_id)
+    with span("db.load_steps"):
+        existing_steps = {
+            step.entity_id: step
+            for step in (await db.execute(
+                select(RunStep).options(selectinload(RunStep.output_payload)).where(RunStep.run_id == run_id)
+            )).scalars().all()
+        }
+
+    # A resumed run (e.g. a requeued job) keeps the work that already finished
+    completed_steps = [
+        step for entity_id, step in existing_steps.items()
+        if step.status == "completed" and entity_id in graph.entities
+    ]
+    outputs: Dict[uuid.UUID, str] = {step.entity_id: step.output_text for step in completed_steps}
+    with span("db.start_run"):
+        run = _run_state(await _start_run_async(db, workflow_id, run_id, len(graph.entities), completed_steps))
+    run_created_at = run["created_at"]
+    pending = [entity_id for entity_id in graph.order if entity_id not in outputs]
+    in_flight: Dict[asyncio.Task, tuple] = {}
+    semaphore = asyncio.Semaphore(WORKFLOW_MAX_PARALLEL_NODES)
+
+    async def schedule_ready_entities():
+        for entity_id in list(pending):
+            if not graph.is_ready(entity_id, outputs):
+                continue
+            pending.remove(entity_id)
+            node = plan.nodes[entity_id]
+            logger.info(f"Processing entity {entity_id} ({node.type})")
+
+            current_input = graph.node_input(entity_id, outputs, text)
+            node_call = _prepare_node_call(node, run_id, topics, current_input, agent_prompts, bypass_cache)
+            # Ended when the node completes or fails; the worker parents its spans to it
+            node_call["span"] = start_span(
+                "workflow.node", entity_id=str(entity_id), entity_type=node.type, model=node_call["model_id"]
+            )
+            step = _start_entity_run(existing_steps.get(entity_id), run_id, run_created_at, entity_id, current_input)
+            task = asyncio.create_task(_arun_entity_agent(semaphore, node_call))
+            in_flight[task] = (entity_id, step, node_call)
+
+    try:
+        await schedule_ready_entities()
+
+        while in_flight:
+            done, _ = await asyncio.wait(list(in_flight), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                entity_id, step, node_call = in_flight.pop(task)
+                try:
+                    agent_response_content, cache_hit, context_tokens = task.result()
+
+                    await publish_event(
+                        topics, "agent-response", _agent_response_event(node_call, agent_response_content)
+                    )
+
+                    _complete_entity_run(run, step, agent_response_content, cache_hit, context_tokens)
+                    node_call["span"].set_attributes(cache_hit=cache_hit, context_tokens=context_tokens)
+                    node_call["span"].end()
+
+                    outputs[entity_id] = agent_response_content
+                except Exception as e:
+                    logger.error(f"Error processing entity {entity_id}: {str(e)}")
+                    node_call["span"].end(error=e)
+                    # Siblings are cancelled before the failure is recorded, so none of them outlives the run
+                    for sibling in in_flight:
+                        sibling.cancel()
+                    await asyncio.gather(*in_flight, return_exceptions=True)
+                    _fail_in_flight(run, step, f"Error: {str(e)}", in_flight.values())
+                    await asyncio.to_thread(_flush_run_state, run_id)
+                    raise
+
+            await schedule_ready_entities()
+    finally:
+        for task in in_flight:
+            task.cancel()
+
+    _finish_run(run)
+    await asyncio.to_thread(_flush_run_state, run_id)
+
+    logger.info("Async workflow processing completed successfully")
+    return graph.merge_outputs(graph.sinks, outputs)
@@ -0,0 +1,125 @@
+import uuid
+import logging
+from typing import Dict, List
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.workflow import WorkflowEntity, workflow_connections
+
+logger = logging.getLogger(__name__)
+
+
+class WorkflowCycleError(ValueError):
+    """Raised when the connections of a workflow do not form a DAG."""
+
+
+class WorkflowGraph:
+    """
+    Execution graph of a workflow built from workflow_connections.
+    Workflows without any connections fall back to a linear chain by `order`.
+    """
+
+    def __init__(self, entities: List[WorkflowEntity], edges: List[tuple]):
+        self.entities: Dict[uuid.UUID, WorkflowEntity] = {entity.id: entity for entity in entities}
+        # Position in the `order` sort, used to keep scheduling and merging deterministic
+        self.rank: Dict[uuid.UUID, int] = {entity.id: i for i, entity in enumerate(entities)}
+        # Snapshot of the headings so merging never triggers a lazy load after a commit
+        self.labels: Dict[uuid.UUID, str] = {
+            entity.id: entity.label or entity.type.title() for entity in entities
+        }
+        self.parents: Dict[uuid.UUID, List[uuid.UUID]] = {entity_id: [] for entity_id in self.entities}
+        self.children: Dict[uuid.UUID, List[uuid.UUID]] = {entity_id: [] for entity_id in self.entities}
+
+        for source_id, target_id in edges:
+            if source_id not in self.entities or target_id not in self.entities:
+                logger.warning(f"Ignoring dangling connection {source_id} -> {target_id}")
+                continue
+            if target_id in self.children[source_id]:
+                continue
+            self.children[source_id].append(target_id)
+            self.parents[target_id].append(source_id)
+
+        for entity_id in self.entities:
+            self.parents[entity_id].sort(key=self.rank.get)
+            self.children[entity_id].sort(key=self.rank.get)
+
+        self.levels = self._topological_levels()
+        self.order = [entity_id for level in self.levels for entity_id in level]
+
+    def _topological_levels(self) -> List[List[uuid.UUID]]:
+        """Kahn's algorithm grouped by depth; every level can run concurrently"""
+        in_degree = {entity_id: len(parents) for entity_id, parents in self.parents.items()}
+        level = sorted((entity_id for entity_id, degree in in_degree.items() if degree == 0), key=self.rank.get)
+        levels = []
+        visited = 0
+
+        while level:
+            levels.append(level)
+            visited += len(level)
+            next_level = []
+            for entity_id in level:
+                for child_id in self.children[entity_id]:
+                    in_degree[child_id] -= 1
+                    if in_degree[child_id] == 0:
+                        next_level.append(child_id)
+            level = sorted(next_level, key=self.rank.get)
+
+        if visited != len(self.entities):
+            cyclic = [
+                self.entities[entity_id].external_id
+                for entity_id, degree in in_degree.items() if degree > 0
+            ]
+            raise WorkflowCycleError(f"Workflow contains a cycle between entities: {', '.join(sorted(cyclic))}")
+
+        return levels
+
+    @property
+    def sinks(self) -> List[uuid.UUID]:
+        return [entity_id for entity_id in self.order if not self.children[entity_id]]
+
+    def is_ready(self, entity_id: uuid.UUID, outputs: Dict[uuid.UUID, str]) -> bool:
+        return all(parent_id in outputs for parent_id in self.parents[entity_id])
+
+    def node_input(self, entity_id: uuid.UUID, outputs: Dict[uuid.UUID, str], text: str) -> str:
+        """Roots receive the run input, other nodes the merged output of their parents"""
+        parents = self.parents[entity_id]
+        if not parents:
+            return text
+        return self.merge_outputs(parents, outputs)
+
+    def merge_outputs(self, entity_ids: List[uuid.UUID], outputs: Dict[uuid.UUID, str]) -> str:
+        if len(entity_ids) == 1:
+            return outputs[entity_ids[0]]
+        sections = [f"### {self.labels[entity_id]}\n{outputs[entity_id]}" for entity_id in entity_ids]
+        return "\n\n".join(sections)
+
+
+def entities_query(workflow_id: uuid.UUID):
+    return select(WorkflowEntity).where(
+        WorkflowEntity.workflow_id == workflow_id
+    ).order_by(WorkflowEntity.order)
+
+def edges_query(workflow_id: uuid.UUID):
+    return select(
+        workflow_connections.c.source_id,
+        workflow_connections.c.target_id
+    ).where(workflow_connections.c.workflow_id == workflow_id)
+
+def build_graph(entities: List[WorkflowEntity], edges: List[tuple]) -> WorkflowGraph:
+    edges = [(source_id, target_id) for source_id, target_id in edges]
+    if not edges:
+        # Legacy workflows without connections run as a chain sorted by order
+        edges = [(entities[i].id, entities[i + 1].id) for i in range(len(entities) - 1)]
+    return WorkflowGraph(entities, edges)
+
+def load_workflow_graph(db: Session, workflow_id: uuid.UUID) -> WorkflowGraph:
+    """Load the entities and connections of a workflow and build its execution graph"""
+    entities = db.execute(entities_query(workflow_id)).scalars().all()
+    edges = db.execute(edges_query(workflow_id)).all()
+    return build_graph(entities, edges)
+
+async def load_workflow_graph_async(db: AsyncSession, workflow_id: uuid.UUID) -> WorkflowGraph:
+    """Async variant of load_workflow_graph"""
+    entities = (await db.execute(entities_query(workflow_id))).scalars().all()
+    edges = (await db.execute(edges_query(workflow_id))).all()
+    return build_graph(entities, edges)
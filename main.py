@@ -1,6 +1,9 @@
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, HTTPException, Query
+from typing import List, Optional
+from uuid import UUID
 from fastapi.responses import JSONResponse
 import database
+from models.workflow import Base
 import os
 import uvicorn
 from service_registry import ServiceRegistry
@@ -11,7 +14,17 @@ import time
 import json
 from routes import api_router
 from fastapi.responses import StreamingResponse
-from functions.sse import event_generator
+from functions.sse import (
+    event_generator, change_subscription, subscription_topics, start_event_delivery, stop_event_delivery
+)
+from schemas.workflow_schema import SseSubscriptionRequest, SseSubscriptionResponse
+from functions.run_queue import run_worker_pool
+from functions.agent_storage import agent_storage_retention_loop
+from functions.run_retention import run_retention_loop
+from functions.run_recorder import run_recorder, run_recorder_loop
+from functions.http_clients import close_http_clients
+from functions.tracing import tracer, trace_export_loop
+import asyncio
 from fastapi.middleware.cors import CORSMiddleware
 
 logging.basicConfig(
@@ -22,12 +35,34 @@ logger = logging.getLogger("workflow_service")
 
 service_registry = ServiceRegistry()
 
+# Schema changes ship as Alembic migrations; create_all only bootstraps local SQLite databases
+DB_CREATE_ALL = os.getenv("DB_CREATE_ALL", "1" if database.engine.dialect.name == "sqlite" else "0") == "1"
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    service_registry.register_service()
+    if DB_CREATE_ALL:
+        await asyncio.to_thread(Base.metadata.create_all, bind=database.engine)
+        logger.info("Database tables created")
+    # Registration happens on the heartbeat thread so a slow Consul never delays serving
     service_registry.start_heartbeat()
+    await start_event_delivery()
+    await run_worker_pool.start()
+    retention_task = asyncio.create_task(agent_storage_retention_loop())
+    run_retention_task = asyncio.create_task(run_retention_loop())
+    recorder_task = asyncio.create_task(run_recorder_loop())
+    trace_task = asyncio.create_task(trace_export_loop())
     yield
-    service_registry.deregister_service()
+    run_retention_task.cancel()
+    retention_task.cancel()
+    await run_worker_pool.stop()
+    recorder_task.cancel()
+    # Transitions of runs interrupted by the shutdown are written before exiting
+    await run_recorder.aflush()
+    trace_task.cancel()
+    await tracer.aexport()
+    await close_http_clients()
+    await stop_event_delivery()
+    await asyncio.to_thread(service_registry.deregister_service)
     
 app = FastAPI(
     title="Workflow service",
@@ -90,14 +125,6 @@ async def log_requests(request: Request, call_next):
         logger.error(f"Request error: {json.dumps(log_data)}")
         raise
 
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-        
-
 @app.get("/health")
 def health_check():
     """Health check endpoint for service discovery"""
@@ -109,17 +136,40 @@ def health_check():
         logger.error(f"Health check failed: {str(e)}")
         raise HTTPException(status_code=503, detail="Service unhealthy")
     
-@app.on_event("startup")
-def startup_db_client():
-    database.Base.metadata.create_all(bind=database.engine)
-    logger.info("Database tables created")
-    
 @app.get("/sse/{client_id}")
-async def sse_endpoint(request: Request, client_id: str):
+async def sse_endpoint(
+    request: Request,
+    client_id: str,
+    run_id: Optional[List[UUID]] = Query(None),
+    workflow_id: Optional[List[UUID]] = Query(None),
+    project_id: Optional[List[UUID]] = Query(None),
+):
+    """Event stream of a client; run events only reach clients subscribed to their run, workflow or project"""
+    topics = subscription_topics(run_id, workflow_id, project_id)
     return StreamingResponse(
-        event_generator(request, client_id),
+        event_generator(request, client_id, topics),
         media_type="text/event-stream",
     )
+
+@app.post("/sse/{client_id}/subscribe", response_model=SseSubscriptionResponse)
+async def sse_subscribe(client_id: str, subscription: SseSubscriptionRequest):
+    """Add run/workflow/project topics to a client's stream, on whichever worker serves it"""
+    topics = await change_subscription(client_id, subscription_topics(
+        subscription.run_ids, subscription.workflow_ids, subscription.project_ids
+    ))
+    if topics is None:
+        raise HTTPException(status_code=404, detail="SSE client not connected")
+    return {"client_id": client_id, "topics": topics}
+
+@app.post("/sse/{client_id}/unsubscribe", response_model=SseSubscriptionResponse)
+async def sse_unsubscribe(client_id: str, subscription: SseSubscriptionRequest):
+    """Remove topics from a client's stream"""
+    topics = await change_subscription(client_id, subscription_topics(
+        subscription.run_ids, subscription.workflow_ids, subscription.project_ids
+    ), subscribed=False)
+    if topics is None:
+        raise HTTPException(status_code=404, detail="SSE client not connected")
+    return {"client_id": client_id, "topics": topics}
     
 
 if __name__ == "__main__":
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, ForeignKey, DateTime, Table, Boolean, Float, JSON
+from sqlalchemy import Column, String, ForeignKey, DateTime, Table, Boolean, Float, JSON, Integer, Index, BigInteger, LargeBinary, func
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 import uuid
@@ -17,24 +17,37 @@ workflow_connections = Table(
     Column("label", String, nullable=True),
     Column("style", JSON, nullable=True),
     Column("animated", Boolean, default=True),
+    # Graph loads read every edge of a workflow; INCLUDE makes it an index-only scan
+    Index("ix_workflow_connections_workflow_id", "workflow_id", postgresql_include=["source_id", "target_id"]),
+    Index("ix_workflow_connections_source_id", "source_id"),
+    Index("ix_workflow_connections_target_id", "target_id"),
 )
 
 class Workflow(Base):
     __tablename__ = "workflows"
+    __table_args__ = (
+        Index("ix_workflows_project_id_created_at", "project_id", "created_at", "id"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name = Column(String, nullable=False)
     type = Column(String, nullable=False)
     description = Column(String, nullable=True)
     project_id = Column(UUID(as_uuid=True), nullable=False)
+    # Bumped on every entity/connection change; keys the compiled execution plans
+    version = Column(Integer, nullable=False, default=1)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow)
 
     entities = relationship("WorkflowEntity", back_populates="workflow", cascade="all, delete-orphan")
-    runs = relationship("Run", back_populates="workflow", cascade="all, delete-orphan")
+    runs = relationship("WorkflowRun", back_populates="workflow", cascade="all, delete-orphan", passive_deletes=True)
 
 class WorkflowEntity(Base):
     __tablename__ = "workflow_entities"
+    __table_args__ = (
+        Index("ix_workflow_entities_workflow_id_order", "workflow_id", "order"),
+        Index("ix_workflow_entities_workflow_id_external_id", "workflow_id", "external_id"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     external_id = Column(String, nullable=False) 
@@ -48,7 +61,7 @@ class WorkflowEntity(Base):
     updated_at = Column(DateTime, default=datetime.utcnow)
     
     workflow = relationship("Workflow", back_populates="entities")
-    runs = relationship("Run", back_populates="workflow_entity", cascade="all, delete-orphan")
+    run_steps = relationship("RunStep", back_populates="workflow_entity", cascade="all, delete-orphan", passive_deletes=True)
     
     # Define relationships for source and target connections
     source_connections = relationship(
@@ -59,16 +72,126 @@ class WorkflowEntity(Base):
         backref="target_connections"
     )
     
-class Run(Base):
-    __tablename__ = "runs"
+class WorkflowRun(Base):
+    __tablename__ = "workflow_runs"
+    __table_args__ = (
+        Index("ix_workflow_runs_workflow_id_created_at", "workflow_id", "created_at", "id"),
+    )
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    # One header row per run: status polling is a primary key lookup.
+    # On Postgres the table is partitioned by month on created_at and its primary key is
+    # (id, created_at); the partitions are managed by functions/run_retention.py
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)  # the run_id
+    workflow_id = Column(UUID(as_uuid=True), ForeignKey("workflows.id", ondelete="CASCADE"), nullable=False)
+    status = Column(String, nullable=False, default="pending")  # e.g., "queued", "processing", "completed", "failed"
+    total_steps = Column(Integer, nullable=False, default=0)
+    completed_steps = Column(Integer, nullable=False, default=0)
+    failed_steps = Column(Integer, nullable=False, default=0)
+    cache_hits = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    workflow = relationship("Workflow", back_populates="runs")
+    steps = relationship("RunStep", back_populates="run", cascade="all, delete-orphan", passive_deletes=True)
+
+class RunStep(Base):
+    __tablename__ = "run_steps"
+    __table_args__ = (
+        # Lets payload pruning find unreferenced payloads without scanning every step
+        Index("ix_run_steps_input_hash", "input_hash"),
+        Index("ix_run_steps_output_hash", "output_hash"),
+    )
+
+    # Partitioned like workflow_runs, on the created_at of the run so a run never spans partitions
+    run_id = Column(UUID(as_uuid=True), ForeignKey("workflow_runs.id", ondelete="CASCADE"), primary_key=True)
+    entity_id = Column(UUID(as_uuid=True), ForeignKey("workflow_entities.id", ondelete="CASCADE"), primary_key=True)
+    # Texts live once in run_payloads; a node's input often is its parent's output
+    input_hash = Column(String(64), ForeignKey("run_payloads.hash"), nullable=False)
+    output_hash = Column(String(64), ForeignKey("run_payloads.hash"), nullable=True)
+    status = Column(String, nullable=False, default="pending")  # e.g., "pending", "processing", "completed", "failed"
+    cache_hit = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    run_created_at = Column(DateTime, nullable=False)  # partition key, copy of WorkflowRun.created_at
+    # Token counts of the merged parent output, of the input after the context budget, and of the output
+    input_tokens = Column(Integer, nullable=True)
+    context_tokens = Column(Integer, nullable=True)
+    output_tokens = Column(Integer, nullable=True)
+
+    run = relationship("WorkflowRun", back_populates="steps")
+    workflow_entity = relationship("WorkflowEntity", back_populates="run_steps")
+    input_payload = relationship("RunPayload", foreign_keys=[input_hash])
+    output_payload = relationship("RunPayload", foreign_keys=[output_hash])
+
+    @property
+    def input_text(self) -> str:
+        return self.input_payload.text if self.input_payload is not None else ""
+
+    @property
+    def output_text(self) -> str:
+        return self.output_payload.text if self.output_payload is not None else ""
+
+class RunPayload(Base):
+    __tablename__ = "run_payloads"
+
+    # Content-addressed: sha256 of the UTF-8 text
+    hash = Column(String(64), primary_key=True)
+    codec = Column(String, nullable=False)  # e.g., "zstd", "gzip", "none"
+    size = Column(Integer, nullable=False)  # uncompressed bytes
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    @property
+    def text(self) -> str:
+        """Decompressed on access; rows loaded only for their hash never pay for it"""
+        from functions.run_payloads import decompress_payload
+        return decompress_payload(self.codec, self.data)
+
+class RunArchive(Base):
+    __tablename__ = "run_archive_index"
+
+    # Where an archived run can be re-hydrated from once its partition is gone
+    run_id = Column(UUID(as_uuid=True), primary_key=True)
+    workflow_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    created_at = Column(DateTime, nullable=False)
+    archive_path = Column(String, nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+    rehydrated_at = Column(DateTime, nullable=True)
+
+class RunJob(Base):
+    __tablename__ = "run_jobs"
+    __table_args__ = (
+        Index("ix_run_jobs_status_created_at", "status", "created_at"),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True)  # same value as the run_id
     workflow_id = Column(UUID(as_uuid=True), ForeignKey("workflows.id", ondelete="CASCADE"), nullable=False)
     input_text = Column(String, nullable=False)
-    output_text = Column(String, nullable=False)
+    agent_prompts = Column(JSON, nullable=True)
+    bypass_cache = Column(Boolean, nullable=False, default=False)
+    status = Column(String, nullable=False, default="queued")  # e.g., "queued", "processing", "completed", "failed"
+    attempts = Column(Integer, nullable=False, default=0)
+    worker_id = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    error = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    workflow_entity_id = Column(UUID(as_uuid=True), ForeignKey("workflow_entities.id", ondelete="CASCADE"), nullable=False)
-    status = Column(String, nullable=False, default="pending")  # e.g., "pending", "completed", "failed"
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
 
-    workflow = relationship("Workflow", back_populates="runs")
-    workflow_entity = relationship("WorkflowEntity", back_populates="runs")
+class ResponseCacheEntry(Base):
+    __tablename__ = "response_cache"
+
+    key = Column(String(64), primary_key=True)  # sha256 of model id, instructions, prompt and input hash
+    model_id = Column(String, nullable=False)
+    response_text = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class SseEventSpill(Base):
+    __tablename__ = "sse_event_spill"
+
+    # SSE bus events too large for a NOTIFY payload; purged after a few minutes
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    payload = Column(String, nullable=False)
+    created_at = Column(DateTime, nullable=False, server_default=func.now(), index=True)
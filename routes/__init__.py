@@ -1,5 +1,7 @@
 from fastapi import APIRouter
 from routes.workflow import router as workflow_router
+from routes.runs import router as runs_router
 
 api_router = APIRouter()
 api_router.include_router(workflow_router, prefix="", tags=["Workflows"])
+api_router.include_router(runs_router, prefix="/runs", tags=["Runs"])
@@ -1,124 +1,294 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import select
+from sqlalchemy.orm import Session, load_only, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Set
 from uuid import UUID
 import uuid
-from models.workflow import Workflow, Run
-from database import get_db
+import asyncio
+from models.workflow import Workflow, WorkflowRun, RunStep, RunJob, RunArchive
+from database import get_db, get_async_db
 from schemas.workflow_schema import (
     WorkflowRunRequest,
     WorkflowRunResponse,
-    RunStatusResponse
+    RunResponse,
+    RunStatusResponse,
+    RunJobResponse,
+    RunTraceResponse
 )
-from functions.wf_agents import process_workflow_with_chain
+from functions.wf_agents import run_workflow
+from functions.run_queue import enqueue_run, QueueFullError
+from functions.workflow_graph import WorkflowCycleError
+from functions.execution_plan import execution_plan_cache
+from functions.pagination import akeyset_paginate, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from functions.run_retention import rehydrate_run
+from functions.run_recorder import run_recorder
+from functions.tracing import run_waterfall, span, trace_run
 import logging
 logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["Run"])
 
 @router.post("/workflow/{workflow_id}", response_model=WorkflowRunResponse)
-def execute_workflow(
+async def execute_workflow(
     workflow_id: UUID,
     run_request: WorkflowRunRequest,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Execute a workflow with the provided input text.
     
     Creates a run ID and processes each entity in the workflow, 
-    tracking each entity's processing with a Run record.
+    tracking the run with a WorkflowRun header and a RunStep per entity.
+    With submit_async the run is queued for the worker pool and 202 is returned.
     """
-    # Check if workflow exists
-    db_workflow = db.query(Workflow).filter(Workflow.id == workflow_id).first()
-    if not db_workflow:
-        raise HTTPException(status_code=404, detail="Workflow not found")
-    
     # Create a unique run ID for this execution
     run_id = uuid.uuid4()
     logger.info(f"Created run ID: {run_id} for workflow ID: {workflow_id}")
-    
-    # Process the workflow synchronously - Run records are created/updated inside
-    try:
-        process_workflow_with_chain(
-            db, 
-            workflow_id, 
-            run_request.input_text, 
-            run_id, 
-            run_request.agent_prompts
-        )
-    except Exception as e:
-        logger.error(f"Error executing workflow: {str(e)}")
-        # Ensure we have a clean session
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Error executing workflow: {str(e)}")
+
+    with trace_run("execute_workflow", run_id, workflow_id=str(workflow_id), submit_async=run_request.submit_async):
+        # Compiling the plan checks that the workflow exists and that its graph can be
+        # scheduled before any work is queued; the executor reuses the cached plan
+        try:
+            with span("plan.load", workflow_id=str(workflow_id)):
+                plan = await execution_plan_cache.aget(db, workflow_id)
+        except WorkflowCycleError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        if not plan:
+            raise HTTPException(status_code=404, detail="Workflow not found")
+
+        if run_request.submit_async:
+            try:
+                with span("db.enqueue_run"):
+                    await enqueue_run(
+                        db,
+                        workflow_id,
+                        run_id,
+                        run_request.input_text,
+                        run_request.agent_prompts,
+                        run_request.bypass_cache
+                    )
+            except QueueFullError as e:
+                logger.warning(f"Rejecting run for workflow {workflow_id}: {str(e)}")
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Run queue is full, retry later",
+                    headers={"Retry-After": "5"}
+                )
+
+            response.status_code = status.HTTP_202_ACCEPTED
+            return {
+                "run_id": run_id,
+                "workflow_id": workflow_id,
+                "message": "Workflow execution queued",
+                "status": "queued"
+            }
+        
+        # Process the workflow inline - the run header and steps are created/updated inside
+        try:
+            await run_workflow(
+                workflow_id, 
+                run_request.input_text, 
+                run_id, 
+                run_request.agent_prompts,
+                run_request.bypass_cache
+            )
+        except Exception as e:
+            logger.error(f"Error executing workflow: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Error executing workflow: {str(e)}")
 
     return {
         "run_id": run_id,
         "workflow_id": workflow_id,
-        "message": "Workflow execution completed successfully"
+        "message": "Workflow execution completed successfully",
+        "status": "completed"
+    }
+
+# Response field -> RunStep column; id and workflow_id come from the run header
+RUN_STEP_FIELDS = {
+    "status": RunStep.status,
+    "input_text": RunStep.input_hash,
+    "output_text": RunStep.output_hash,
+    "entity_id": RunStep.entity_id,
+    "cache_hit": RunStep.cache_hit,
+    "input_tokens": RunStep.input_tokens,
+    "context_tokens": RunStep.context_tokens,
+    "output_tokens": RunStep.output_tokens,
+}
+# Texts are read from run_payloads only when requested
+RUN_STEP_PAYLOADS = {
+    "input_text": RunStep.input_payload,
+    "output_text": RunStep.output_payload,
+}
+RUN_STEP_TEXT_FIELDS = set(RUN_STEP_PAYLOADS)
+
+def _step_load_options(fields: Set[str]) -> list:
+    return [load_only(RunStep.run_id, *(RUN_STEP_FIELDS[field] for field in fields))] + [
+        selectinload(RUN_STEP_PAYLOADS[field]) for field in fields if field in RUN_STEP_PAYLOADS
+    ]
+
+def _step_response(step: RunStep, workflow_id: UUID, fields: Optional[Set[str]] = None) -> dict:
+    step_response = {"id": step.run_id, "workflow_id": workflow_id}
+    for field in fields or RUN_STEP_FIELDS:
+        step_response[field] = getattr(step, field)
+    return step_response
+
+def _state_response(state: dict, workflow_id: UUID) -> dict:
+    """Response of a step state the run recorder has not written yet"""
+    return {
+        "id": state["run_id"],
+        "workflow_id": workflow_id,
+        "status": state["status"],
+        "input_text": state["input_text"],
+        "output_text": state["output_text"] or "",
+        "entity_id": state["entity_id"],
+        "cache_hit": state["cache_hit"],
+        "input_tokens": state["input_tokens"],
+        "context_tokens": state["context_tokens"],
+        "output_tokens": state["output_tokens"],
     }
 
-@router.get("/workflow/{workflow_id}", response_model=List[RunStatusResponse])
-def get_workflow_runs(workflow_id: UUID, db: Session = Depends(get_db)):
-    """Get all runs for a specific workflow"""
+def _selected_fields(fields: Optional[str], summary: bool) -> Set[str]:
+    """Step fields requested with fields=a,b or summary=true (everything but the texts)"""
+    if fields:
+        selected = {field.strip() for field in fields.split(",") if field.strip()} - {"id", "workflow_id"}
+        unknown = selected - set(RUN_STEP_FIELDS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    else:
+        selected = set(RUN_STEP_FIELDS)
+    if summary:
+        selected -= RUN_STEP_TEXT_FIELDS
+    return selected
+
+@router.get(
+    "/workflow/{workflow_id}",
+    response_model=List[RunStatusResponse],
+    response_model_exclude_unset=True
+)
+async def get_workflow_runs(
+    workflow_id: UUID,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="Runs per page"),
+    fields: Optional[str] = Query(None, description="Comma separated step fields to return"),
+    summary: bool = Query(False, description="Leave out input_text and output_text"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get the steps of the runs of a workflow, newest run first.
+    Pages hold `limit` runs; the next cursor is returned in the X-Next-Cursor header.
+    Payloads that are not requested are never loaded from the database.
+    """
     # Check if workflow exists
-    db_workflow = db.query(Workflow).filter(Workflow.id == workflow_id).first()
+    db_workflow = await db.scalar(select(Workflow.id).where(Workflow.id == workflow_id))
     if not db_workflow:
         raise HTTPException(status_code=404, detail="Workflow not found")
-    
-    runs = db.query(Run).filter(Run.workflow_id == workflow_id).all()
-    
-    return [
-        {
-            "id": run.id,
-            "workflow_id": run.workflow_id,
-            "status": run.status,
-            "input_text": run.input_text,
-            "output_text": run.output_text,
-            "entity_id": run.workflow_entity_id
-        }
-        for run in runs
-    ]
 
-@router.get("/{run_id}", response_model=List[RunStatusResponse])
-def get_run_status(run_id: UUID, db: Session = Depends(get_db)):
-    """Get status of all entities for a specific run"""
-    runs = db.query(Run).filter(Run.id == run_id).all()
+    selected = _selected_fields(fields, summary)
+    runs_query = select(WorkflowRun.id, WorkflowRun.created_at).where(WorkflowRun.workflow_id == workflow_id)
+    try:
+        runs, next_cursor = await akeyset_paginate(
+            db, runs_query, WorkflowRun.created_at, WorkflowRun.id, cursor, limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     if not runs:
-        raise HTTPException(status_code=404, detail="Run not found")
+        return []
+
+    run_order = {run.id: index for index, run in enumerate(runs)}
+    steps = (await db.execute(
+        select(RunStep)
+        .options(*_step_load_options(selected))
+        .where(RunStep.run_id.in_(list(run_order)))
+        .order_by(RunStep.created_at)
+    )).scalars().all()
+    steps.sort(key=lambda step: run_order[step.run_id])
     
-    return [
-        {
-            "id": run.id,
-            "workflow_id": run.workflow_id,
-            "status": run.status,
-            "input_text": run.input_text,
-            "output_text": run.output_text,
-            "entity_id": run.workflow_entity_id
-        }
-        for run in runs
+    return [_step_response(step, workflow_id, selected) for step in steps]
+
+@router.get("/{run_id}", response_model=RunResponse)
+async def get_run_status(run_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    """Get the overall status of a run from its header row"""
+    # Transitions of runs executing on this process may not be written yet
+    run = run_recorder.run_state(run_id) or await db.get(WorkflowRun, run_id)
+    if not run:
+        if await db.get(RunArchive, run_id):
+            raise HTTPException(
+                status_code=404,
+                detail=f"Run {run_id} is archived; POST /runs/{run_id}/rehydrate to restore it"
+            )
+        raise HTTPException(status_code=404, detail="Run not found")
+    return run
+
+@router.post("/{run_id}/rehydrate", response_model=RunResponse)
+def rehydrate_archived_run(run_id: UUID, db: Session = Depends(get_db)):
+    """Load an archived run back from its archive file; it is removed again after RUN_REHYDRATED_TTL_HOURS"""
+    try:
+        run = rehydrate_run(db, run_id)
+    except FileNotFoundError as e:
+        logger.error(f"Error re-hydrating run {run_id}: {str(e)}")
+        raise HTTPException(status_code=410, detail=str(e))
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return run
+
+@router.get("/{run_id}/steps", response_model=List[RunStatusResponse])
+async def get_run_steps(run_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    """Get status and texts of all entities for a specific run"""
+    run = await db.get(WorkflowRun, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+
+    steps = (await db.execute(
+        select(RunStep).options(*_step_load_options(set(RUN_STEP_FIELDS))).where(RunStep.run_id == run_id)
+    )).scalars().all()
+    pending = run_recorder.step_states(run_id)
+    responses = [
+        _state_response(pending.pop(step.entity_id), run.workflow_id) if step.entity_id in pending
+        else _step_response(step, run.workflow_id)
+        for step in steps
     ]
+    return responses + [_state_response(state, run.workflow_id) for state in pending.values()]
+
+@router.get("/{run_id}/job", response_model=RunJobResponse)
+async def get_run_job(run_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    """Get the queue status of a run submitted with submit_async"""
+    job = await db.get(RunJob, run_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Run job not found")
+    return job
+
+@router.get("/{run_id}/trace", response_model=RunTraceResponse)
+async def get_run_trace(run_id: UUID):
+    """Span waterfall of a run, from memory for recent runs and from the span export file otherwise"""
+    waterfall = await asyncio.to_thread(run_waterfall, run_id)
+    if not waterfall:
+        raise HTTPException(status_code=404, detail="No trace recorded for this run")
+    return waterfall
 
 @router.get("/{run_id}/entity/{entity_id}", response_model=RunStatusResponse)
-def get_entity_run_status(run_id: UUID, entity_id: UUID, db: Session = Depends(get_db)):
+async def get_entity_run_status(run_id: UUID, entity_id: UUID, db: AsyncSession = Depends(get_async_db)):
     """Get status of a specific entity within a run"""
-    run = db.query(Run).filter(
-        Run.id == run_id,
-        Run.workflow_entity_id == entity_id
-    ).first()
+    state = run_recorder.step_states(run_id).get(entity_id)
+    if state:
+        # The header row is committed when the run starts
+        run = await db.get(WorkflowRun, run_id)
+        return _state_response(state, run.workflow_id)
+
+    step = await db.get(
+        RunStep,
+        (run_id, entity_id),
+        options=[selectinload(RunStep.run), selectinload(RunStep.input_payload), selectinload(RunStep.output_payload)]
+    )
     
-    if not run:
+    if not step:
         raise HTTPException(
             status_code=404, 
             detail=f"Run not found for run_id={run_id} and entity_id={entity_id}"
         )
     
-    return {
-        "id": run.id,
-        "workflow_id": run.workflow_id,
-        "status": run.status,
-        "input_text": run.input_text,
-        "output_text": run.output_text,
-        "entity_id": run.workflow_entity_id
-    }
+    return _step_response(step, step.run.workflow_id)
@@ -1,16 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import bindparam, select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from uuid import UUID
+from datetime import datetime
 import uuid
 
 from models.workflow import Workflow, WorkflowEntity, workflow_connections
-from database import get_db
+from database import get_db, get_async_db
+from functions.agent_cache import agent_cache
+from functions.execution_plan import execution_plan_cache, bump_workflow_version
+from functions.pagination import akeyset_paginate, MAX_PAGE_SIZE
+from functions.workflow_graph import WorkflowGraph, WorkflowCycleError
 from schemas.workflow_schema import (
     WorkflowCreate, 
     WorkflowResponse, 
     WorkflowEntityCreate, 
     WorkflowEntityResponse,
+    WorkflowGraphUpdate,
+    WorkflowGraphResponse,
 )
 import logging
 logger = logging.getLogger(__name__)
@@ -39,24 +48,43 @@ def delete_workflow(workflow_id: UUID, db: Session = Depends(get_db)):
     if not db_workflow:
         raise HTTPException(status_code=404, detail="Workflow not found")
     
+    entity_ids = [entity.id for entity in db_workflow.entities]
     db.delete(db_workflow)
     db.commit()
+    execution_plan_cache.invalidate(workflow_id)
+    for entity_id in entity_ids:
+        agent_cache.invalidate_entity(entity_id)
     return None
 
 @router.get("/project/{project_id}", response_model=List[WorkflowResponse])
-def get_workflows(
+async def get_workflows(
+    response: Response,
     project_id: Optional[UUID] = None, 
-    skip: int = 0, 
-    limit: int = 100, 
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    skip: int = Query(0, deprecated=True, description="Use cursor; OFFSET scans every skipped row"),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE), 
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get all workflows, optionally filtered by project ID"""
-    query = db.query(Workflow)
+    """
+    Get workflows, optionally filtered by project ID, newest first.
+    The cursor of the next page is returned in the X-Next-Cursor header.
+    """
+    query = select(Workflow)
     
     if project_id:
-        query = query.filter(Workflow.project_id == project_id)
-    
-    workflows = query.offset(skip).limit(limit).all()
+        query = query.where(Workflow.project_id == project_id)
+
+    if skip and not cursor:
+        return (await db.execute(
+            query.order_by(Workflow.created_at.desc(), Workflow.id.desc()).offset(skip).limit(limit)
+        )).scalars().all()
+
+    try:
+        workflows, next_cursor = await akeyset_paginate(db, query, Workflow.created_at, Workflow.id, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return workflows
 # -----NODES-----
 @router.post("/{workflow_id}/entities/", response_model=WorkflowEntityResponse, status_code=status.HTTP_201_CREATED)
@@ -78,6 +106,7 @@ def create_workflow_entity(workflow_id: UUID, entity: WorkflowEntityCreate, db:
     )
 
     db.add(db_entity)
+    bump_workflow_version(db, workflow_id)
     db.commit()
     db.refresh(db_entity)
     
@@ -104,7 +133,11 @@ def create_workflow_entity(workflow_id: UUID, entity: WorkflowEntityCreate, db:
                     )
                 )
                 db.commit()
+        # Plans compiled between the commits above must not survive the last connection
+        bump_workflow_version(db, workflow_id)
+        db.commit()
     
+    execution_plan_cache.invalidate(workflow_id)
     return db_entity
 
 
@@ -115,20 +148,187 @@ def delete_workflow_entity(entity_id: UUID, db: Session = Depends(get_db)):
     if not db_entity:
         raise HTTPException(status_code=404, detail="Workflow entity not found")
     
+    workflow_id = db_entity.workflow_id
     db.delete(db_entity)
+    bump_workflow_version(db, workflow_id)
     db.commit()
+    execution_plan_cache.invalidate(workflow_id)
+    agent_cache.invalidate_entity(entity_id)
     return None
 
 
 
 @router.get("/{workflow_id}/entities/", response_model=List[WorkflowEntityResponse])
-def get_workflow_entities(workflow_id: UUID, db: Session = Depends(get_db)):
+async def get_workflow_entities(workflow_id: UUID, db: AsyncSession = Depends(get_async_db)):
     """Get all entities/nodes for a specific workflow"""
     # Check if workflow exists
-    db_workflow = db.query(Workflow).filter(Workflow.id == workflow_id).first()
+    db_workflow = await db.scalar(select(Workflow.id).where(Workflow.id == workflow_id))
     if not db_workflow:
         raise HTTPException(status_code=404, detail="Workflow not found")
     
-    entities = db.query(WorkflowEntity).filter(WorkflowEntity.workflow_id == workflow_id).all()
+    entities = (await db.execute(
+        select(WorkflowEntity).where(WorkflowEntity.workflow_id == workflow_id)
+    )).scalars().all()
     return entities
 
+# -----GRAPH-----
+ENTITY_GRAPH_FIELDS = ("type", "label", "prompt", "data", "order")
+CONNECTION_GRAPH_FIELDS = ("label", "style", "animated")
+
+def _stored_graph(db: Session, workflow_id: UUID) -> dict:
+    entities = (
+        db.query(WorkflowEntity)
+        .filter(WorkflowEntity.workflow_id == workflow_id)
+        .order_by(WorkflowEntity.order)
+        .all()
+    )
+    connections = db.execute(
+        workflow_connections.select().where(workflow_connections.c.workflow_id == workflow_id)
+    ).mappings().all()
+    return {"workflow_id": workflow_id, "entities": entities, "connections": connections}
+
+@router.get("/{workflow_id}/graph", response_model=WorkflowGraphResponse)
+def get_workflow_graph(workflow_id: UUID, db: Session = Depends(get_db)):
+    """Get all entities and connections of a workflow"""
+    db_workflow = db.query(Workflow).filter(Workflow.id == workflow_id).first()
+    if not db_workflow:
+        raise HTTPException(status_code=404, detail="Workflow not found")
+    return _stored_graph(db, workflow_id)
+
+@router.put("/{workflow_id}/graph", response_model=WorkflowGraphResponse)
+def save_workflow_graph(workflow_id: UUID, graph: WorkflowGraphUpdate, db: Session = Depends(get_db)):
+    """
+    Replace the whole canvas of a workflow in one transaction.
+    Entities are matched by external_id and diffed against the stored graph:
+    new ones are inserted, changed ones updated, missing ones deleted.
+    Connections may reference any entity of the request, regardless of order.
+    """
+    db_workflow = db.query(Workflow).filter(Workflow.id == workflow_id).first()
+    if not db_workflow:
+        raise HTTPException(status_code=404, detail="Workflow not found")
+
+    external_ids = [entity.external_id for entity in graph.entities]
+    duplicates = {external_id for external_id in external_ids if external_ids.count(external_id) > 1}
+    if duplicates:
+        raise HTTPException(status_code=422, detail=f"Duplicate external_id: {', '.join(sorted(duplicates))}")
+
+    # Connections may come top-level or nested in their source entity
+    requested_connections = [
+        (connection.source_id, connection.target_id, connection)
+        for connection in graph.connections or []
+    ] + [
+        (entity.external_id, connection.target_id, connection)
+        for entity in graph.entities
+        for connection in entity.connections or []
+    ]
+    unknown = {
+        external_id
+        for source_id, target_id, _ in requested_connections
+        for external_id in (source_id, target_id)
+        if external_id not in external_ids
+    }
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Connections reference unknown entities: {', '.join(sorted(unknown))}")
+
+    now = datetime.utcnow()
+    stored = {}
+    removed_ids = []
+    for db_entity in db.query(WorkflowEntity).filter(WorkflowEntity.workflow_id == workflow_id).all():
+        if db_entity.external_id in stored:
+            # Legacy duplicates of an external_id are dropped in favour of the first one
+            removed_ids.append(db_entity.id)
+        else:
+            stored[db_entity.external_id] = db_entity
+
+    entity_ids = {}
+    requested_entities = []
+    added_ids = []
+    changed_ids = []
+    for entity in graph.entities:
+        values = {
+            "type": entity.type,
+            "label": entity.label,
+            "prompt": entity.prompt,
+            "data": entity.data,
+            "order": entity.order if entity.order is not None else 0,
+        }
+        db_entity = stored.pop(entity.external_id, None)
+        if db_entity is None:
+            db_entity = WorkflowEntity(
+                id=uuid.uuid4(),
+                external_id=entity.external_id,
+                workflow_id=workflow_id,
+                created_at=now,
+                updated_at=now,
+                **values
+            )
+            db.add(db_entity)
+            added_ids.append(db_entity.id)
+        elif any(getattr(db_entity, field) != values[field] for field in ENTITY_GRAPH_FIELDS):
+            for field, value in values.items():
+                setattr(db_entity, field, value)
+            db_entity.updated_at = now
+            changed_ids.append(db_entity.id)
+        entity_ids[entity.external_id] = db_entity.id
+        requested_entities.append(db_entity)
+    removed_ids.extend(db_entity.id for db_entity in stored.values())
+
+    desired = {}
+    for source_id, target_id, connection in requested_connections:
+        key = (entity_ids[source_id], entity_ids[target_id])
+        if key in desired:
+            raise HTTPException(status_code=422, detail=f"Duplicate connection {source_id} -> {target_id}")
+        desired[key] = {
+            "label": connection.label,
+            "style": connection.style,
+            "animated": connection.animated,
+        }
+
+    # Reject graphs the executor could not schedule before anything is written
+    try:
+        WorkflowGraph(sorted(requested_entities, key=lambda entity: entity.order), list(desired))
+    except WorkflowCycleError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    existing_connections = db.execute(
+        workflow_connections.select().where(workflow_connections.c.workflow_id == workflow_id)
+    ).mappings().all()
+    stale_connection_ids = []
+    connection_updates = []
+    for connection in existing_connections:
+        values = desired.pop((connection["source_id"], connection["target_id"]), None)
+        if values is None:
+            stale_connection_ids.append(connection["id"])
+        elif any(connection[field] != values[field] for field in CONNECTION_GRAPH_FIELDS):
+            connection_updates.append({"connection_id": connection["id"], **values})
+
+    # Entities first so the new connections can reference them
+    db.flush()
+    if stale_connection_ids:
+        db.execute(workflow_connections.delete().where(workflow_connections.c.id.in_(stale_connection_ids)))
+    if removed_ids:
+        db.query(WorkflowEntity).filter(WorkflowEntity.id.in_(removed_ids)).delete(synchronize_session=False)
+    if connection_updates:
+        db.execute(
+            workflow_connections.update()
+            .where(workflow_connections.c.id == bindparam("connection_id"))
+            .values(label=bindparam("label"), style=bindparam("style"), animated=bindparam("animated")),
+            connection_updates
+        )
+    if desired:
+        db.execute(workflow_connections.insert(), [
+            {"id": uuid.uuid4(), "source_id": source_id, "target_id": target_id, "workflow_id": workflow_id, **values}
+            for (source_id, target_id), values in desired.items()
+        ])
+    if added_ids or changed_ids or removed_ids or stale_connection_ids or connection_updates or desired:
+        bump_workflow_version(db, workflow_id)
+    db.commit()
+
+    execution_plan_cache.invalidate(workflow_id)
+    for entity_id in changed_ids + removed_ids:
+        agent_cache.invalidate_entity(entity_id)
+    logger.info(
+        f"Saved graph of workflow {workflow_id}: {len(graph.entities)} entities "
+        f"({len(changed_ids)} updated, {len(removed_ids)} removed), {len(requested_connections)} connections"
+    )
+    return _stored_graph(db, workflow_id)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel
 from typing import Optional, List, Dict, Any, Union
 from uuid import UUID
 from datetime import datetime
@@ -45,6 +45,23 @@ class WorkflowEntityResponse(BaseModel):
     class Config:
         orm_mode = True
 
+class WorkflowGraphConnection(BaseModel):
+    source_id: str  # external_id of the source node
+    target_id: str  # external_id of the target node
+    label: Optional[str] = None
+    style: Optional[Dict[str, Any]] = None
+    animated: Optional[bool] = True
+
+class WorkflowGraphUpdate(BaseModel):
+    # The complete canvas: entities and connections missing here are deleted
+    entities: List[WorkflowEntityCreate]
+    connections: Optional[List[WorkflowGraphConnection]] = None
+
+class WorkflowGraphResponse(BaseModel):
+    workflow_id: UUID
+    entities: List[WorkflowEntityResponse]
+    connections: List[WorkflowConnectionResponse]
+
 class WorkflowCreate(BaseModel):
     name: str
     type: str
@@ -66,16 +83,78 @@ class WorkflowResponse(BaseModel):
 class WorkflowRunRequest(BaseModel):
     input_text: str
     agent_prompts: Optional[Union[List[str], Dict[str, str]]] = None
+    submit_async: Optional[bool] = False  # queue the run and return 202 immediately
+    bypass_cache: Optional[bool] = False  # ignore cached responses (fresh answers are still cached)
 
 class WorkflowRunResponse(BaseModel):
     run_id: UUID
     workflow_id: UUID
     message: str
+    status: Optional[str] = None
 
-class RunStatusResponse(BaseModel):
+class RunResponse(BaseModel):
     id: UUID
     workflow_id: UUID
     status: str
-    input_text: str
+    total_steps: int
+    completed_steps: int
+    failed_steps: int
+    cache_hits: int
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
+
+class RunStatusResponse(BaseModel):
+    # Listing endpoints may leave out fields (fields=/summary=)
+    id: UUID
+    workflow_id: UUID
+    status: Optional[str] = None
+    input_text: Optional[str] = None
     output_text: Optional[str] = None
-    entity_id: UUID
\ No newline at end of file
+    entity_id: Optional[UUID] = None
+    cache_hit: Optional[bool] = False
+    input_tokens: Optional[int] = None
+    context_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+
+class TraceSpanResponse(BaseModel):
+    span_id: str
+    parent_span_id: Optional[str] = None
+    name: str
+    depth: int
+    start_offset_ms: float
+    duration_ms: Optional[float] = None  # None while the span is still open
+    status: str
+    status_message: Optional[str] = None
+    attributes: Dict[str, Any] = {}
+
+class RunTraceResponse(BaseModel):
+    run_id: UUID
+    trace_id: str
+    duration_ms: float
+    spans: List[TraceSpanResponse]
+
+class RunJobResponse(BaseModel):
+    id: UUID
+    workflow_id: UUID
+    status: str
+    attempts: int
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
+
+class SseSubscriptionRequest(BaseModel):
+    run_ids: Optional[List[UUID]] = None
+    workflow_ids: Optional[List[UUID]] = None
+    project_ids: Optional[List[UUID]] = None
+
+class SseSubscriptionResponse(BaseModel):
+    client_id: str
+    topics: List[str]
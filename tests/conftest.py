@@ -0,0 +1,38 @@
+import os
+import sys
+import tempfile
+
+import pytest
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.compiler import compiles
+
+# The engines are created on import of database; point them at a throwaway SQLite file first
+_db_dir = tempfile.mkdtemp(prefix="wf_service_tests_")
+os.environ["TESTING"] = "1"
+os.environ["TEST_DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@compiles(UUID, "sqlite")
+def _uuid_on_sqlite(type_, compiler, **kw):
+    # The models use the Postgres UUID type; SQLite stores the hex string
+    return "CHAR(32)"
+
+
+import database  # noqa: E402
+from models.workflow import Base  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def tables():
+    Base.metadata.create_all(bind=database.engine)
+    yield
+    Base.metadata.drop_all(bind=database.engine)
+
+
+@pytest.fixture
+def db():
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
@@ -0,0 +1,28 @@
+import uuid
+
+from agno.agent import Agent
+from agno.agent.metrics import SessionMetrics
+from agno.media import ImageArtifact
+
+from functions.agent_cache import AgentCache, agent_cache_key
+
+
+def test_released_agent_carries_no_state_into_the_next_lease():
+    cache = AgentCache(max_size=4, ttl_seconds=60)
+    key = agent_cache_key(uuid.uuid4(), None, {"name": "writer"}, "model")
+
+    with cache.lease(key, lambda: Agent(name="writer")) as agent:
+        agent.session_id = "run-1"
+        agent.agent_session = object()
+        agent.session_metrics = SessionMetrics(input_tokens=10)
+        agent.images = [ImageArtifact(id="i1", url="https://example.com/a.png")]
+        agent.videos = ["video"]
+        agent.audio = ["audio"]
+
+    with cache.lease(key, lambda: Agent(name="other")) as reused:
+        assert reused is agent
+        assert reused.session_id is None
+        assert reused.agent_session is None
+        assert reused.session_metrics is None
+        assert reused.images is None and reused.videos is None and reused.audio is None
+        assert reused.memory.messages == []
@@ -0,0 +1,93 @@
+import asyncio
+import json
+
+import pytest
+
+from functions import context_budget
+from functions.context_budget import ContextBudget, afit_context, fit_context
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    # About 4 characters per token, without downloading the tiktoken encoding
+    monkeypatch.setattr(context_budget, "_encoding", False)
+
+
+class FakeSummaryAgent:
+    def __init__(self, content: str = None, error: Exception = None):
+        self.content = content
+        self.error = error
+
+    def run(self, text):
+        if self.error:
+            raise self.error
+        return type("Response", (), {"content": self.content})()
+
+    async def arun(self, text):
+        return self.run(text)
+
+
+def _fit_both(text: str, budget: ContextBudget):
+    return fit_context(text, budget), asyncio.run(afit_context(text, budget))
+
+
+def test_inputs_within_the_budget_pass_unchanged():
+    text = "short input"
+
+    for fitted in _fit_both(text, ContextBudget(max_tokens=100)) + _fit_both(text, ContextBudget()):
+        assert fitted == (text, 3)
+
+
+def test_fields_keep_the_requested_json_keys():
+    text = json.dumps({"Summary": "the plot so far", "notes": "x" * 400, "draft": "y" * 400})
+    budget = ContextBudget(max_tokens=50, strategy="fields", fields=("summary",))
+
+    for output, tokens in _fit_both(f"```json\n{text}\n```", budget):
+        assert json.loads(output) == {"Summary": "the plot so far"}
+        assert tokens <= 50
+
+
+def test_fields_keep_the_requested_markdown_sections():
+    text = "### Research\n" + "x" * 400 + "\n\n### Outline\n1. setup\n2. twist\n\n## Draft\n" + "y" * 400
+    budget = ContextBudget(max_tokens=50, strategy="fields", fields=("outline",))
+
+    for output, _ in _fit_both(text, budget):
+        assert output == "### Outline\n1. setup\n2. twist"
+
+
+def test_fields_without_a_match_fall_back_to_truncation():
+    text = "### Research\n" + "x" * 400
+    budget = ContextBudget(max_tokens=10, strategy="fields", fields=("outline",))
+
+    for output, tokens in _fit_both(text, budget):
+        assert output == text[:40]
+        assert tokens == 10
+
+
+def test_truncation_keeps_the_head_or_the_tail():
+    text = "HEAD" + "x" * 400 + "TAIL"
+
+    head, _ = fit_context(text, ContextBudget(max_tokens=10, keep="head"))
+    tail, _ = fit_context(text, ContextBudget(max_tokens=10, keep="tail"))
+
+    assert head.startswith("HEAD") and len(head) == 40
+    assert tail.endswith("TAIL") and len(tail) == 40
+
+
+def test_summaries_over_the_budget_are_truncated(monkeypatch):
+    monkeypatch.setattr(context_budget, "_summary_agent", lambda max_tokens: FakeSummaryAgent("s" * 200))
+
+    for output, tokens in _fit_both("x" * 400, ContextBudget(max_tokens=10, strategy="summarize")):
+        assert output == "s" * 40
+        assert tokens == 10
+
+
+def test_a_failed_summary_falls_back_to_truncation(monkeypatch):
+    monkeypatch.setattr(
+        context_budget, "_summary_agent", lambda max_tokens: FakeSummaryAgent(error=ConnectionError("model down"))
+    )
+    text = "HEAD" + "x" * 400
+
+    for output, tokens in _fit_both(text, ContextBudget(max_tokens=10, strategy="summarize", keep="head")):
+        assert output == text[:40]
+        assert tokens == 10
@@ -0,0 +1,107 @@
+import asyncio
+import uuid
+
+import database
+from models.workflow import Workflow, WorkflowEntity
+from functions.execution_plan import ExecutionPlanCache, bump_workflow_version
+
+
+def _seed_workflow(db, prompts=("draft",)):
+    workflow = Workflow(name="Plan", type="story", project_id=uuid.uuid4())
+    db.add(workflow)
+    db.flush()
+    for order, prompt in enumerate(prompts):
+        db.add(WorkflowEntity(external_id=f"n{order}", type="lead", prompt=prompt, order=order, workflow_id=workflow.id))
+    db.commit()
+    return workflow.id
+
+
+def _change_graph(db, workflow_id, prompt: str):
+    """What a save on another worker does: edit an entity and bump the version in one transaction"""
+    entity = db.query(WorkflowEntity).filter(WorkflowEntity.workflow_id == workflow_id).first()
+    entity.prompt = prompt
+    bump_workflow_version(db, workflow_id)
+    db.commit()
+
+
+def _prompts(plan):
+    return [node.prompt for node in plan.nodes.values()]
+
+
+def test_fresh_plans_are_served_without_touching_the_database(db):
+    workflow_id = _seed_workflow(db)
+    cache = ExecutionPlanCache(revalidate_seconds=60)
+    plan = cache.get(db, workflow_id)
+
+    _change_graph(db, workflow_id, "changed elsewhere")
+
+    # Within the revalidation window the cached plan is served as is, without a session
+    assert cache.get(None, workflow_id) is plan
+
+
+def test_stale_plans_are_kept_while_the_version_is_unchanged(db):
+    workflow_id = _seed_workflow(db)
+    cache = ExecutionPlanCache(revalidate_seconds=0)
+    plan = cache.get(db, workflow_id)
+
+    assert cache.get(db, workflow_id) is plan
+
+
+def test_stale_plans_are_recompiled_after_a_version_bump(db):
+    workflow_id = _seed_workflow(db)
+    cache = ExecutionPlanCache(revalidate_seconds=0)
+    plan = cache.get(db, workflow_id)
+
+    _change_graph(db, workflow_id, "changed elsewhere")
+    db.expire_all()
+    recompiled = cache.get(db, workflow_id)
+
+    assert recompiled.version == plan.version + 1
+    assert _prompts(plan) == ["draft"]
+    assert _prompts(recompiled) == ["changed elsewhere"]
+
+
+def test_deleted_workflows_have_no_plan(db):
+    workflow_id = _seed_workflow(db)
+    cache = ExecutionPlanCache(revalidate_seconds=0)
+    cache.get(db, workflow_id)
+
+    db.delete(db.get(Workflow, workflow_id))
+    db.commit()
+
+    assert cache.get(db, workflow_id) is None
+    assert cache._fresh(workflow_id) == (None, False)
+
+
+def test_least_recently_used_plans_are_evicted(db):
+    first, second, third = (_seed_workflow(db) for _ in range(3))
+    cache = ExecutionPlanCache(max_size=2, revalidate_seconds=60)
+    cache.get(db, first)
+    cache.get(db, second)
+    cache.get(db, first)
+
+    cache.get(db, third)
+
+    assert cache._fresh(first)[0] is not None
+    assert cache._fresh(second)[0] is None
+    assert cache._fresh(third)[0] is not None
+
+
+def test_async_lookups_revalidate_the_version(db):
+    workflow_id = _seed_workflow(db)
+    cache = ExecutionPlanCache(revalidate_seconds=0)
+
+    async def lookup():
+        try:
+            async with database.async_session() as session:
+                return await cache.aget(session, workflow_id)
+        finally:
+            await database.get_async_engine().dispose()
+
+    plan = asyncio.run(lookup())
+    assert asyncio.run(lookup()) is plan
+
+    _change_graph(db, workflow_id, "changed elsewhere")
+    recompiled = asyncio.run(lookup())
+    assert recompiled.version == plan.version + 1
+    assert _prompts(recompiled) == ["changed elsewhere"]
@@ -0,0 +1,163 @@
+import threading
+import time
+
+import pytest
+
+from functions import model_limits
+from functions.model_limits import ModelLimiter, TokenBucket
+
+
+class RateLimitedError(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after: str = None):
+        super().__init__("429 Too Many Requests")
+        self.response = type("Response", (), {"headers": {"retry-after": retry_after} if retry_after else {}})()
+
+
+def _limiter(monkeypatch, concurrency: int = 8, **limits) -> ModelLimiter:
+    monkeypatch.setattr(model_limits, "MODEL_INITIAL_CONCURRENCY", concurrency)
+    return ModelLimiter("test", "model", **limits)
+
+
+def test_token_bucket_refills_at_its_rate_per_minute():
+    bucket = TokenBucket(60)
+    start = bucket.updated
+
+    assert bucket.delay(60, start) == 0.0
+    bucket.take(60)
+    assert bucket.delay(1, start) == pytest.approx(1.0)
+    assert bucket.delay(1, start + 0.5) == pytest.approx(0.5)
+    # Requests above the capacity wait for a full bucket instead of forever
+    assert bucket.delay(600, start + 0.5) == pytest.approx(59.5)
+    assert bucket.delay(1, start + 1.0) == 0.0
+
+
+def test_an_oversized_call_is_paid_off_before_the_next_one():
+    bucket = TokenBucket(60)
+    start = bucket.updated
+
+    bucket.take(90)
+
+    assert bucket.delay(1, start) == pytest.approx(31.0)
+
+
+def test_waiters_are_admitted_in_arrival_order(monkeypatch):
+    limiter = _limiter(monkeypatch, concurrency=1)
+    limiter.acquire(0)
+    admitted = []
+
+    def call(index: int):
+        limiter.acquire(0)
+        admitted.append(index)
+        limiter.release(0, None, None)
+
+    threads = []
+    for index in range(5):
+        thread = threading.Thread(target=call, args=(index,))
+        thread.start()
+        threads.append(thread)
+        # Queue the next caller only once this one is waiting
+        while len(limiter._waiters) < index + 1:
+            time.sleep(0.001)
+    limiter.release(0, None, None)
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert admitted == [0, 1, 2, 3, 4]
+    assert limiter.in_flight == 0
+
+
+def test_request_bucket_delays_calls_over_the_rate(monkeypatch):
+    limiter = _limiter(monkeypatch, rpm=600)
+    limiter.requests.level = 1
+
+    limiter.acquire(0)
+    limiter.release(0, None, None)
+    start = time.monotonic()
+    limiter.acquire(0)
+
+    # 600 requests per minute refill one every 0.1 seconds
+    assert time.monotonic() - start >= 0.09
+    limiter.release(0, None, None)
+
+
+def test_concurrency_grows_additively_and_shrinks_multiplicatively(monkeypatch):
+    limiter = _limiter(monkeypatch, concurrency=8)
+
+    limiter.acquire(0)
+    limiter.release(0, None, latency=1.0)
+    assert limiter.limit == pytest.approx(8 + 1 / 8)
+
+    limit = limiter.limit
+    limiter.acquire(0)
+    limiter.release(0, None, latency=1.0 * model_limits.MODEL_LATENCY_TOLERANCE * 2)
+    assert limiter.limit == pytest.approx(limit * 0.9)
+
+    limit = limiter.limit
+    limiter.acquire(0)
+    limiter.release(0, None, None, rate_limited=True, retry_after=30)
+    assert limiter.limit == pytest.approx(limit * 0.5)
+    assert limiter.paused_until - time.monotonic() == pytest.approx(30, abs=1)
+
+
+def test_concurrency_never_drops_below_the_minimum(monkeypatch):
+    monkeypatch.setattr(model_limits, "MODEL_MIN_CONCURRENCY", 2)
+    limiter = _limiter(monkeypatch, concurrency=4)
+
+    for _ in range(5):
+        limiter.acquire(0)
+        limiter.release(0, None, None, rate_limited=True, retry_after=0.01)
+
+    assert limiter.limit == 2
+
+
+def test_rate_limited_calls_are_retried_after_retry_after(monkeypatch):
+    limiter = _limiter(monkeypatch)
+    attempts = []
+
+    def invoke():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise RateLimitedError(retry_after="0.2")
+        return "answer"
+
+    assert limiter.call(invoke, 10) == "answer"
+    assert len(attempts) == 2
+    assert attempts[1] - attempts[0] >= 0.19
+    assert limiter.limit == pytest.approx(4 + 1 / 4)
+    assert limiter.in_flight == 0
+
+
+def test_rate_limited_calls_fail_once_the_retries_are_used_up(monkeypatch):
+    monkeypatch.setattr(model_limits, "MODEL_RATE_LIMIT_RETRIES", 1)
+    limiter = _limiter(monkeypatch)
+    attempts = []
+
+    def invoke():
+        attempts.append(1)
+        raise RateLimitedError(retry_after="0.01")
+
+    with pytest.raises(RateLimitedError):
+        limiter.call(invoke, 10)
+    assert len(attempts) == 2
+    assert limiter.in_flight == 0
+
+
+def test_streams_are_not_retried_after_the_first_chunk(monkeypatch):
+    limiter = _limiter(monkeypatch)
+    attempts = []
+
+    def invoke_stream():
+        attempts.append(1)
+        yield "first"
+        raise RateLimitedError(retry_after="0.01")
+
+    chunks = []
+    with pytest.raises(RateLimitedError):
+        for chunk in limiter.stream(invoke_stream, 10):
+            chunks.append(chunk)
+
+    assert chunks == ["first"]
+    assert len(attempts) == 1
+    assert limiter.in_flight == 0
@@ -0,0 +1,120 @@
+import asyncio
+import time
+
+import pytest
+
+from functions import model_router
+from functions.model_router import fallback_routes, route_model
+
+
+class FakeModel:
+    """Streams its chunks, appending an assistant message like agno models do"""
+
+    def __init__(self, name: str, chunks=("a", "b"), fail_before=False, fail_after=False, first_delay=0.0):
+        self.name = name
+        self.chunks = list(chunks)
+        self.fail_before = fail_before
+        self.fail_after = fail_after
+        self.first_delay = first_delay
+        self.closed = False
+
+    def response(self, messages):
+        raise NotImplementedError
+
+    async def aresponse(self, messages):
+        raise NotImplementedError
+
+    def response_stream(self, messages):
+        try:
+            time.sleep(self.first_delay)
+            if self.fail_before:
+                raise ConnectionError(f"{self.name} is down")
+            for chunk in self.chunks:
+                yield f"{self.name}:{chunk}"
+            if self.fail_after:
+                raise ConnectionError(f"{self.name} dropped the stream")
+            messages.append(f"{self.name} answer")
+        except GeneratorExit:
+            self.closed = True
+            raise
+
+    async def aresponse_stream(self, messages):
+        try:
+            await asyncio.sleep(self.first_delay)
+            if self.fail_before:
+                raise ConnectionError(f"{self.name} is down")
+            for chunk in self.chunks:
+                yield f"{self.name}:{chunk}"
+            if self.fail_after:
+                raise ConnectionError(f"{self.name} dropped the stream")
+            messages.append(f"{self.name} answer")
+        except (GeneratorExit, asyncio.CancelledError):
+            self.closed = True
+            raise
+
+
+def _routed(primary: FakeModel, fallback: FakeModel):
+    return route_model(primary, primary.name, lambda: [(fallback.name, fallback)])
+
+
+async def _collect(stream):
+    return [chunk async for chunk in stream]
+
+
+def test_stream_falls_back_when_primary_fails_before_first_chunk():
+    model = _routed(FakeModel("primary", fail_before=True), FakeModel("fallback"))
+    messages = ["user question"]
+
+    chunks = list(model.response_stream(messages=messages))
+
+    assert chunks == ["fallback:a", "fallback:b"]
+    assert messages == ["user question", "fallback answer"]
+
+
+def test_async_stream_falls_back_when_primary_fails_before_first_chunk():
+    model = _routed(FakeModel("primary", fail_before=True), FakeModel("fallback"))
+    messages = ["user question"]
+
+    chunks = asyncio.run(_collect(model.aresponse_stream(messages=messages)))
+
+    assert chunks == ["fallback:a", "fallback:b"]
+    assert messages == ["user question", "fallback answer"]
+
+
+def test_stream_stays_on_the_route_that_sent_the_first_chunk():
+    model = _routed(FakeModel("primary", fail_after=True), FakeModel("fallback"))
+    chunks = []
+
+    with pytest.raises(ConnectionError):
+        for chunk in model.response_stream(messages=["user question"]):
+            chunks.append(chunk)
+
+    assert chunks == ["primary:a", "primary:b"]
+
+
+def test_async_stream_is_hedged_until_the_first_chunk(monkeypatch):
+    monkeypatch.setattr(model_router, "MODEL_HEDGING", True)
+    monkeypatch.setattr(model_router, "MODEL_HEDGE_MIN_SAMPLES", 1)
+    primary = FakeModel("primary", first_delay=1.0)
+    model = _routed(primary, FakeModel("fallback"))
+    model.router.primary.stats.record(0.01, True, first_chunk=True)
+    messages = ["user question"]
+
+    chunks = asyncio.run(_collect(model.aresponse_stream(messages=messages)))
+
+    assert chunks == ["fallback:a", "fallback:b"]
+    assert messages == ["user question", "fallback answer"]
+    assert primary.closed
+
+
+def test_fallback_routes_names_the_routes_that_answered():
+    healthy = _routed(FakeModel("primary"), FakeModel("fallback"))
+    failing = _routed(FakeModel("primary", fail_before=True), FakeModel("fallback"))
+
+    with fallback_routes() as primary_only:
+        list(healthy.response_stream(messages=[]))
+    with fallback_routes() as fell_back:
+        list(failing.response_stream(messages=[]))
+
+    assert primary_only == []
+    assert fell_back == ["fallback"]
@@ -0,0 +1,78 @@
+import uuid
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from models.workflow import Workflow
+from functions.pagination import decode_cursor, encode_cursor
+
+
+def _client():
+    return TestClient(app, headers={"X-From-Gateway": "true"})
+
+
+def _seed_workflows(db, project_id):
+    # Pairs share created_at, so the id has to break the tie between pages
+    workflows = [
+        Workflow(id=uuid.uuid4(), name=f"wf {index}", type="story", project_id=project_id, created_at=datetime(2024, 1, 1 + index // 2))
+        for index in range(7)
+    ]
+    db.add_all(workflows)
+    db.add(Workflow(name="other project", type="story", project_id=uuid.uuid4(), created_at=datetime(2024, 1, 2)))
+    db.commit()
+    return [workflow.id for workflow in sorted(workflows, key=lambda workflow: (workflow.created_at, workflow.id), reverse=True)]
+
+
+def test_cursor_round_trip():
+    created_at, row_id = datetime(2024, 5, 17, 12, 30, 1, 250), uuid.uuid4()
+
+    cursor = encode_cursor(created_at, row_id)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, row_id)
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", encode_cursor(datetime(2024, 1, 1), uuid.uuid4())[:-4], "W10"])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_pages_follow_the_cursor_without_gaps_or_repeats(db):
+    project_id = uuid.uuid4()
+    expected = _seed_workflows(db, project_id)
+    client = _client()
+
+    seen = []
+    pages = 0
+    cursor = None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get(f"/project/{project_id}", params=params)
+        assert response.status_code == 200
+        seen.extend(uuid.UUID(workflow["id"]) for workflow in response.json())
+        pages += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert seen == expected
+    assert pages == 4
+
+
+def test_an_exactly_full_last_page_has_no_next_cursor(db):
+    project_id = uuid.uuid4()
+    expected = _seed_workflows(db, project_id)
+
+    response = _client().get(f"/project/{project_id}", params={"limit": len(expected)})
+
+    assert [uuid.UUID(workflow["id"]) for workflow in response.json()] == expected
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_an_invalid_cursor_is_a_bad_request(db):
+    response = _client().get(f"/project/{uuid.uuid4()}", params={"cursor": "not-a-cursor"})
+
+    assert response.status_code == 400
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+import database
+from models.workflow import RunPayload
+from functions import run_payloads
+from functions.run_payloads import (
+    astore_payload, compress_payload, decompress_payload, payload_hash, store_payload
+)
+
+LONG_TEXT = "Chapter one. The lighthouse keeper counts the ships. " * 40
+
+
+@pytest.mark.parametrize("codec", ["none", "gzip", "zstd"])
+def test_codecs_round_trip(codec):
+    stored_codec, data = compress_payload(LONG_TEXT + " é 漢字", codec)
+
+    assert stored_codec == codec
+    assert decompress_payload(stored_codec, data) == LONG_TEXT + " é 漢字"
+
+
+@pytest.mark.parametrize("codec", ["gzip", "zstd"])
+def test_long_payloads_are_compressed(codec):
+    _, data = compress_payload(LONG_TEXT, codec)
+
+    assert len(data) < len(LONG_TEXT.encode("utf-8")) / 5
+
+
+def test_short_payloads_are_stored_raw():
+    assert compress_payload("short", "zstd") == ("none", b"short")
+
+
+def test_gzip_payloads_are_deterministic():
+    # mtime=0, so the same text always gives the same bytes
+    assert compress_payload(LONG_TEXT, "gzip") == compress_payload(LONG_TEXT, "gzip")
+
+
+def test_unknown_codecs_are_rejected():
+    with pytest.raises(ValueError):
+        compress_payload(LONG_TEXT, "brotli")
+    with pytest.raises(ValueError):
+        decompress_payload("brotli", b"")
+
+
+def test_identical_payloads_are_stored_once(db):
+    first = store_payload(db, LONG_TEXT)
+    second = store_payload(db, LONG_TEXT)
+    other = store_payload(db, "a different answer")
+    db.commit()
+
+    assert first == second == payload_hash(LONG_TEXT)
+    assert other != first
+    assert db.query(RunPayload).count() == 2
+    payload = db.get(RunPayload, first)
+    assert payload.codec == run_payloads.RUN_PAYLOAD_CODEC
+    assert payload.size == len(LONG_TEXT.encode("utf-8"))
+    assert payload.text == LONG_TEXT
+
+
+def test_stored_rows_keep_the_codec_they_were_written_with(db, monkeypatch):
+    monkeypatch.setattr(run_payloads, "RUN_PAYLOAD_CODEC", "gzip")
+    gzip_hash = store_payload(db, LONG_TEXT)
+    monkeypatch.setattr(run_payloads, "RUN_PAYLOAD_CODEC", "zstd")
+    # Same content under the new codec: the stored gzip row stays
+    store_payload(db, LONG_TEXT)
+    zstd_hash = store_payload(db, LONG_TEXT + " Chapter two.")
+    db.commit()
+
+    assert db.get(RunPayload, gzip_hash).codec == "gzip"
+    assert db.get(RunPayload, zstd_hash).codec == "zstd"
+    assert db.get(RunPayload, gzip_hash).text == LONG_TEXT
+
+
+def test_async_store_deduplicates_too(db):
+    async def store_twice():
+        try:
+            async with database.async_session() as session:
+                hashes = [await astore_payload(session, LONG_TEXT) for _ in range(2)]
+                await session.commit()
+                return hashes
+        finally:
+            await database.get_async_engine().dispose()
+
+    first, second = asyncio.run(store_twice())
+
+    assert first == second
+    assert db.query(RunPayload).count() == 1
@@ -0,0 +1,54 @@
+import asyncio
+import uuid
+from collections import Counter
+
+import database
+from models.workflow import RunJob
+from functions import run_queue
+from functions.run_queue import claim_next_job, enqueue_run
+
+
+async def _enqueue(workflow_ids, jobs_per_workflow: int):
+    async with database.async_session() as db:
+        for workflow_id in workflow_ids:
+            for index in range(jobs_per_workflow):
+                await enqueue_run(db, workflow_id, uuid.uuid4(), f"input {index}")
+
+
+async def _claim_concurrently(workers: int):
+    async def claim(index: int):
+        async with database.async_session() as db:
+            return await claim_next_job(db, f"worker-{index}")
+
+    try:
+        return await asyncio.gather(*(claim(index) for index in range(workers)))
+    finally:
+        await database.get_async_engine().dispose()
+
+
+def test_concurrent_workers_never_claim_the_same_job(db, monkeypatch):
+    monkeypatch.setattr(run_queue, "RUN_QUEUE_PER_WORKFLOW_LIMIT", 100)
+    workflow_ids = [uuid.uuid4() for _ in range(3)]
+    asyncio.run(_enqueue(workflow_ids, jobs_per_workflow=4))
+
+    claimed = [job for job in asyncio.run(_claim_concurrently(workers=8)) if job is not None]
+
+    assert len({job.id for job in claimed}) == len(claimed)
+    processing = db.query(RunJob).filter(RunJob.status == "processing").all()
+    assert sorted(job.id for job in processing) == sorted(job.id for job in claimed)
+    assert all(job.attempts == 1 for job in processing)
+    assert {job.worker_id for job in processing} == {job.worker_id for job in claimed}
+
+
+def test_concurrent_workers_respect_the_per_workflow_limit(db, monkeypatch):
+    monkeypatch.setattr(run_queue, "RUN_QUEUE_PER_WORKFLOW_LIMIT", 2)
+    workflow_ids = [uuid.uuid4() for _ in range(2)]
+    asyncio.run(_enqueue(workflow_ids, jobs_per_workflow=5))
+
+    claimed = [job for job in asyncio.run(_claim_concurrently(workers=8)) if job is not None]
+
+    assert len({job.id for job in claimed}) == len(claimed) == 4
+    per_workflow = Counter(
+        job.workflow_id for job in db.query(RunJob).filter(RunJob.status == "processing")
+    )
+    assert per_workflow == {workflow_id: 2 for workflow_id in workflow_ids}
@@ -0,0 +1,92 @@
+import gzip
+import json
+import os
+import uuid
+from datetime import datetime
+
+from models.workflow import Workflow, WorkflowEntity, WorkflowRun, RunStep, RunArchive
+from functions.run_payloads import store_payload
+from functions.run_retention import archive_month, rehydrate_run, run_retention_pass
+
+OLD_MONTH = datetime(2020, 1, 1)
+
+
+def _seed_runs(db, count: int = 3):
+    workflow = Workflow(name="Archive", type="story", project_id=uuid.uuid4())
+    db.add(workflow)
+    db.flush()
+    entity = WorkflowEntity(external_id="n1", type="lead", workflow_id=workflow.id)
+    db.add(entity)
+    db.flush()
+    run_ids = []
+    for index in range(count):
+        created_at = datetime(2020, 1, 10 + index)
+        run = WorkflowRun(workflow_id=workflow.id, status="completed", total_steps=1, completed_steps=1, created_at=created_at)
+        db.add(run)
+        db.flush()
+        db.add(RunStep(
+            run_id=run.id,
+            entity_id=entity.id,
+            run_created_at=created_at,
+            input_hash=store_payload(db, f"input {index}"),
+            output_hash=store_payload(db, f"output {index}"),
+            status="completed",
+        ))
+        run_ids.append(run.id)
+    db.commit()
+    return run_ids
+
+
+def _archived_ids(archive_dir: str) -> list:
+    ids = []
+    for name in os.listdir(archive_dir):
+        with gzip.open(os.path.join(archive_dir, name), "rt", encoding="utf-8") as archive:
+            ids.extend(json.loads(line)["run"]["id"] for line in archive)
+    return ids
+
+
+def test_archive_rehydrate_rearchive_keeps_every_run(db, tmp_path):
+    run_ids = _seed_runs(db)
+    archive_dir = str(tmp_path)
+
+    assert archive_month(db, OLD_MONTH, archive_dir) == 3
+    assert db.get(WorkflowRun, run_ids[0]) is None
+
+    rehydrated = rehydrate_run(db, run_ids[0])
+    assert rehydrated.steps[0].output_text == "output 0"
+    db.expunge_all()
+
+    # The next pass must neither archive the re-hydrated copy again nor touch the month file
+    assert run_retention_pass(retention_months=6, archive_dir=archive_dir) == 0
+    assert db.get(WorkflowRun, run_ids[0]) is not None
+    assert sorted(_archived_ids(archive_dir)) == sorted(str(run_id) for run_id in run_ids)
+
+    db.expunge_all()
+    other = rehydrate_run(db, run_ids[1])
+    assert other.steps[0].input_text == "input 1"
+
+
+def test_rearchiving_a_month_writes_a_new_file(db, tmp_path):
+    run_ids = _seed_runs(db, count=2)
+    archive_dir = str(tmp_path)
+    archive_month(db, OLD_MONTH, archive_dir)
+    first_files = set(os.listdir(archive_dir))
+
+    # A run of that month arriving late (e.g. a requeued job) is archived next to the first file
+    late = WorkflowRun(
+        workflow_id=db.get(RunArchive, run_ids[0]).workflow_id, status="completed", created_at=datetime(2020, 1, 30)
+    )
+    db.add(late)
+    db.commit()
+    assert archive_month(db, OLD_MONTH, archive_dir) == 1
+
+    assert first_files < set(os.listdir(archive_dir))
+    assert len(_archived_ids(archive_dir)) == 3
+    db.expunge_all()
+    assert rehydrate_run(db, run_ids[0]) is not None
+    assert rehydrate_run(db, late.id) is not None
+
+
+def test_archiving_a_month_without_runs_leaves_no_file(db, tmp_path):
+    assert archive_month(db, OLD_MONTH, str(tmp_path)) == 0
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,97 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from main import app
+from functions import sse
+from functions.sse_bus import InMemoryEventBus
+
+
+def test_subscribing_an_unknown_client_is_rejected():
+    client = TestClient(app, headers={"X-From-Gateway": "true"})
+
+    for action in ("subscribe", "unsubscribe"):
+        response = client.post(f"/sse/ghost/{action}", json={"run_ids": ["9b2f8a52-46a8-4c39-9a4c-3f7d8b6a1e10"]})
+        assert response.status_code == 404
+
+    assert "ghost" not in sse.CLIENT_TOPICS
+    assert not any("ghost" in clients for clients in sse.SUBSCRIPTIONS.values())
+
+
+def test_thread_publishes_reach_other_workers_without_local_clients(monkeypatch):
+    hub = []
+    monkeypatch.setattr(sse, "event_bus", InMemoryEventBus(hub))
+    other_worker = InMemoryEventBus(hub)
+    received = []
+
+    async def publish_from_a_thread():
+        await sse.start_event_delivery()
+        await other_worker.start(lambda topics, message: received.append((topics, message)))
+        try:
+            assert not sse.CONNECTIONS
+            await asyncio.to_thread(sse.publish_event_threadsafe, ["run:1"], "node-completed", {"run_id": "1"})
+            await asyncio.sleep(0)
+        finally:
+            await other_worker.stop()
+            await sse.stop_event_delivery()
+
+    asyncio.run(publish_from_a_thread())
+
+    assert received == [(["run:1"], {"event": "node-completed", "data": {"run_id": "1"}})]
+
+
+def test_subscription_change_reaches_the_worker_holding_the_client(monkeypatch):
+    hub = []
+    monkeypatch.setattr(sse, "event_bus", InMemoryEventBus(hub))
+    other_worker = InMemoryEventBus(hub)
+
+    def holds_remote_client(topics, message):
+        # The other worker has "remote" connected and confirms the change
+        if message.get("control") == "subscription" and message["client_id"] == "remote":
+            other_worker.publish(None, {
+                "control": "subscription-applied", "request_id": message["request_id"], "topics": message["topics"]
+            })
+
+    async def change():
+        await sse.start_event_delivery()
+        await other_worker.start(holds_remote_client)
+        try:
+            return (
+                await sse.change_subscription("remote", ["run:1"]),
+                await sse.change_subscription("nobody", ["run:1"]),
+            )
+        finally:
+            await other_worker.stop()
+            await sse.stop_event_delivery()
+
+    monkeypatch.setattr(sse, "SSE_SUBSCRIPTION_TIMEOUT", 0.1)
+    remote, nobody = asyncio.run(change())
+
+    assert remote == ["run:1"]
+    assert nobody is None
+    assert "remote" not in sse.CLIENT_TOPICS and "nobody" not in sse.CLIENT_TOPICS
+
+
+def test_worker_applies_bus_subscription_changes_to_its_clients(monkeypatch):
+    hub = []
+    monkeypatch.setattr(sse, "event_bus", InMemoryEventBus(hub))
+    requester = InMemoryEventBus(hub)
+    answers = []
+
+    async def receive_change():
+        await sse.start_event_delivery()
+        await requester.start(lambda topics, message: answers.append(message))
+        await sse.add_client("local")
+        try:
+            requester.publish(None, {
+                "control": "subscription", "request_id": "r1", "client_id": "local",
+                "topics": ["workflow:7"], "subscribed": True,
+            })
+            return sorted(sse.CLIENT_TOPICS.get("local", ()))
+        finally:
+            sse.remove_client("local")
+            await requester.stop()
+            await sse.stop_event_delivery()
+
+    assert asyncio.run(receive_change()) == ["workflow:7"]
+    assert answers == [{"control": "subscription-applied", "request_id": "r1", "topics": ["workflow:7"]}]
@@ -0,0 +1,92 @@
+import asyncio
+import json
+
+import pytest
+
+from functions.sse_bus import EventBus, PostgresEventBus
+
+
+class FakePool:
+    """Stands in for the asyncpg pool: records NOTIFY payloads and serves spilled events"""
+
+    def __init__(self, fail_notify_after=None, spill_delay=0.0):
+        self.notified = []
+        self.spilled = {}
+        self.fail_notify_after = fail_notify_after
+        self.spill_delay = spill_delay
+
+    async def execute(self, query, channel, payload):
+        if self.fail_notify_after is not None and len(self.notified) >= self.fail_notify_after:
+            raise ConnectionError("connection lost")
+        self.notified.append(payload)
+
+    async def fetchval(self, query, value):
+        if query.startswith("INSERT"):
+            spill_id = len(self.spilled) + 1
+            self.spilled[spill_id] = value
+            return spill_id
+        await asyncio.sleep(self.spill_delay)
+        return self.spilled.get(value)
+
+
+def _bus(pool, delivered=None):
+    bus = PostgresEventBus("postgresql://unused")
+    bus._pool = pool
+    bus._flush_needed = asyncio.Event()
+    bus._inbox = asyncio.Queue()
+    bus._deliver = (lambda topics, message: delivered.append(message["data"])) if delivered is not None else (lambda *_: None)
+    return bus
+
+
+def _event(data, size=0):
+    return {"event": "node-completed", "data": data, "padding": "x" * size}
+
+
+def test_event_bus_requires_publish():
+    with pytest.raises(TypeError):
+        EventBus()
+
+
+def test_failed_flush_puts_unsent_events_back_in_order(monkeypatch):
+    monkeypatch.setattr("functions.sse_bus.SSE_BUS_MAX_PAYLOAD", 300)
+
+    async def scenario():
+        pool = FakePool(fail_notify_after=1)
+        bus = _bus(pool)
+        for index in range(4):
+            bus.publish(None, _event(index, size=50))
+        with pytest.raises(ConnectionError):
+            await bus._flush()
+        bus.publish(None, _event("later"))
+        return pool, bus
+
+    pool, bus = asyncio.run(scenario())
+
+    sent = [event["m"]["data"] for event in json.loads(pool.notified[0])["e"]]
+    assert sent == [0, 1]
+    assert [event["m"]["data"] for event in bus._buffer] == [2, 3, "later"]
+
+
+def test_spilled_events_keep_their_place(monkeypatch):
+    monkeypatch.setattr("functions.sse_bus.SSE_BUS_MAX_PAYLOAD", 300)
+
+    async def scenario():
+        pool = FakePool(spill_delay=0.05)
+        sender = _bus(pool)
+        sender.publish(None, _event("large", size=500))
+        sender.publish(None, _event("small"))
+        await sender._flush()
+        sender.publish(None, _event("next batch"))
+        await sender._flush()
+
+        delivered = []
+        receiver = _bus(pool, delivered)
+        receive = asyncio.create_task(receiver._receive_loop())
+        for payload in pool.notified:
+            receiver._on_notify(None, None, "workflow_sse", payload)
+        while not receiver._inbox.empty() or len(delivered) < 3:
+            await asyncio.sleep(0.01)
+        receive.cancel()
+        return delivered
+
+    assert asyncio.run(scenario()) == ["large", "small", "next batch"]
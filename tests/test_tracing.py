@@ -0,0 +1,43 @@
+import os
+import uuid
+
+from functions import tracing
+from functions.tracing import load_exported_spans, run_trace_id, span, trace_run, tracer
+
+
+def _export_run(name: str) -> uuid.UUID:
+    run_id = uuid.uuid4()
+    with trace_run(name, run_id):
+        with span(f"{name}.step"):
+            pass
+    tracer.export()
+    return run_id
+
+
+def test_export_file_rotates_and_old_runs_stay_readable(tmp_path, monkeypatch):
+    path = str(tmp_path / "spans.jsonl")
+    monkeypatch.setattr(tracing, "TRACE_EXPORT_PATH", path)
+    monkeypatch.setattr(tracing, "TRACE_OTLP_ENDPOINT", "")
+    monkeypatch.setattr(tracing, "TRACE_EXPORT_MAX_BYTES", 1)
+    monkeypatch.setattr(tracing, "TRACE_EXPORT_BACKUPS", 2)
+
+    run_ids = [_export_run(f"run{index}") for index in range(4)]
+
+    # Every export found a full file: the current one plus two rotated copies are kept
+    assert sorted(os.listdir(tmp_path)) == ["spans.jsonl", "spans.jsonl.1", "spans.jsonl.2"]
+    assert load_exported_spans(run_trace_id(run_ids[0]), path) is None
+    for run_id in run_ids[1:]:
+        names = {item["name"] for item in load_exported_spans(run_trace_id(run_id), path)}
+        assert len(names) == 2
+
+
+def test_export_file_below_the_limit_is_appended(tmp_path, monkeypatch):
+    path = str(tmp_path / "spans.jsonl")
+    monkeypatch.setattr(tracing, "TRACE_EXPORT_PATH", path)
+    monkeypatch.setattr(tracing, "TRACE_OTLP_ENDPOINT", "")
+
+    first, second = _export_run("first"), _export_run("second")
+
+    assert os.listdir(tmp_path) == ["spans.jsonl"]
+    assert load_exported_spans(run_trace_id(first), path)
+    assert load_exported_spans(run_trace_id(second), path)
@@ -0,0 +1,143 @@
+import threading
+import time
+import uuid
+
+import pytest
+from agno.run.response import RunEvent, RunResponse
+
+from models.workflow import Workflow, WorkflowEntity, WorkflowRun, RunStep, workflow_connections
+from functions import agent_team, context_budget, wf_agents
+from functions.execution_plan import execution_plan_cache
+
+
+class FakeAgent:
+    """Streams one chunk per `delay` seconds; a failing agent raises on its first chunk"""
+
+    def __init__(self, name: str, chunks: int = 3, delay: float = 0.0, fail: bool = False):
+        self.name = name
+        self.chunks = chunks
+        self.delay = delay
+        self.fail = fail
+        self.sent = 0
+        self.closed = threading.Event()
+
+    def run(self, input_text, stream=False):
+        if not stream:
+            return RunResponse(content=f"{self.name} answer")
+        return self._stream()
+
+    def _stream(self):
+        try:
+            for index in range(self.chunks):
+                time.sleep(self.delay)
+                if self.fail:
+                    raise RuntimeError(f"{self.name} model error")
+                self.sent += 1
+                yield RunResponse(content=f"{self.name}:{index} ", event=RunEvent.run_response.value)
+        finally:
+            self.closed.set()
+
+
+def _seed_workflow(db, names, edges, data=None):
+    workflow = Workflow(name="Branches", type="story", project_id=uuid.uuid4())
+    db.add(workflow)
+    db.flush()
+    entities = {}
+    for order, name in enumerate(names):
+        entity = WorkflowEntity(
+            external_id=name, type="lead", label=name, prompt=name, order=order, workflow_id=workflow.id,
+            data=(data or {}).get(name)
+        )
+        db.add(entity)
+        entities[name] = entity
+    db.flush()
+    for source, target in edges:
+        db.execute(workflow_connections.insert().values(
+            id=uuid.uuid4(), source_id=entities[source].id, target_id=entities[target].id, workflow_id=workflow.id
+        ))
+    db.commit()
+    return workflow, entities
+
+
+@pytest.fixture
+def fake_agents(monkeypatch):
+    agents = {}
+    monkeypatch.setattr(wf_agents, "_agent_factory", lambda node_call: lambda: agents[node_call["agent_params"]["name"]])
+    return agents
+
+
+def test_failing_branch_stops_its_slow_sibling(db, fake_agents):
+    workflow, _ = _seed_workflow(db, ["start", "fails", "slow"], [("start", "fails"), ("start", "slow")])
+    fake_agents["start"] = FakeAgent("start", chunks=1)
+    fake_agents["fails"] = FakeAgent("fails", delay=0.3, fail=True)
+    slow = fake_agents["slow"] = FakeAgent("slow", chunks=100, delay=0.05)
+    run_id = uuid.uuid4()
+
+    started = time.monotonic()
+    with pytest.raises(RuntimeError, match="fails model error"):
+        wf_agents.process_workflow_with_chain(db, workflow.id, "story", run_id)
+
+    # The sibling was stopped and awaited before the failure was recorded
+    assert slow.closed.is_set()
+    assert 0 < slow.sent < 100
+    assert time.monotonic() - started < 2
+    sent_at_failure = slow.sent
+    time.sleep(0.2)
+    assert slow.sent == sent_at_failure
+
+    db.expire_all()
+    assert db.get(WorkflowRun, run_id).status == "failed"
+    statuses = {step.entity_id: step.status for step in db.query(RunStep).filter(RunStep.run_id == run_id)}
+    assert sorted(statuses.values()) == ["completed", "failed", "failed"]
+
+
+def test_final_flush_failure_does_not_fail_a_completed_run(db, fake_agents, monkeypatch):
+    workflow, _ = _seed_workflow(db, ["first", "second"], [("first", "second")])
+    fake_agents["first"] = FakeAgent("first", chunks=1)
+    fake_agents["second"] = FakeAgent("second", chunks=1)
+    run_id = uuid.uuid4()
+
+    def database_down(snapshot):
+        raise ConnectionError("database unavailable")
+
+    monkeypatch.setattr(wf_agents.run_recorder, "_write", database_down)
+    assert wf_agents.process_workflow_with_chain(db, workflow.id, "story", run_id) == "second:0 "
+    assert wf_agents.run_recorder.run_state(run_id)["status"] == "completed"
+
+    # The completed state stayed dirty and reaches the database with the next interval flush
+    monkeypatch.undo()
+    assert wf_agents.run_recorder.flush() > 0
+    db.expire_all()
+    assert db.get(WorkflowRun, run_id).status == "completed"
+
+
+def test_steps_record_their_token_counts(db, fake_agents, monkeypatch):
+    monkeypatch.setattr(context_budget, "_encoding", False)
+    workflow, entities = _seed_workflow(
+        db, ["writer", "editor"], [("writer", "editor")], data={"editor": {"context": {"max_tokens": 5}}}
+    )
+    # Four chunks of 40 characters, about 10 tokens each
+    fake_agents["writer"] = FakeAgent("w" * 37, chunks=4)
+    fake_agents["editor"] = FakeAgent("editor", chunks=1)
+    run_id = uuid.uuid4()
+
+    wf_agents.process_workflow_with_chain(db, workflow.id, "a story about tokens", run_id)
+
+    db.expire_all()
+    steps = {step.entity_id: step for step in db.query(RunStep).filter(RunStep.run_id == run_id)}
+    writer, editor = steps[entities["writer"].id], steps[entities["editor"].id]
+    assert (writer.input_tokens, writer.context_tokens, writer.output_tokens) == (5, 5, 40)
+    # The editor was given its budget of the writer's output
+    assert (editor.input_tokens, editor.context_tokens, editor.output_tokens) == (40, 5, 3)
+
+
+def test_node_agents_run_without_history_or_session_storage(db, monkeypatch):
+    monkeypatch.setattr(agent_team, "get_groq_model", lambda: None)
+    workflow, entities = _seed_workflow(db, ["writer"], [])
+    node = execution_plan_cache.get(db, workflow.id).nodes[entities["writer"].id]
+
+    node_call = wf_agents._prepare_node_call(node, uuid.uuid4(), [], "a story")
+    agent = wf_agents._agent_factory(node_call)()
+
+    assert agent.add_history_to_messages is False
+    assert agent.storage is None
@@ -0,0 +1,90 @@
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from functions.workflow_graph import WorkflowCycleError, WorkflowGraph, build_graph
+
+
+def _entities(*names, labels=None):
+    """Stand-ins for WorkflowEntity rows, already sorted by order"""
+    labels = labels or {}
+    return [
+        SimpleNamespace(id=uuid.uuid4(), external_id=name, type="lead", label=labels.get(name, name.title()))
+        for name in names
+    ]
+
+
+def _graph(names, edges, labels=None):
+    entities = _entities(*names, labels=labels)
+    ids = {entity.external_id: entity.id for entity in entities}
+    graph = build_graph(entities, [(ids[source], ids[target]) for source, target in edges])
+    return graph, ids
+
+
+def _names(graph, ids, entity_ids):
+    names = {entity_id: name for name, entity_id in ids.items()}
+    return [names[entity_id] for entity_id in entity_ids]
+
+
+def test_levels_group_nodes_that_can_run_together():
+    # Edges arrive in any order; levels and parents follow the entity order
+    graph, ids = _graph("abcd", [("c", "d"), ("b", "d"), ("a", "c"), ("a", "b")])
+
+    assert [_names(graph, ids, level) for level in graph.levels] == [["a"], ["b", "c"], ["d"]]
+    assert _names(graph, ids, graph.order) == ["a", "b", "c", "d"]
+    assert _names(graph, ids, graph.parents[ids["d"]]) == ["b", "c"]
+    assert _names(graph, ids, graph.sinks) == ["d"]
+
+
+def test_uneven_branches_join_once_both_finished():
+    graph, ids = _graph("abcd", [("a", "b"), ("b", "c"), ("a", "d"), ("c", "d")])
+
+    assert [_names(graph, ids, level) for level in graph.levels] == [["a"], ["b"], ["c"], ["d"]]
+    outputs = {ids["a"]: "A", ids["b"]: "B"}
+    assert not graph.is_ready(ids["d"], outputs)
+    outputs[ids["c"]] = "C"
+    assert graph.is_ready(ids["d"], outputs)
+
+
+def test_workflows_without_connections_run_as_a_chain():
+    graph, ids = _graph("abc", [])
+
+    assert [_names(graph, ids, level) for level in graph.levels] == [["a"], ["b"], ["c"]]
+    assert _names(graph, ids, graph.sinks) == ["c"]
+
+
+def test_dangling_and_repeated_connections_are_ignored():
+    entities = _entities("a", "b")
+    a, b = (entity.id for entity in entities)
+
+    graph = WorkflowGraph(entities, [(a, b), (a, b), (a, uuid.uuid4())])
+
+    assert graph.children[a] == [b]
+    assert graph.parents[b] == [a]
+
+
+def test_cycles_name_the_entities_on_them():
+    with pytest.raises(WorkflowCycleError) as error:
+        _graph("abcd", [("a", "b"), ("b", "c"), ("c", "b"), ("c", "d")])
+
+    assert "b, c, d" in str(error.value)
+    assert "a" not in str(error.value).split(": ")[1]
+
+
+def test_node_inputs_merge_parent_outputs_under_their_labels():
+    graph, ids = _graph("abcd", [("a", "b"), ("a", "c"), ("c", "d"), ("b", "d")], labels={"c": None})
+    outputs = {ids["a"]: "outline", ids["b"]: "characters", ids["c"]: "setting"}
+
+    assert graph.node_input(ids["a"], outputs, "run input") == "run input"
+    # A single parent passes its output through unchanged
+    assert graph.node_input(ids["b"], outputs, "run input") == "outline"
+    # Entities without a label are headed by their type
+    assert graph.node_input(ids["d"], outputs, "run input") == "### B\ncharacters\n\n### Lead\nsetting"
+
+
+def test_the_run_output_merges_every_sink():
+    graph, ids = _graph("abc", [("a", "b"), ("a", "c")])
+    outputs = {ids["a"]: "outline", ids["b"]: "draft", ids["c"]: "summary"}
+
+    assert graph.merge_outputs(graph.sinks, outputs) == "### B\ndraft\n\n### C\nsummary"
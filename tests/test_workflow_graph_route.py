@@ -0,0 +1,95 @@
+import uuid
+
+from fastapi.testclient import TestClient
+
+from main import app
+from models.workflow import Workflow, WorkflowEntity, workflow_connections
+
+
+def _client():
+    return TestClient(app, headers={"X-From-Gateway": "true"})
+
+
+def _seed_workflow(db):
+    workflow = Workflow(name="Canvas", type="story", project_id=uuid.uuid4())
+    db.add(workflow)
+    db.commit()
+    return workflow.id
+
+
+def _node(external_id: str, order: int, prompt: str = None, connections=None) -> dict:
+    return {
+        "external_id": external_id,
+        "type": "lead",
+        "label": external_id,
+        "prompt": prompt or external_id,
+        "order": order,
+        "connections": connections,
+    }
+
+
+def _stored(db, workflow_id):
+    db.expire_all()
+    entities = {
+        entity.external_id: entity
+        for entity in db.query(WorkflowEntity).filter(WorkflowEntity.workflow_id == workflow_id)
+    }
+    names = {entity.id: external_id for external_id, entity in entities.items()}
+    edges = {
+        (names[row["source_id"]], names[row["target_id"]])
+        for row in db.execute(
+            workflow_connections.select().where(workflow_connections.c.workflow_id == workflow_id)
+        ).mappings()
+    }
+    return entities, edges
+
+
+def test_saving_a_graph_adds_updates_and_deletes_by_external_id(db):
+    workflow_id = _seed_workflow(db)
+    client = _client()
+    response = client.put(f"/{workflow_id}/graph", json={
+        "entities": [_node("a", 0, connections=[{"target_id": "b"}]), _node("b", 1), _node("c", 2)],
+        "connections": [{"source_id": "b", "target_id": "c"}],
+    })
+    assert response.status_code == 200
+    before, _ = _stored(db, workflow_id)
+
+    # b is edited, c removed, d added, and the connections move with them
+    response = client.put(f"/{workflow_id}/graph", json={
+        "entities": [_node("a", 0, connections=[{"target_id": "b"}]), _node("b", 1, prompt="edited"), _node("d", 2)],
+        "connections": [{"source_id": "b", "target_id": "d"}],
+    })
+    assert response.status_code == 200
+
+    after, edges = _stored(db, workflow_id)
+    assert sorted(after) == ["a", "b", "d"]
+    assert after["a"].id == before["a"].id
+    assert after["b"].id == before["b"].id
+    assert after["b"].prompt == "edited"
+    assert edges == {("a", "b"), ("b", "d")}
+    assert {entity["external_id"] for entity in response.json()["entities"]} == {"a", "b", "d"}
+
+
+def test_saving_a_cyclic_graph_is_rejected_and_changes_nothing(db):
+    workflow_id = _seed_workflow(db)
+    client = _client()
+    client.put(f"/{workflow_id}/graph", json={
+        "entities": [_node("a", 0, connections=[{"target_id": "b"}]), _node("b", 1)],
+    })
+    before, edges_before = _stored(db, workflow_id)
+
+    response = client.put(f"/{workflow_id}/graph", json={
+        "entities": [_node("a", 0, prompt="edited"), _node("b", 1), _node("c", 2)],
+        "connections": [
+            {"source_id": "a", "target_id": "b"},
+            {"source_id": "b", "target_id": "c"},
+            {"source_id": "c", "target_id": "a"},
+        ],
+    })
+
+    assert response.status_code == 422
+    assert "cycle" in response.json()["detail"]
+    after, edges_after = _stored(db, workflow_id)
+    assert sorted(after) == ["a", "b"]
+    assert after["a"].prompt == before["a"].prompt == "a"
+    assert edges_after == edges_before == {("a", "b")}